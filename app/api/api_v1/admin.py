@@ -0,0 +1,69 @@
+from fastapi import APIRouter, Depends, Query
+from typing import Optional
+
+from app.schemas.account import AccountSnapshot
+from app.core.security import get_current_admin_account
+from app.core.rate_limit import limit_by_account
+from app.core.configuration import Settings
+from app.utils.config_helper import get_settings
+from app.utils.profiling_helper import ProfileFormat, ProfileMode
+from app.controllers import admin as admin_controller
+
+
+router = APIRouter(
+    prefix="/api/v1/admin",
+    tags=['Admin'],
+    dependencies=[Depends(limit_by_account)],
+)
+
+
+@router.post("/config/reload", description="Reloads the application configuration and atomically swaps the active settings snapshot. A changed setting that only takes effect on a restart fails the reload with 409 and keeps the previous snapshot")
+async def reload_configuration(current_account: AccountSnapshot = Depends(get_current_admin_account)):
+    return await admin_controller.reload_config_ctrl(current_account=current_account)
+
+
+@router.get("/metrics/hashing", description="Returns queue wait and hash time metrics of the password hashing pool")
+async def get_hashing_metrics(current_account: AccountSnapshot = Depends(get_current_admin_account)):
+    return await admin_controller.get_hashing_metrics_ctrl()
+
+
+@router.get("/metrics/db-writer", description="Returns group commit batch size and commit time metrics of the database writer")
+async def get_db_writer_metrics(current_account: AccountSnapshot = Depends(get_current_admin_account)):
+    return await admin_controller.get_db_writer_metrics_ctrl()
+
+
+@router.get("/metrics/startup", description="Returns how long this worker took to import, load its configuration, migrate the schema and become ready")
+async def get_startup_metrics(current_account: AccountSnapshot = Depends(get_current_admin_account)):
+    return await admin_controller.get_startup_metrics_ctrl()
+
+
+@router.get("/metrics/response-cache", description="Returns hit, miss and invalidation counts of the task read response cache of this worker")
+async def get_response_cache_metrics(current_account: AccountSnapshot = Depends(get_current_admin_account)):
+    return await admin_controller.get_response_cache_metrics_ctrl()
+
+
+@router.get("/metrics/change-feed", description="Returns subscriber, delivery, overflow and resync counts of the task change feed of this worker")
+async def get_change_feed_metrics(current_account: AccountSnapshot = Depends(get_current_admin_account)):
+    return await admin_controller.get_change_feed_metrics_ctrl()
+
+
+@router.get("/metrics/event-loop", description="Returns how often and how long the event loop of this worker was blocked past the lag threshold")
+async def get_event_loop_metrics(current_account: AccountSnapshot = Depends(get_current_admin_account)):
+    return await admin_controller.get_event_loop_metrics_ctrl()
+
+
+@router.get("/metrics/rate-limit", description="Returns allowed and limited request counts and the bucket count of the rate limiter of this worker")
+async def get_rate_limit_metrics(current_account: AccountSnapshot = Depends(get_current_admin_account)):
+    return await admin_controller.get_rate_limit_metrics_ctrl()
+
+
+@router.get("/profile", description="Samples the stacks of every thread of this worker for the given number of seconds and returns them as collapsed stacks or speedscope JSON. Off unless profiling.enabled is set")
+async def get_profile(
+    seconds: float = Query(10, gt=0, description="How long to sample"),
+    interval_ms: Optional[float] = Query(None, ge=1, description="Time between samples, profiling.interval_ms by default"),
+    mode: ProfileMode = Query('wall', description="cpu leaves out threads parked on I/O or a queue"),
+    profile_format: ProfileFormat = Query('collapsed', alias='format'),
+    current_account: AccountSnapshot = Depends(get_current_admin_account),
+    config: Settings = Depends(get_settings)
+    ):
+    return await admin_controller.get_profile_ctrl(current_account=current_account, seconds=seconds, interval_ms=interval_ms, mode=mode, profile_format=profile_format, config=config)
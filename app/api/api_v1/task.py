@@ -1,68 +1,164 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response, Request, Query, Header
 
-from app.utils import init_db
-from app.utils.db_helper import get_db
-from app.models import task as model_task
+from app.utils.db_helper import get_read_db
 from app.schemas import task as schema_task
-from app.models.account import Account
-from app.utils.init_db import SessionLocal, engine
+from app.schemas.account import AccountSnapshot
 from app.core.security import get_current_active_account
+from app.core.rate_limit import limit_by_account
+from app.core.configuration import Settings
+from app.utils.config_helper import get_settings
+from app.utils.ndjson_helper import NDJSON_MEDIA_TYPE
+from app.utils.pagination_helper import get_page_limit
+from app.enums.task_enum import TaskSortEnum
 from app.controllers import task as task_controller
-from app.models import task
 
-from typing import List
+from typing import List, Optional, Literal
+from datetime import datetime
 
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 
 
-# Create task table if it does not exist
-task.Base.metadata.create_all(bind=engine)
-
 router = APIRouter(
     prefix="/api/v1/tasks",
     tags=['Task'],
+    dependencies=[Depends(limit_by_account)],
 )
 
 
 @router.post("/create/", response_model=schema_task.TaskInDB, response_model_exclude_none=True, description="Create new task for current account user")
-async def create_new_task(task: schema_task.TaskCreate, db: Session = Depends(get_db), current_account: Account = Depends(get_current_active_account)):
-    return await task_controller.create_task_ctrl(db=db, account_id=current_account.id, task=task)
+async def create_new_task(response: Response, task: schema_task.TaskCreate, current_account: AccountSnapshot = Depends(get_current_active_account)):
+    return await task_controller.create_task_ctrl(account_id=current_account.id, task=task, response=response)
 
 
-@router.get("/", response_model=List[schema_task.TaskInDB], response_model_exclude_none=True)
+@router.get("/", response_model=List[schema_task.TaskInDB], response_model_exclude_none=True, description="Get tasks of the current account, optionally filtered and sorted. Pass the X-Next-Cursor response header back as cursor to fetch the next page, and the ETag back as If-None-Match to get a 304 while no task changed")
 async def get_tasks(
     skip: int = 0,
-    limit: int = 20,
-    db: Session = Depends(get_db),
-    current_account: Account = Depends(get_current_active_account) 
+    limit: int = Depends(get_page_limit),
+    cursor: Optional[str] = None,
+    sort: TaskSortEnum = TaskSortEnum.id,
+    completed: Optional[bool] = None,
+    start_time_from: Optional[datetime] = None,
+    start_time_to: Optional[datetime] = None,
+    stop_time_from: Optional[datetime] = None,
+    stop_time_to: Optional[datetime] = None,
+    created_at_from: Optional[datetime] = None,
+    created_at_to: Optional[datetime] = None,
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_read_db),
+    current_account: AccountSnapshot = Depends(get_current_active_account) 
+    ):
+    task_filter = schema_task.TaskFilter(
+        completed=completed,
+        start_time_from=start_time_from,
+        start_time_to=start_time_to,
+        stop_time_from=stop_time_from,
+        stop_time_to=stop_time_to,
+        created_at_from=created_at_from,
+        created_at_to=created_at_to
+    )
+    return await task_controller.get_tasks_ctrl(db=db, account_id=current_account.id, skip=skip, limit=limit, cursor=cursor, task_filter=task_filter, sort=sort, if_none_match=if_none_match)
+
+
+@router.get("/search", response_model=List[schema_task.TaskInDB], response_model_exclude_none=True, description="Full-text search over the title and description of the current account's tasks, best matches first. Pass the X-Next-Cursor response header back as cursor to fetch the next page")
+async def search_tasks(
+    response: Response,
+    q: str = Query(..., min_length=1, description="Search terms, all of which must match. End a term with * for prefix matching"),
+    limit: int = Depends(get_page_limit),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db),
+    current_account: AccountSnapshot = Depends(get_current_active_account)
+    ):
+    return await task_controller.search_tasks_ctrl(db=db, account_id=current_account.id, query=q, limit=limit, cursor=cursor, response=response)
+
+
+@router.get("/export", description="Stream every task of the current account as NDJSON or CSV with constant memory")
+async def export_tasks(
+    export_format: Literal['ndjson', 'csv'] = Query('ndjson', alias='format'),
+    current_account: AccountSnapshot = Depends(get_current_active_account),
+    config: Settings = Depends(get_settings)
     ):
-    return await task_controller.get_tasks_ctrl(db=db, account_id=current_account.id, skip=skip, limit=limit)
+    return await task_controller.export_tasks_ctrl(account_id=current_account.id, export_format=export_format, config=config)
 
 
-@router.get("/{task_id}", response_model=schema_task.TaskInDB, response_model_exclude_none=True)
+@router.get("/changes", description="Feed of committed changes to the current account's tasks, as server-sent events or a long poll. Events carry the task collection version as seq, pass the last one back as after (or Last-Event-ID) to resume, a resync event means list the tasks again")
+async def get_task_changes(
+    mode: Literal['sse', 'poll'] = 'sse',
+    after: Optional[int] = Query(None, description="Only changes after this collection version"),
+    timeout: Optional[float] = Query(None, gt=0, description="Seconds a long poll waits for a change"),
+    last_event_id: Optional[int] = Header(None),
+    current_account: AccountSnapshot = Depends(get_current_active_account),
+    config: Settings = Depends(get_settings)
+    ):
+    return await task_controller.get_task_changes_ctrl(account_id=current_account.id, mode=mode, after=after if after is not None else last_event_id, timeout=timeout, config=config)
+
+
+@router.get("/{task_id}", response_model=schema_task.TaskInDB, response_model_exclude_none=True, description="Get a task of the current account. The ETag response header identifies its version, send it back as If-None-Match to get a 304 while the task is unchanged")
 async def get_task(
     task_id: int, 
-    db: Session = Depends(get_db),
-    current_account: Account = Depends(get_current_active_account) 
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_read_db),
+    current_account: AccountSnapshot = Depends(get_current_active_account) 
    ):
-    return await task_controller.get_task_ctrl(db=db, account_id=current_account.id, task_id=task_id)
+    return await task_controller.get_task_ctrl(db=db, account_id=current_account.id, task_id=task_id, if_none_match=if_none_match)
 
 
-@router.put("/update/{task_id}", response_model=schema_task.TaskInDB, response_model_exclude_none=True)
+@router.put("/update/{task_id}", response_model=schema_task.TaskInDB, response_model_exclude_none=True, description="Update a task of the current account. Send its ETag as If-Match to only update the version you read, a stale version fails with 412")
 async def update_existing_task(
     task_id: int,
     update: schema_task.TaskUpdate,
-    db: Session = Depends(get_db),
-    current_account: Account = Depends(get_current_active_account)
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    current_account: AccountSnapshot = Depends(get_current_active_account)
     ):
-    return await task_controller.update_task_ctrl(db=db, account_id=current_account.id, task_id=task_id, update=update)
+    return await task_controller.update_task_ctrl(account_id=current_account.id, task_id=task_id, update=update, response=response, if_match=if_match)
 
 
-@router.delete("/remove/{task_id}", response_model=schema_task.TaskInDB, response_model_exclude_none=True)
+@router.delete("/remove/{task_id}", response_model=schema_task.TaskInDB, response_model_exclude_none=True, description="Delete a task of the current account. Send its ETag as If-Match to only delete the version you read, a stale version fails with 412")
 async def delete_existing_task(
     task_id: int,
-    db: Session = Depends(get_db),
-    current_account: Account = Depends(get_current_active_account),   
+    if_match: Optional[str] = Header(None),
+    current_account: AccountSnapshot = Depends(get_current_active_account),   
    ):
-    return await task_controller.delete_task_ctrl(db=db, task_id=task_id, account_id=current_account.id)
+    return await task_controller.delete_task_ctrl(task_id=task_id, account_id=current_account.id, if_match=if_match)
+
+
+@router.post("/bulk/create", response_model=schema_task.BulkResult, description="Create a batch of tasks for current account user in a single transaction")
+async def create_tasks_in_bulk(
+    tasks: List[schema_task.TaskCreate],
+    current_account: AccountSnapshot = Depends(get_current_active_account),
+    config: Settings = Depends(get_settings)
+    ):
+    return await task_controller.create_tasks_ctrl(account_id=current_account.id, tasks=tasks, config=config)
+
+
+@router.post(
+    "/bulk/import",
+    response_model=schema_task.BulkResult,
+    description="Stream tasks as NDJSON, one task per line, and create them in a single transaction once the whole stream is read and validated",
+    openapi_extra={'requestBody': {'content': {NDJSON_MEDIA_TYPE: {'schema': {'type': 'string'}}}, 'required': True}}
+)
+async def import_tasks(
+    request: Request,
+    current_account: AccountSnapshot = Depends(get_current_active_account),
+    config: Settings = Depends(get_settings)
+    ):
+    return await task_controller.import_tasks_ctrl(account_id=current_account.id, request=request, config=config)
+
+
+@router.put("/bulk/update", response_model=schema_task.BulkResult, description="Update a batch of tasks of the current account user in a single transaction")
+async def update_tasks_in_bulk(
+    updates: List[schema_task.TaskBulkUpdate],
+    current_account: AccountSnapshot = Depends(get_current_active_account),
+    config: Settings = Depends(get_settings)
+    ):
+    return await task_controller.update_tasks_ctrl(account_id=current_account.id, updates=updates, config=config)
+
+
+@router.post("/bulk/remove", response_model=schema_task.BulkResult, description="Delete a batch of tasks of the current account user in a single transaction")
+async def delete_tasks_in_bulk(
+    delete: schema_task.TaskBulkDelete,
+    current_account: AccountSnapshot = Depends(get_current_active_account),
+    config: Settings = Depends(get_settings)
+    ):
+    return await task_controller.delete_tasks_ctrl(account_id=current_account.id, delete=delete, config=config)
@@ -0,0 +1,17 @@
+from fastapi import APIRouter, Depends, Header
+from fastapi.responses import PlainTextResponse
+from typing import Optional
+
+from app.core.configuration import Settings
+from app.utils.config_helper import get_settings
+from app.controllers import admin as admin_controller
+
+
+router = APIRouter(
+    tags=['Metrics'],
+)
+
+
+@router.get("/metrics", response_class=PlainTextResponse, description="Returns the request, database query and subsystem metrics of this worker in the Prometheus text format. With metrics.scrape_token set, send it as a bearer token")
+async def get_metrics(authorization: Optional[str] = Header(None), config: Settings = Depends(get_settings)):
+    return await admin_controller.get_prometheus_metrics_ctrl(authorization=authorization, config=config)
@@ -0,0 +1,17 @@
+from fastapi import APIRouter, Depends, Header
+from typing import Optional
+
+from app.core.configuration import Settings
+from app.utils.config_helper import get_settings
+from app.controllers import account as account_controller
+
+
+router = APIRouter(
+    prefix="/.well-known",
+    tags=['Keys'],
+)
+
+
+@router.get("/jwks.json", description="Returns the public keys of the access tokens as a JSON Web Key Set, so other services can verify them without calling back. Send the ETag back as If-None-Match to get a 304 while the keys are unchanged")
+async def get_jwks(if_none_match: Optional[str] = Header(None), config: Settings = Depends(get_settings)):
+    return await account_controller.get_jwks_ctrl(if_none_match=if_none_match, config=config)
@@ -1,86 +1,93 @@
-from sqlalchemy.orm import Session
-from fastapi import HTTPException, status, Header
-from fastapi.responses import ORJSONResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import HTTPException, Response, status, Header
+from typing import Optional
+from app.utils.serialization_helper import ORJSONResponse
+from app.utils.etag_helper import ETAG_HEADER, etag_matches
 
 from app import models, schemas
 from app.utils.logging_helper import logger
 from app.core import security
 from app.core.security import get_password_hash
-from app.enums.account_enum import AccountRoleEnum
+from app.core.keyring import get_keyring
+from app.utils.db_writer_helper import submit_write
 
-from omegaconf import DictConfig
+from app.core.configuration import Settings
 
 
-async def create_account_ctr(db: Session, account: schemas.account.AccountCreate) -> models.account.Account:
+async def create_account_ctr(db: AsyncSession, account: schemas.account.AccountCreate) -> models.account.Account:
     # Check if account exits
-    logger.info(f"Checking if account with email: {account.email} exists.")
+    logger.info("Checking if account with email: %s exists.", account.email)
     account_exist = await schemas.account.Account.get_account_by_email(db=db, email=account.email)
     if account_exist:
-        logger.warning(f"Account registration failed due to email: {account.email} already registered.")
+        logger.warning("Account registration failed due to email: %s already registered.", account.email)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f'Account with email: {account.email} already registered'
         )
 
     # Check if username is taken
-    logger.info(f"Checking if username: {account.username} is taken")
+    logger.info("Checking if username: %s is taken", account.username)
     username_exists = await schemas.account.Account.get_account_by_username(db=db, username=account.username)
     if username_exists:
-        logger.warning(f"Account with username: {account.username} already registered")
+        logger.warning("Account with username: %s already registered", account.username)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Account with username: {account.username} already registered"
         )
 
     # Hash plain password
-    hashed_password = get_password_hash(account.password.get_secret_value())
+    hashed_password = await get_password_hash(account.password.get_secret_value())
         
     # Register new account
-    new_account = await schemas.account.Account.create_account(db=db, account=account, hashed_password=hashed_password)
-    logger.info(f"Account with email: {new_account.email} created successfully")
+    new_account = await submit_write(lambda write_db: schemas.account.Account.create_account(db=write_db, account=account, hashed_password=hashed_password))
+    logger.info("Account with email: %s created successfully", new_account.email)
     return new_account
 
 
-async def login_for_access_token_ctr(db: Session, credentials: schemas.account.AccountLogin, config: DictConfig) -> schemas.token.Token:
+def get_account_data(db_account: models.account.Account) -> dict:
+    return {
+        'first_name': db_account.first_name,
+        'last_name': db_account.last_name,
+        'id': db_account.id,
+        'username': db_account.username,
+        'email': db_account.email,
+        'role': db_account.role,
+        'avatar': str(db_account.avatar)
+    }
+
+
+def account_already_active(email: str) -> HTTPException:
+    logger.warning("Account: %s already logged in", email)
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail=f"Account: {email} already active"
+    )
+
+
+async def login_for_access_token_ctr(db: AsyncSession, credentials: schemas.account.AccountLogin, config: Settings) -> schemas.token.Token:
     # Validate credentials
-    logger.info(f"Validating credentials for account with email: {credentials.email}")
+    logger.info("Validating credentials for account with email: %s", credentials.email)
     account_exist = await security.authenticate_account(db=db, credentials=credentials)
     
     # Check if account is logged in
-    logger.info(f"Checking if account: {credentials.email} is logged in")
+    logger.info("Checking if account: %s is logged in", credentials.email)
     if account_exist.is_active:
-        logger.warn(f"Account: {credentials.email} already logged in")
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Account: {credentials.email} already active"
-        )
+        raise account_already_active(credentials.email)
 
-    # Extract account data
-    account_data = {
-            'first_name': account_exist.first_name,
-            'last_name': account_exist.last_name,
-            'id': account_exist.id,
-            'username': account_exist.username,
-            'email': account_exist.email,
-            'role': account_exist.role,
-            'avatar': str(account_exist.avatar)
-        }
+    # Activate the account and promote a guest to user in one statement. It only matches an
+    # inactive account, so a concurrent login of the same account cannot slip through.
+    logged_in_account = await submit_write(lambda write_db: schemas.account.Account.login_account(db=write_db, account_id=account_exist.id))
+    if logged_in_account is None:
+        raise account_already_active(credentials.email)
 
     # Generate access and refresh tokens
-    logger.info(f"Generating access and refresh tokens for account with id: {account_exist.id}")
+    logger.info("Generating access and refresh tokens for account with id: %s", logged_in_account.id)
+    account_data = get_account_data(logged_in_account)
     access_token, refresh_token = security.get_access_and_refresh_tokens(
         config=config,
         account_data=account_data
     )
     
-    # Update account active status
-    await schemas.account.Account.activate_account(db=db, account_id=account_exist.id)
-
-    # Update account role
-    logger.info(AccountRoleEnum.user.value)
-    await schemas.account.Account.update_account(db=db, account_id=account_exist.id, update={'role': AccountRoleEnum.user.value})
-    
-    logger.info(await schemas.account.Account.get_acccount_by_id(db=db, account_id=account_exist.id))
     return schemas.token.Token(
         refresh_token=refresh_token,
         access_token=access_token,
@@ -92,20 +99,20 @@ async def login_for_access_token_ctr(db: Session, credentials: schemas.account.A
     ).model_dump()
 
 
-async def logout_account_ctrl(db: Session, current_account: models.account.Account) -> None:
-    await schemas.account.Account.deactivate_account(db=db, account_id=current_account.id)
+async def logout_account_ctrl(current_account: schemas.account.AccountSnapshot) -> None:
+    await submit_write(lambda db: schemas.account.Account.deactivate_account(db=db, account_id=current_account.id))
     return ORJSONResponse(
         content="Logout successful"
     )
 
 
-async def renew_access_token_ctrl(db: Session, x_refresh_token: str, config: DictConfig):
+async def renew_access_token_ctrl(db: AsyncSession, x_refresh_token: str, config: Settings):
     # Verify refresh token
     logger.info("Verifying refresh token")
     payload = security.verify_token(token=x_refresh_token, secret=config.app.refresh_token_secret, config=config)
     if not payload:
         # Invalid token
-        logger.warning(f"Failed to decode token")
+        logger.warning("Failed to decode token")
         
         raise HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -117,20 +124,19 @@ async def renew_access_token_ctrl(db: Session, x_refresh_token: str, config: Dic
     logger.info("Extracting account id from payload")
     account_id = payload.get('id')
     account_exist = await schemas.account.Account.get_acccount_by_id(db=db, account_id=account_id)
+    if account_exist is None or not account_exist.is_active:
+        logger.warning("Refresh token presented for missing or inactive account: %s", account_id)
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     
     # Extract account data
-    account_data = {
-            'first_name': account_exist.first_name,
-            'last_name': account_exist.last_name,
-            'id': account_exist.id,
-            'username': account_exist.username,
-            'email': account_exist.email,
-            'role': account_exist.role,
-            'avatar': account_exist.avatar
-        }
+    account_data = get_account_data(account_exist)
 
     # Generate access and refresh tokens
-    logger.info(f"Generating access and refresh tokens for account with id: {account_exist.id}")
+    logger.info("Generating access and refresh tokens for account with id: %s", account_exist.id)
     access_token, refresh_token = security.get_access_and_refresh_tokens(
         config=config,
         account_data=account_data
@@ -149,8 +155,7 @@ async def renew_access_token_ctrl(db: Session, x_refresh_token: str, config: Dic
 
 async def update_me_ctrl(
     update: schemas.account.AccountUpdate,
-    db: Session,
-    current_account: models.account.Account
+    current_account: schemas.account.AccountSnapshot
 ) -> models.account.Account:
     # Check if password is to be updated
     logger.info("Checking if password would be updated")
@@ -158,26 +163,42 @@ async def update_me_ctrl(
     update_dict = {}
     if update.password:
         # Deserialize update object to dict
-        update_dict = update.model_dump(exclude_none=True)   
+        update_dict = update.model_dump(exclude_none=True, exclude={'password'})   
 
         logger.info("Hashing plain passwor")
-        hashed_password = hash_password(update.password.get_secret_value())
-        update_dict.update({"hashed_password": hashed_password})
+        hashed_password = await get_password_hash(update.password.get_secret_value())
 
-        return await schemas.account.Account.update_account(db=db, account_id=current_account.id, update=update_dict, hashed_password=hashed_password)
+        return await submit_write(lambda db: schemas.account.Account.update_account(db=db, account_id=current_account.id, update=update_dict, hashed_password=hashed_password))
 
-    return await schemas.account.Account.update_account(db=db, account_id=current_account.id, update=update.model_dump(exclude_none=True))
+    return await submit_write(lambda db: schemas.account.Account.update_account(db=db, account_id=current_account.id, update=update.model_dump(exclude_none=True)))
 
 
 async def delete_me_ctrl(
-    db: Session,
-    current_account: models.account.Account
+    current_account: schemas.account.AccountSnapshot
 ):
     # Delete account
-    logger.info(f"Deleting account with id: {current_account.id}")
-    await schemas.account.Account.delete_account(db=db, account_id=current_account.id)
+    logger.info("Deleting account with id: %s", current_account.id)
+    await submit_write(lambda db: schemas.account.Account.delete_account(db=db, account_id=current_account.id))
     
     return ORJSONResponse(
         status_code=status.HTTP_200_OK,
         content=f"Account with id: {current_account.id} deleted successfully"
-    )
\ No newline at end of file
+    )
+
+
+async def get_jwks_ctrl(if_none_match: Optional[str], config: Settings) -> Response:
+    keyring = get_keyring(config.signing)
+    if keyring is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Access tokens are not signed with a published key"
+        )
+
+    # Verifiers cache the key set, rotations publish the next key at least max-age ahead
+    headers = {
+        ETAG_HEADER: keyring.jwks_etag,
+        'Cache-Control': f'public, max-age={config.signing.jwks_max_age_seconds}',
+    }
+    if etag_matches(if_none_match, keyring.jwks_etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=keyring.jwks, media_type="application/json", headers=headers)
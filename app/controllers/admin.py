@@ -0,0 +1,165 @@
+from fastapi import HTTPException, Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse
+from typing import Optional
+import asyncio
+import hmac
+
+from app.schemas.account import AccountSnapshot
+from app.core.hashing import get_password_hasher
+from app.core.response_cache import get_response_cache
+from app.core.change_feed import get_change_feed
+from app.core.rate_limit import get_rate_limiter
+from app.core.keyring import get_keyring
+from app.core.configuration import Settings
+from app.utils.db_writer_helper import get_db_writer
+from app.utils.startup_helper import startup_timer
+from app.utils.config_helper import RestartRequiredError, reload_config
+from app.utils.logging_helper import logger
+from app.utils.metrics_helper import PROMETHEUS_MEDIA_TYPE, get_request_metrics, render_gauges
+from app.utils.profiling_helper import PROFILE_FORMATS, PROFILE_MODES, get_loop_lag_monitor, sampling_profiler
+from app.utils.serialization_helper import ORJSONResponse
+
+
+async def reload_config_ctrl(current_account: AccountSnapshot) -> dict:
+    # Recompose the configuration off the event loop and swap the snapshot
+    logger.info("Configuration reload requested by account: %s", current_account.id)
+    try:
+        settings = await run_in_threadpool(reload_config)
+    except SystemExit:
+        # AppConfig exits on invalid configuration, keep serving the previous snapshot
+        logger.error("Configuration reload failed, keeping the previous snapshot")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to reload configuration"
+        )
+    except RestartRequiredError as err:
+        logger.warning("Configuration reload rejected, keeping the previous snapshot: %s", err)
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(err)
+        )
+
+    # Parse rotated signing keys here rather than on the next login
+    try:
+        await run_in_threadpool(get_keyring, settings.signing)
+    except Exception as err:
+        logger.error("Failed to load the signing keys of the reloaded configuration: %s", err)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to load signing keys"
+        )
+
+    return {
+        'environment': settings.environment,
+        'version': settings.app.version
+    }
+
+
+async def get_hashing_metrics_ctrl() -> dict:
+    return get_password_hasher().metrics.snapshot()
+
+
+async def get_db_writer_metrics_ctrl() -> dict:
+    return get_db_writer().metrics.snapshot()
+
+
+async def get_startup_metrics_ctrl() -> dict:
+    return startup_timer.snapshot()
+
+
+async def get_response_cache_metrics_ctrl() -> dict:
+    response_cache = get_response_cache()
+    return {**response_cache.metrics.snapshot(), 'entries': len(response_cache), 'enabled': response_cache.enabled}
+
+
+async def get_change_feed_metrics_ctrl() -> dict:
+    change_feed = get_change_feed()
+    return {**change_feed.metrics.snapshot(), 'subscribers': change_feed.subscriber_count}
+
+
+async def get_event_loop_metrics_ctrl() -> dict:
+    loop_lag_monitor = get_loop_lag_monitor()
+    if loop_lag_monitor is None:
+        return {'enabled': False}
+    return {**loop_lag_monitor.metrics.snapshot(), 'enabled': True, 'threshold_ms': loop_lag_monitor.threshold_seconds * 1000}
+
+
+async def get_rate_limit_metrics_ctrl() -> dict:
+    rate_limiter = get_rate_limiter()
+    if rate_limiter is None:
+        return {'enabled': False}
+    return {**rate_limiter.metrics.snapshot(), **rate_limiter.backend.snapshot(), 'enabled': True}
+
+
+async def get_profile_ctrl(current_account: AccountSnapshot, seconds: float, interval_ms: Optional[float], mode: str, profile_format: str, config: Settings) -> Response:
+    settings = config.profiling
+    if not settings.enabled:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profiling is disabled"
+        )
+
+    if seconds > settings.max_seconds:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Profiles are limited to {settings.max_seconds} seconds"
+        )
+
+    if mode not in PROFILE_MODES or profile_format not in PROFILE_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Profiles are taken in one of {list(PROFILE_MODES)} modes and formats {list(PROFILE_FORMATS)}"
+        )
+
+    if sampling_profiler.running:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A profile is already running on this worker"
+        )
+
+    # The sampler thread keeps the event loop free to serve the traffic being profiled
+    logger.warning("Account: %s started a %s second %s profile", current_account.id, seconds, mode)
+    sampling_profiler.running = True
+    try:
+        profile = await asyncio.to_thread(sampling_profiler.sample, seconds, (interval_ms or settings.interval_ms) / 1000, mode)
+    finally:
+        sampling_profiler.running = False
+
+    if profile_format == 'speedscope':
+        return ORJSONResponse(
+            content=profile.to_speedscope(),
+            headers={'Content-Disposition': 'attachment; filename="profile.speedscope.json"'}
+        )
+    return PlainTextResponse(content=profile.to_collapsed())
+
+
+async def get_prometheus_metrics_ctrl(authorization: Optional[str], config: Settings) -> Response:
+    # The gauges below are admin metrics, a configured scrape token keeps them from anyone else
+    scrape_token = config.metrics.scrape_token
+    if scrape_token and not hmac.compare_digest((authorization or '').encode(), f"Bearer {scrape_token}".encode()):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid scrape token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    request_metrics = get_request_metrics()
+    if request_metrics is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Metrics are disabled"
+        )
+
+    # Request metrics followed by the numbers of the admin metrics endpoints, all of this worker
+    body = ''.join([
+        request_metrics.render(),
+        render_gauges('password_hashing', await get_hashing_metrics_ctrl(), "Password hashing pool metric, see /api/v1/admin/metrics/hashing."),
+        render_gauges('db_writer', await get_db_writer_metrics_ctrl(), "Database writer metric, see /api/v1/admin/metrics/db-writer."),
+        render_gauges('worker_startup', await get_startup_metrics_ctrl(), "Worker startup metric, see /api/v1/admin/metrics/startup."),
+        render_gauges('response_cache', await get_response_cache_metrics_ctrl(), "Response cache metric, see /api/v1/admin/metrics/response-cache."),
+        render_gauges('change_feed', await get_change_feed_metrics_ctrl(), "Change feed metric, see /api/v1/admin/metrics/change-feed."),
+        render_gauges('event_loop', await get_event_loop_metrics_ctrl(), "Event loop stall metric, see /api/v1/admin/metrics/event-loop."),
+        render_gauges('rate_limit', await get_rate_limit_metrics_ctrl(), "Rate limiter metric, see /api/v1/admin/metrics/rate-limit."),
+    ])
+    return Response(content=body, media_type=PROMETHEUS_MEDIA_TYPE)
@@ -1,59 +1,440 @@
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.task import Task
-from app.schemas.task import TaskCreate, TaskUpdate, Task as schema_task
+from app.schemas.task import TaskCreate, TaskUpdate, TaskFilter, TaskBulkUpdate, TaskBulkDelete, BulkItemResult, BulkResult, TASK_RESPONSE_COLUMNS, Task as schema_task
+from app.core.response_cache import get_response_cache, invalidate_account_responses
+from app.core.change_feed import ChangeEvent, get_change_feed
+from app.core.configuration import Settings
+from app.enums.task_enum import TaskSortEnum
 from app.utils.logging_helper import logger
+from app.utils.pagination_helper import encode_cursor, decode_cursor, parse_datetime_value, parse_float_value
+from app.utils.ndjson_helper import iter_ndjson, NDJSON_MEDIA_TYPE
+from app.utils.init_db import new_read_session
+from app.utils.db_writer_helper import submit_write
+from app.utils.serialization_helper import ORJSONResponse, dump_row, dump_rows
+from app.utils.etag_helper import ETAG_HEADER, task_etag, task_collection_etag, etag_matches, get_expected_versions
 
-from fastapi import HTTPException, status
-from fastapi.responses import ORJSONResponse
+from fastapi import HTTPException, status, Response, Request
+from pydantic import ValidationError
+from fastapi.responses import StreamingResponse
 
-from typing import List
+from typing import Any, Awaitable, Callable, List, Optional, AsyncIterator, Tuple
+from datetime import datetime
+import csv
+import io
+import itertools
+import json
+import tempfile
 
 
-async def create_task_ctrl(db: Session, account_id: int, task: TaskCreate) -> Task:
-    logger.info("Creating new task for account id: {account_id}")
-    return await schema_task.create_task(db=db, account_id=account_id, task=task)
+# Response header carrying the opaque cursor of the next page
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
 
+# Media type of the server-sent events change feed
+SSE_MEDIA_TYPE = "text/event-stream"
 
-async def get_task_ctrl(db: Session, account_id: int, task_id: int) -> Task:
+# Media type of the task read responses encoded from plain rows
+JSON_MEDIA_TYPE = "application/json"
+
+# Validated import lines past this size wait on disk for the writer, not in memory
+IMPORT_SPOOL_MAX_BYTES = 1024 * 1024
+
+
+def set_task_etag(response: Response, task: Task) -> None:
+    response.headers[ETAG_HEADER] = task_etag(task.id, task.version)
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={ETAG_HEADER: etag})
+
+
+async def submit_task_write(fn: Callable[[AsyncSession], Awaitable[Any]]) -> Tuple[Any, Optional[Tuple[int, int]]]:
+    # Run the write on the database writer, returning the task collection versions it moved through
+    async def write(db: AsyncSession):
+        schema_task.pop_tasks_version_span(db)
+        result = await fn(db)
+        return result, schema_task.pop_tasks_version_span(db)
+
+    return await submit_write(write)
+
+
+def task_change(op: str, task_id: int, version: Optional[int] = None) -> dict:
+    change = {'op': op, 'id': task_id}
+    if version is not None:
+        change['version'] = version
+    return change
+
+
+def publish_task_changes(account_id: int, version_span: Optional[Tuple[int, int]], changes: List[dict]) -> None:
+    # Only called once the write is committed
+    invalidate_account_responses(account_id)
+    if version_span is not None:
+        prev_seq, seq = version_span
+        get_change_feed().publish(account_id, seq=seq, prev_seq=prev_seq, changes=changes)
+
+
+async def create_task_ctrl(account_id: int, task: TaskCreate, response: Response) -> Task:
+    logger.info("Creating new task for account id: %s", account_id)
+    db_task, version_span = await submit_task_write(lambda db: schema_task.create_task(db=db, account_id=account_id, task=task))
+    publish_task_changes(account_id, version_span, [task_change('created', db_task.id, db_task.version)])
+    set_task_etag(response, db_task)
+    return db_task
+
+
+async def get_task_ctrl(db: AsyncSession, account_id: int, task_id: int, if_none_match: Optional[str] = None) -> Response:
     # Check if task exist
-    logger.info("Fetching task: {task_id} for account: {account_id}")
-    task_exist = await schema_task.get_task_by_id(db=db, task_id=task_id, account_id=account_id)
-    if not task_exist:
-        logger.warn(f"Task: {task_id} not found")
+    logger.info("Fetching task: %s for account: %s", task_id, account_id)
+    task_row = await schema_task.get_task_row(db=db, task_id=task_id, account_id=account_id)
+    if not task_row:
+        logger.warning("Task: %s not found", task_id)
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Invalid task id"
         )
 
-    logger.info(f"Task: {task_id} found.")
-    return task_exist
+    logger.info("Task: %s found.", task_id)
+    etag = task_etag(task_row.id, task_row.version)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+
+    return Response(content=dump_row(task_row, TASK_RESPONSE_COLUMNS), media_type=JSON_MEDIA_TYPE, headers={ETAG_HEADER: etag})
+
 
+async def get_tasks_ctrl(
+    db: AsyncSession,
+    account_id: int,
+    skip: int,
+    limit: int,
+    cursor: Optional[str] = None,
+    task_filter: Optional[TaskFilter] = None,
+    sort: TaskSortEnum = TaskSortEnum.id,
+    if_none_match: Optional[str] = None
+) -> Response:
+    # Read the collection version before the tasks, a rendered page is never older than its ETag
+    tasks_version = await schema_task.get_tasks_version(db=db, account_id=account_id)
+    etag = task_collection_etag(account_id, tasks_version)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
 
-async def get_tasks_ctrl(db: Session, account_id: int, skip: int, limit: int) -> List[Task]:
-    # Fetch tasks
-    logger.info(f"Fetching tasks for account: {account_id}")
-    tasks = await schema_task.get_account_tasks(db=db, account_id=account_id, skip=skip, limit=limit)
+    response_cache = get_response_cache()
+    cache_key = ('tasks', skip, limit, cursor, sort.value, tuple(task_filter.model_dump().values()) if task_filter else None)
+    cached_response = response_cache.get(account_id, cache_key, tasks_version) if response_cache.enabled else None
+    if cached_response is not None:
+        return Response(content=cached_response.body, media_type=JSON_MEDIA_TYPE, headers={**cached_response.headers, ETAG_HEADER: etag})
+
+    # A cursor continues after the last seen task instead of skipping rows
+    after = None
+    id_sort = sort in (TaskSortEnum.id, TaskSortEnum.id_desc)
+    decoded_cursor = decode_cursor(cursor, parse_value=None if id_sort else parse_datetime_value)
+    if decoded_cursor is not None:
+        if decoded_cursor.get('sort', TaskSortEnum.id.value) != sort.value:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Cursor does not match the requested sort"
+            )
+        after = (None if id_sort else decoded_cursor['value'], decoded_cursor['id'])
+        skip = 0
+
+    # Fetch one extra task to know if there is a next page
+    logger.info("Fetching tasks for account: %s", account_id)
+    tasks = await schema_task.get_account_tasks(db=db, account_id=account_id, skip=skip, limit=limit + 1, after=after, task_filter=task_filter, sort=sort, columns=TASK_RESPONSE_COLUMNS)
     if not tasks or len(tasks) < 1:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Tasks not found for account: {account_id}"
         )
 
-    logger.info(f"Tasks for account: {account_id} found")
-    return tasks
+    headers = {}
+    if len(tasks) > limit and limit > 0:
+        tasks = tasks[:limit]
+        last_task = tasks[-1]
+        if sort in (TaskSortEnum.id, TaskSortEnum.id_desc):
+            next_cursor = encode_cursor(last_task.id, sort=sort.value if sort is not TaskSortEnum.id else None)
+        else:
+            next_cursor = encode_cursor(last_task.id, sort=sort.value, sort_value=getattr(last_task, sort.value.lstrip('-')).isoformat())
+        headers[NEXT_CURSOR_HEADER] = next_cursor
 
+    logger.info("Tasks for account: %s found", account_id)
+    content = dump_rows(tasks, TASK_RESPONSE_COLUMNS)
+    response_cache.put(account_id, cache_key, tasks_version, content, headers)
+    return Response(content=content, media_type=JSON_MEDIA_TYPE, headers={**headers, ETAG_HEADER: etag})
 
-async def update_task_ctrl(db: Session, account_id: int, task_id: int, update: TaskUpdate) -> Task:
-    updated_task = await schema_task.update_task(db=db, task_id=task_id, account_id=account_id, update=update)
-    if not updated_task:
+
+async def search_tasks_ctrl(db: AsyncSession, account_id: int, query: str, limit: int, response: Response, cursor: Optional[str] = None) -> List[Task]:
+    if not schema_task.build_match_query(query):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Search query is empty"
+        )
+
+    after = None
+    decoded_cursor = decode_cursor(cursor, parse_value=parse_float_value)
+    if decoded_cursor is not None:
+        if decoded_cursor.get('sort') != 'rank':
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor"
+            )
+        after = (decoded_cursor['value'], decoded_cursor['id'])
+
+    # Fetch one extra match to know if there is a next page
+    logger.info("Searching tasks for account: %s", account_id)
+    matches = await schema_task.search_account_tasks(db=db, account_id=account_id, query=query, limit=limit + 1, after=after)
+    if len(matches) > limit:
+        matches = matches[:limit]
+        if matches:
+            last_task, last_rank = matches[-1]
+            response.headers[NEXT_CURSOR_HEADER] = encode_cursor(last_task.id, sort='rank', sort_value=last_rank)
+
+    return [task for task, _ in matches]
+
+
+async def raise_task_write_failed(account_id: int, task_id: int, expected_versions: Optional[List[int]]) -> None:
+    # Only a failed conditional write pays for the extra read telling a missing task from a stale one
+    current_version = None
+    if expected_versions is not None:
+        async with new_read_session() as db:
+            current_version = await schema_task.get_task_version(db=db, task_id=task_id, account_id=account_id)
+
+    if current_version is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Tasks not found for account: {account_id}"
         )
-    return updated_task 
- 
-async def delete_task_ctrl(db: Session, task_id: int, account_id: int) -> None:
-    await schema_task.delete_task(db=db, task_id=task_id, account_id = account_id)
+
+    logger.warning("Task: %s changed since version: %s", task_id, expected_versions)
+    raise HTTPException(
+        status_code=status.HTTP_412_PRECONDITION_FAILED,
+        detail="Task was modified by another request",
+        headers={ETAG_HEADER: task_etag(task_id, current_version)}
+    )
+
+
+async def update_task_ctrl(account_id: int, task_id: int, update: TaskUpdate, response: Response, if_match: Optional[str] = None) -> Task:
+    expected_versions = get_expected_versions(if_match, task_id)
+    updated_task, version_span = await submit_task_write(lambda db: schema_task.update_task(db=db, task_id=task_id, account_id=account_id, update=update, expected_versions=expected_versions))
+    if not updated_task:
+        await raise_task_write_failed(account_id=account_id, task_id=task_id, expected_versions=expected_versions)
+
+    if version_span is not None:
+        publish_task_changes(account_id, version_span, [task_change('updated', updated_task.id, updated_task.version)])
+    set_task_etag(response, updated_task)
+    return updated_task
+
+
+async def delete_task_ctrl(task_id: int, account_id: int, if_match: Optional[str] = None) -> None:
+    expected_versions = get_expected_versions(if_match, task_id)
+    deleted, version_span = await submit_task_write(lambda db: schema_task.delete_task(db=db, task_id=task_id, account_id=account_id, expected_versions=expected_versions))
+    if not deleted:
+        await raise_task_write_failed(account_id=account_id, task_id=task_id, expected_versions=expected_versions)
+
+    publish_task_changes(account_id, version_span, [task_change('deleted', task_id)])
     return ORJSONResponse(
         content=f"Task: {task_id} deleted successfully"
-    )
\ No newline at end of file
+    )
+
+
+def check_batch_size(size: int, max_items: int) -> None:
+    if size > max_items:
+        raise HTTPException(
+            status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+            detail=f"Batch exceeds the limit of {max_items} items"
+        )
+
+
+def build_bulk_result(items: List[BulkItemResult]) -> BulkResult:
+    failed = sum(1 for item in items if item.status in ('not_found', 'invalid'))
+    return BulkResult(succeeded=len(items) - failed, failed=failed, items=items)
+
+
+async def create_tasks_ctrl(account_id: int, tasks: List[TaskCreate], config: Settings) -> BulkResult:
+    check_batch_size(len(tasks), config.tasks.bulk_max_items)
+
+    logger.info("Creating %s tasks for account: %s", len(tasks), account_id)
+    db_tasks, version_span = await submit_task_write(lambda db: schema_task.create_tasks(db=db, account_id=account_id, tasks=tasks))
+    publish_task_changes(account_id, version_span, [task_change('created', db_task.id, db_task.version) for db_task in db_tasks])
+    return build_bulk_result([BulkItemResult(index=index, id=db_task.id, version=db_task.version, status='created') for index, db_task in enumerate(db_tasks)])
+
+
+async def import_tasks_ctrl(account_id: int, request: Request, config: Settings) -> BulkResult:
+    items = []
+    task_indexes = []
+
+    # Read and validate the whole stream first, a slow upload must never hold the write lock. The
+    # validated tasks are spooled, past IMPORT_SPOOL_MAX_BYTES to a temporary file, and read back
+    # a chunk at a time by the writer, so memory stays bounded by a chunk and the per line results.
+    logger.info("Importing task stream for account: %s", account_id)
+    index = -1
+    with tempfile.SpooledTemporaryFile(max_size=IMPORT_SPOOL_MAX_BYTES) as spool:
+        async for document in iter_ndjson(request, max_line_bytes=config.tasks.bulk_max_line_bytes):
+            index += 1
+            check_batch_size(index + 1, config.tasks.bulk_stream_max_items)
+            try:
+                task = TaskCreate.model_validate(document)
+            except ValidationError as err:
+                items.append(BulkItemResult(index=index, status='invalid', detail=str(err.errors(include_url=False, include_input=False))))
+                continue
+            spool.write(task.model_dump_json().encode() + b"\n")
+            task_indexes.append(index)
+
+        async def insert_chunks(db: AsyncSession) -> List[Tuple[int, int]]:
+            # One writer job, so the import stays a single transaction, flushed in chunks
+            chunk_size = max(config.tasks.bulk_chunk_size, 1)
+            created = []
+            spool.seek(0)
+            while True:
+                chunk = [TaskCreate.model_validate_json(line) for line in itertools.islice(spool, chunk_size)]
+                if not chunk:
+                    return created
+                db_tasks = await schema_task.create_tasks(db=db, account_id=account_id, tasks=chunk, commit=False)
+                created.extend((db_task.id, db_task.version) for db_task in db_tasks)
+
+        if task_indexes:
+            created, version_span = await submit_task_write(insert_chunks)
+            items.extend(BulkItemResult(index=index, id=task_id, version=version, status='created') for index, (task_id, version) in zip(task_indexes, created))
+            publish_task_changes(account_id, version_span, [task_change('created', task_id, version) for task_id, version in created])
+
+    items.sort(key=lambda item: item.index)
+    logger.info("Imported %s tasks for account: %s", index + 1, account_id)
+    return build_bulk_result(items)
+
+
+async def update_tasks_ctrl(account_id: int, updates: List[TaskBulkUpdate], config: Settings) -> BulkResult:
+    check_batch_size(len(updates), config.tasks.bulk_max_items)
+
+    logger.info("Updating %s tasks for account: %s", len(updates), account_id)
+    versions, version_span = await submit_task_write(lambda db: schema_task.update_tasks(db=db, account_id=account_id, updates=updates))
+    publish_task_changes(account_id, version_span, [task_change('updated', task_update.id, version) for task_update, version in zip(updates, versions) if version is not None and task_update.model_dump(exclude_none=True, exclude={'id'})])
+    return build_bulk_result([
+        BulkItemResult(index=index, id=task_update.id, version=version, status='updated') if version is not None
+        else BulkItemResult(index=index, id=task_update.id, status='not_found', detail='Task not found')
+        for index, (task_update, version) in enumerate(zip(updates, versions))
+    ])
+
+
+async def delete_tasks_ctrl(account_id: int, delete: TaskBulkDelete, config: Settings) -> BulkResult:
+    check_batch_size(len(delete.ids), config.tasks.bulk_max_items)
+
+    logger.info("Deleting %s tasks for account: %s", len(delete.ids), account_id)
+    deleted_ids, version_span = await submit_task_write(lambda db: schema_task.delete_tasks(db=db, account_id=account_id, task_ids=delete.ids))
+    publish_task_changes(account_id, version_span, [task_change('deleted', task_id) for task_id in sorted(deleted_ids)])
+    return build_bulk_result([
+        BulkItemResult(index=index, id=task_id, status='deleted') if task_id in deleted_ids
+        else BulkItemResult(index=index, id=task_id, status='not_found', detail='Task not found')
+        for index, task_id in enumerate(delete.ids)
+    ])
+
+
+def _export_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+async def _export_ndjson(account_id: int, batch_size: int) -> AsyncIterator[str]:
+    # The export owns its session so it stays open for the whole response body
+    async with new_read_session() as db:
+        async for rows in schema_task.stream_account_tasks(db=db, account_id=account_id, batch_size=batch_size):
+            yield "".join(
+                json.dumps({column: _export_value(value) for column, value in zip(schema_task.EXPORT_COLUMNS, row)}) + "\n"
+                for row in rows
+            )
+
+
+async def _export_csv(account_id: int, batch_size: int) -> AsyncIterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    # Send the header right away so the first byte does not wait on the database
+    writer.writerow(schema_task.EXPORT_COLUMNS)
+    yield buffer.getvalue()
+
+    async with new_read_session() as db:
+        async for rows in schema_task.stream_account_tasks(db=db, account_id=account_id, batch_size=batch_size):
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows([[_export_value(value) for value in row] for row in rows])
+            yield buffer.getvalue()
+
+
+async def export_tasks_ctrl(account_id: int, export_format: str, config: Settings) -> StreamingResponse:
+    logger.info("Exporting tasks for account: %s as %s", account_id, export_format)
+    batch_size = config.tasks.export_batch_size
+    if export_format == 'csv':
+        return StreamingResponse(
+            _export_csv(account_id=account_id, batch_size=batch_size),
+            media_type="text/csv",
+            headers={"Content-Disposition": 'attachment; filename="tasks.csv"'}
+        )
+
+    return StreamingResponse(_export_ndjson(account_id=account_id, batch_size=batch_size), media_type=NDJSON_MEDIA_TYPE)
+
+
+def _format_sse(event: ChangeEvent) -> str:
+    return f"id: {event.seq}\nevent: {event.type}\ndata: {event.data}\n\n"
+
+
+async def _open_task_feed(account_id: int, after: Optional[int]):
+    # The only query of a feed connection, waiting for changes costs no database work
+    async with new_read_session() as db:
+        current_seq = await schema_task.get_tasks_version(db=db, account_id=account_id)
+
+    change_feed = get_change_feed()
+    subscriber = change_feed.subscribe(account_id, current_seq)
+    if subscriber is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many change feed subscribers",
+            headers={"Retry-After": "5"}
+        )
+
+    events = change_feed.replay(account_id, after, current_seq) if after is not None else []
+    return change_feed, subscriber, current_seq, events
+
+
+async def _poll_task_changes(account_id: int, after: Optional[int], timeout: float) -> dict:
+    change_feed, subscriber, current_seq, events = await _open_task_feed(account_id, after)
+    last_seq = after if after is not None else current_seq
+    try:
+        if not events and await subscriber.wait(timeout):
+            events = [event for event in subscriber.drain(change_feed.latest_seq(account_id)) if event.seq > last_seq]
+    finally:
+        change_feed.unsubscribe(subscriber)
+
+    return {
+        'seq': events[-1].seq if events else last_seq,
+        'events': [event.to_dict() for event in events]
+    }
+
+
+async def _stream_task_changes(account_id: int, after: Optional[int], heartbeat_seconds: float) -> StreamingResponse:
+    change_feed, subscriber, current_seq, events = await _open_task_feed(account_id, after)
+
+    async def stream() -> AsyncIterator[str]:
+        try:
+            # No id on the ready event, a reconnect resumes after the last change actually received
+            yield f"event: ready\ndata: {json.dumps({'seq': current_seq})}\n\n"
+            delivered = after if after is not None else current_seq
+            for event in events:
+                yield _format_sse(event)
+                delivered = max(delivered, event.seq)
+
+            while not subscriber.closed:
+                if not await subscriber.wait(heartbeat_seconds):
+                    yield ": keep-alive\n\n"
+                    continue
+                for event in subscriber.drain(change_feed.latest_seq(account_id)):
+                    if event.seq > delivered:
+                        yield _format_sse(event)
+                        delivered = event.seq
+        finally:
+            change_feed.unsubscribe(subscriber)
+
+    return StreamingResponse(stream(), media_type=SSE_MEDIA_TYPE, headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+async def get_task_changes_ctrl(account_id: int, mode: str, after: Optional[int], timeout: Optional[float], config: Settings):
+    settings = config.change_feed
+    if mode == 'poll':
+        timeout = min(timeout, settings.long_poll_timeout_seconds) if timeout else settings.long_poll_timeout_seconds
+        return await _poll_task_changes(account_id=account_id, after=after, timeout=timeout)
+
+    logger.info("Streaming task changes for account: %s", account_id)
+    return await _stream_task_changes(account_id=account_id, after=after, heartbeat_seconds=settings.heartbeat_seconds)
@@ -0,0 +1,309 @@
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Sequence, Set
+import asyncio
+import json
+
+from app.schemas.task import Task as schema_task
+from app.utils.config_helper import get_config
+from app.utils.init_db import new_read_session
+from app.utils.logging_helper import logger
+
+
+# Event telling the client its view is out of date and it should list its tasks again
+RESYNC_EVENT = 'resync'
+TASKS_EVENT = 'tasks'
+
+
+class ChangeEvent:
+    """Committed change to the tasks of an account.
+
+    seq is the account's task collection version after the write and prev_seq the version
+    before it, so a client resuming after seq N can tell whether the buffered events cover
+    every write since N. Both match the collection ETag of the task list.
+    """
+
+    __slots__ = ('seq', 'prev_seq', 'type', 'changes', '_data')
+
+    def __init__(self, seq: int, prev_seq: Optional[int], type: str = TASKS_EVENT, changes: Sequence[dict] = ()):
+        self.seq = seq
+        self.prev_seq = prev_seq
+        self.type = type
+        self.changes = changes
+        self._data: Optional[str] = None
+
+
+    def to_dict(self) -> dict:
+        event = {'seq': self.seq, 'type': self.type}
+        if self.type == TASKS_EVENT:
+            event['changes'] = list(self.changes)
+        return event
+
+
+    @property
+    def data(self) -> str:
+        # Serialized once, however many subscribers receive it
+        if self._data is None:
+            self._data = json.dumps(self.to_dict(), separators=(',', ':'))
+        return self._data
+
+
+class Subscriber:
+    __slots__ = ('account_id', 'max_events', 'events', 'overflowed', 'closed', '_ready')
+
+    def __init__(self, account_id: int, max_events: int):
+        self.account_id = account_id
+        self.max_events = max_events
+        self.events: Deque[ChangeEvent] = deque()
+        self.overflowed = False
+        self.closed = False
+        self._ready = asyncio.Event()
+
+
+    def push(self, event: ChangeEvent) -> None:
+        # A client too slow to keep up loses its buffer and is told to resync instead
+        if len(self.events) >= self.max_events:
+            self.events.clear()
+            self.overflowed = True
+        elif not self.overflowed:
+            self.events.append(event)
+        self._ready.set()
+
+
+    def close(self) -> None:
+        self.closed = True
+        self._ready.set()
+
+
+    async def wait(self, timeout: float) -> bool:
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+
+    def drain(self, latest_seq: int) -> List[ChangeEvent]:
+        self._ready.clear()
+        if self.overflowed:
+            self.overflowed = False
+            self.events.clear()
+            return [ChangeEvent(seq=latest_seq, prev_seq=None, type=RESYNC_EVENT)]
+
+        events = list(self.events)
+        self.events.clear()
+        return events
+
+
+class AccountHistory:
+    __slots__ = ('events', 'last_seq')
+
+    def __init__(self, max_events: int):
+        self.events: Deque[ChangeEvent] = deque(maxlen=max_events)
+        self.last_seq = 0
+
+
+class ChangeFeedMetrics:
+    def __init__(self):
+        self.published = 0
+        self.delivered = 0
+        self.overflows = 0
+        self.replays = 0
+        self.resyncs = 0
+        self.rejected_subscribers = 0
+        self.remote_changes = 0
+
+
+    def snapshot(self) -> dict:
+        return {
+            'published': self.published,
+            'delivered': self.delivered,
+            'overflows': self.overflows,
+            'replays': self.replays,
+            'resyncs': self.resyncs,
+            'rejected_subscribers': self.rejected_subscribers,
+            'remote_changes': self.remote_changes,
+        }
+
+
+class TaskChangeFeed:
+    """In-process pub/sub of committed task changes, one channel per account."""
+
+    def __init__(
+        self,
+        buffer_size: int = 256,
+        history_size: int = 256,
+        history_accounts: int = 10000,
+        max_subscribers: int = 10000,
+        max_event_changes: int = 1000,
+        resync_interval_seconds: float = 0,
+    ):
+        self.buffer_size = max(buffer_size, 1)
+        self.history_size = history_size
+        self.history_accounts = history_accounts
+        self.max_subscribers = max_subscribers
+        self.max_event_changes = max_event_changes
+        self.resync_interval_seconds = resync_interval_seconds
+        self.metrics = ChangeFeedMetrics()
+        self._histories: "OrderedDict[int, AccountHistory]" = OrderedDict()
+        self._subscribers: Dict[int, Set[Subscriber]] = {}
+        self._subscriber_count = 0
+        self._poller: Optional[asyncio.Task] = None
+
+
+    def _history(self, account_id: int) -> AccountHistory:
+        history = self._histories.get(account_id)
+        if history is None:
+            history = self._histories[account_id] = AccountHistory(self.history_size)
+            # Forget the least recently written accounts
+            while len(self._histories) > self.history_accounts:
+                self._histories.popitem(last=False)
+        else:
+            self._histories.move_to_end(account_id)
+        return history
+
+
+    def latest_seq(self, account_id: int) -> int:
+        history = self._histories.get(account_id)
+        return history.last_seq if history is not None else 0
+
+
+    def observe(self, account_id: int, seq: int) -> None:
+        history = self._history(account_id)
+        history.last_seq = max(history.last_seq, seq)
+
+
+    def publish(self, account_id: int, seq: int, prev_seq: Optional[int], changes: Sequence[dict] = (), type: str = TASKS_EVENT) -> ChangeEvent:
+        # Large bulk writes are cheaper to re-list than to stream change by change
+        if len(changes) > self.max_event_changes:
+            type, changes = RESYNC_EVENT, ()
+
+        event = ChangeEvent(seq=seq, prev_seq=prev_seq, type=type, changes=changes)
+        history = self._history(account_id)
+        history.events.append(event)
+        history.last_seq = max(history.last_seq, seq)
+        self.metrics.published += 1
+
+        for subscriber in self._subscribers.get(account_id, ()):
+            if not subscriber.overflowed and len(subscriber.events) >= subscriber.max_events:
+                self.metrics.overflows += 1
+            subscriber.push(event)
+            self.metrics.delivered += 1
+        return event
+
+
+    def replay(self, account_id: int, after: int, current_seq: int) -> List[ChangeEvent]:
+        # Events since after when the history holds an unbroken chain of them, a resync otherwise
+        if after == current_seq:
+            return []
+
+        history = self._histories.get(account_id)
+        events = [event for event in history.events if event.seq > after] if history is not None else []
+        expected = after
+        for event in events:
+            if event.prev_seq != expected:
+                break
+            expected = event.seq
+        else:
+            if events and expected >= current_seq:
+                self.metrics.replays += 1
+                return events
+
+        self.metrics.resyncs += 1
+        return [ChangeEvent(seq=max(current_seq, self.latest_seq(account_id)), prev_seq=None, type=RESYNC_EVENT)]
+
+
+    def subscribe(self, account_id: int, current_seq: int) -> Optional[Subscriber]:
+        if self._subscriber_count >= self.max_subscribers:
+            self.metrics.rejected_subscribers += 1
+            return None
+
+        self.observe(account_id, current_seq)
+        subscriber = Subscriber(account_id, self.buffer_size)
+        self._subscribers.setdefault(account_id, set()).add(subscriber)
+        self._subscriber_count += 1
+        self._ensure_poller()
+        return subscriber
+
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        subscribers = self._subscribers.get(subscriber.account_id)
+        if subscribers is None or subscriber not in subscribers:
+            return
+
+        subscribers.discard(subscriber)
+        self._subscriber_count -= 1
+        if not subscribers:
+            del self._subscribers[subscriber.account_id]
+
+
+    @property
+    def subscriber_count(self) -> int:
+        return self._subscriber_count
+
+
+    def _ensure_poller(self) -> None:
+        if self.resync_interval_seconds <= 0 or (self._poller is not None and not self._poller.done()):
+            return
+        self._poller = asyncio.get_running_loop().create_task(self._poll_remote_changes())
+
+
+    async def _poll_remote_changes(self) -> None:
+        # Other workers publish on their own bus. One query per interval, however many
+        # clients are connected, catches their writes for the accounts subscribed here.
+        while True:
+            await asyncio.sleep(self.resync_interval_seconds)
+            account_ids = list(self._subscribers)
+            if not account_ids:
+                continue
+
+            try:
+                async with new_read_session() as db:
+                    versions = await schema_task.get_tasks_versions(db=db, account_ids=account_ids)
+            except Exception as e:
+                logger.error("Failed to poll task collection versions due to error: %s", e)
+                continue
+
+            for account_id, tasks_version in versions.items():
+                if tasks_version > self.latest_seq(account_id):
+                    self.metrics.remote_changes += 1
+                    self.publish(account_id, seq=tasks_version, prev_seq=None, type=RESYNC_EVENT)
+
+
+    async def stop(self) -> None:
+        for subscribers in self._subscribers.values():
+            for subscriber in subscribers:
+                subscriber.close()
+
+        if self._poller is not None:
+            self._poller.cancel()
+            try:
+                await self._poller
+            except asyncio.CancelledError:
+                pass
+            self._poller = None
+
+
+# Process-wide change feed, created from the settings on first use
+_change_feed: Optional[TaskChangeFeed] = None
+
+
+def get_change_feed() -> TaskChangeFeed:
+    global _change_feed
+    if _change_feed is None:
+        settings = get_config().change_feed
+        _change_feed = TaskChangeFeed(
+            buffer_size=settings.buffer_size,
+            history_size=settings.history_size,
+            history_accounts=settings.history_accounts,
+            max_subscribers=settings.max_subscribers,
+            max_event_changes=settings.max_event_changes,
+            resync_interval_seconds=settings.resync_interval_seconds,
+        )
+    return _change_feed
+
+
+async def stop_change_feed() -> None:
+    global _change_feed
+    if _change_feed is not None:
+        await _change_feed.stop()
+        _change_feed = None
@@ -3,6 +3,274 @@ from app.utils.logging_helper import logger
 import sys
 from hydra import compose, initialize
 from pathlib import Path
+from dataclasses import dataclass, field, fields, is_dataclass
+from typing import Optional, Tuple, get_args
+
+
+@dataclass(frozen=True)
+class AppSettings:
+    title: str = "Task Management API"
+    description: str = ""
+    lifespan: str = "on"
+    version: str = "1.0.0"
+    entry_point: str = "main:app"
+    developer_name: str = ""
+    developer_repo_url: str = ""
+    developer_email: str = ""
+    host: str = "localhost"
+    port: int = 8000
+    debug: bool = False
+    reload: bool = False
+    db_url: str = "sqlite:///./app/db/test.db"
+    refresh_token_secret: Optional[str] = None
+    access_token_secret: Optional[str] = None
+    access_token_expiry_seconds: int = 3600
+    refresh_token_expiry_seconds: int = 86400
+    token_algorithm: str = "HS256"
+    token_bytes: int = 32
+    token_aud: str = "authenticated"
+    token_iss: str = "https://github.com/forged-by-grace"
+    token_sub: str = "token"
+    token_type: str = "Bearer"
+    tls_cert_path: str = "./tls/cert.pem"
+    tls_key_path: str = "./tls/key.pem"
+
+
+@dataclass(frozen=True)
+class DatabaseSettings:
+    # SQLite pragmas applied to every new connection, ignored by other backends
+    journal_mode: str = "WAL"
+    synchronous: str = "NORMAL"
+    mmap_size: int = 268435456
+    # Negative values are KiB, positive values are pages
+    cache_size: int = -64000
+    busy_timeout_ms: int = 5000
+    temp_store: str = "MEMORY"
+    # Connection pool
+    pool_size: int = 5
+    max_overflow: int = 10
+    pool_timeout_seconds: float = 30
+    # Connections older than this are replaced, -1 keeps them forever
+    pool_recycle_seconds: int = 1800
+    # Test connections on checkout so restarts of the database server are survived
+    pool_pre_ping: bool = True
+    # Prepared statements cached per asyncpg connection, 0 disables it (e.g behind pgbouncer)
+    statement_cache_size: int = 100
+    # Interval of the wal_checkpoint/optimize maintenance task, 0 disables it
+    maintenance_interval_seconds: int = 300
+    # Read-only pool, optionally pointed at a replica instead of db_url
+    read_url: Optional[str] = None
+    read_pool_size: int = 10
+    # Group commit: most write jobs committed together, and how long to wait for more
+    writer_max_batch: int = 64
+    writer_batch_window_ms: float = 0
+
+
+@dataclass(frozen=True)
+class LoggingSettings:
+    level: str = "DEBUG"
+    # Write JSON lines instead of the plain text format
+    json_lines: bool = False
+    # Fraction of application info logs that are kept, warnings and errors are never sampled
+    info_sample_rate: float = 1.0
+    file_path: str = "log/audit.log"
+    stdout: bool = True
+    # Records are dropped instead of blocking the caller once the queue is full
+    queue_size: int = 10000
+    batch_size: int = 256
+    flush_interval_seconds: float = 0.5
+
+
+@dataclass(frozen=True)
+class HashingSettings:
+    # 'thread' or 'process'
+    executor: str = "thread"
+    # 0 sizes the pool to the number of cores
+    workers: int = 0
+    # Jobs allowed to wait for a worker before requests are rejected with 503
+    max_queue: int = 64
+    retry_after_seconds: int = 1
+
+
+@dataclass(frozen=True)
+class TokenCacheSettings:
+    enabled: bool = True
+    max_entries: int = 10000
+    # Upper bound on how long a verified token is trusted without re-checking, capped by the token exp
+    ttl_seconds: int = 300
+    # Read the account's active flag and role on every cache hit, so a logout, delete or role
+    # change made through another worker applies at once. Off, a hit costs no query, and such a
+    # change only reaches the other workers when their entries expire after ttl_seconds.
+    recheck_auth_state: bool = True
+
+
+@dataclass(frozen=True)
+class SigningKeySettings:
+    kid: str
+    # PEM private key the key signs with, or only the public key of a key kept to verify
+    # the tokens it signed before it was retired
+    private_key_path: Optional[str] = None
+    public_key_path: Optional[str] = None
+    # ISO 8601 time the key starts signing, the latest active key signs. Add the next key
+    # ahead of its time so it is published in the JWKS before tokens carry it.
+    active_from: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class SigningSettings:
+    # Asymmetric algorithm of the access tokens, RS256/384/512 or ES256/384/512. Unset keeps
+    # them on app.access_token_secret and app.token_algorithm. Refresh tokens stay on the
+    # refresh secret, only this service reads them.
+    algorithm: Optional[str] = None
+    keys: Tuple[SigningKeySettings, ...] = ()
+    # Cache-Control max-age of /.well-known/jwks.json
+    jwks_max_age_seconds: int = 3600
+
+
+@dataclass(frozen=True)
+class ResponseCacheSettings:
+    # Serialized task reads, revalidated against the task or collection version on every hit
+    enabled: bool = False
+    max_entries: int = 10000
+    # Larger responses are always rendered
+    max_body_bytes: int = 262144
+
+
+@dataclass(frozen=True)
+class ChangeFeedSettings:
+    # Events queued for a slow subscriber before it is told to resync
+    buffer_size: int = 256
+    # Recent events kept per account so reconnecting clients can resume
+    history_size: int = 256
+    history_accounts: int = 10000
+    max_subscribers: int = 10000
+    # Writes touching more tasks are published as a resync instead of a change list
+    max_event_changes: int = 1000
+    heartbeat_seconds: float = 15
+    long_poll_timeout_seconds: float = 30
+    # Check for writes made by other workers every few seconds, 0 when there is a single worker
+    resync_interval_seconds: float = 0
+
+
+@dataclass(frozen=True)
+class MetricsSettings:
+    # Per-route latency and database query metrics, served on /metrics in the Prometheus text format
+    enabled: bool = True
+    # Requests slower than this are logged with their SQL statements, a sample of them when the rate is below 1
+    slow_request_ms: float = 1000
+    slow_request_sample_rate: float = 1.0
+    # Statements kept per request for the slow request log, 0 keeps none
+    slow_request_max_statements: int = 50
+    # Bearer token the scraper sends to /metrics. Unset leaves the endpoint open, for when only
+    # the scraper can reach it.
+    scrape_token: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class ProfilingSettings:
+    # Admin sampling profiler endpoint, checked on every call so a config reload can turn it on
+    enabled: bool = False
+    max_seconds: float = 60
+    interval_ms: float = 10
+    # Log the stack of anything blocking the event loop longer than this, 0 disables the monitor
+    loop_lag_threshold_ms: float = 0
+
+
+@dataclass(frozen=True)
+class RateLimitSettings:
+    # Token buckets checked before authentication, hashing and database work
+    enabled: bool = True
+    # 'memory' keeps the buckets per worker, shared backends are registered in app.core.rate_limit
+    backend: str = "memory"
+    # Buckets kept by the memory backend, the least recently used are evicted past this
+    max_keys: int = 100000
+    # "<requests>/<second|minute|hour|day>" per route, null turns a bucket off
+    ip: Optional[str] = "1200/minute"
+    account: Optional[str] = "600/minute"
+    login_ip: Optional[str] = "20/minute"
+    login_account: Optional[str] = "5/minute"
+    register_ip: Optional[str] = "10/minute"
+
+
+@dataclass(frozen=True)
+class TaskSettings:
+    # Largest JSON array accepted by the bulk endpoints
+    bulk_max_items: int = 1000
+    # Largest NDJSON stream accepted by the bulk import endpoint
+    bulk_stream_max_items: int = 100000
+    # Streamed tasks are inserted in chunks of this size, all in one transaction
+    bulk_chunk_size: int = 500
+    bulk_max_line_bytes: int = 65536
+    # Rows fetched per round trip by the streaming export
+    export_batch_size: int = 1000
+    # Largest page the list and search endpoints return
+    max_page_size: int = 100
+
+
+@dataclass(frozen=True)
+class ServerSettings:
+    # Worker processes, 0 sizes them to the number of cores. Ignored when reload is on.
+    workers: int = 1
+    # 'auto' picks uvloop and httptools when they are installed
+    loop: str = "auto"
+    http: str = "auto"
+    backlog: int = 2048
+    timeout_keep_alive: int = 5
+    # Seconds in-flight requests get to finish on shutdown or restart, null waits forever
+    timeout_graceful_shutdown: Optional[int] = 30
+    limit_concurrency: Optional[int] = None
+    # Recycle a worker after this many requests, the jitter keeps workers from restarting together
+    limit_max_requests: Optional[int] = None
+    limit_max_requests_jitter: int = 0
+    proxy_headers: bool = True
+    forwarded_allow_ips: Optional[str] = None
+    # Oldest TLS version accepted, e.g 'TLSv1_2' or 'TLSv1_3'
+    tls_minimum_version: str = "TLSv1_2"
+
+
+@dataclass(frozen=True)
+class Settings:
+    environment: str = "test"
+    app: AppSettings = field(default_factory=AppSettings)
+    database: DatabaseSettings = field(default_factory=DatabaseSettings)
+    logging: LoggingSettings = field(default_factory=LoggingSettings)
+    hashing: HashingSettings = field(default_factory=HashingSettings)
+    token_cache: TokenCacheSettings = field(default_factory=TokenCacheSettings)
+    signing: SigningSettings = field(default_factory=SigningSettings)
+    response_cache: ResponseCacheSettings = field(default_factory=ResponseCacheSettings)
+    change_feed: ChangeFeedSettings = field(default_factory=ChangeFeedSettings)
+    metrics: MetricsSettings = field(default_factory=MetricsSettings)
+    profiling: ProfilingSettings = field(default_factory=ProfilingSettings)
+    rate_limit: RateLimitSettings = field(default_factory=RateLimitSettings)
+    tasks: TaskSettings = field(default_factory=TaskSettings)
+    server: ServerSettings = field(default_factory=ServerSettings)
+
+
+def build_settings(settings_cls: type, data: dict):
+    # Build a frozen settings object from a plain dict, recursing into nested sections
+    known_fields = {settings_field.name: settings_field for settings_field in fields(settings_cls)}
+    unknown_keys = set(data) - set(known_fields)
+    if unknown_keys:
+        logger.warning("Ignoring unknown %s keys: %s", settings_cls.__name__, sorted(unknown_keys))
+
+    values = {}
+    for name, settings_field in known_fields.items():
+        if name not in data:
+            continue
+        value = data[name]
+        if is_dataclass(settings_field.type) and isinstance(value, dict):
+            value = build_settings(settings_field.type, value)
+        elif isinstance(value, list):
+            # Lists of sections, e.g the signing keys, become tuples of settings objects
+            item_type = next(iter(get_args(settings_field.type)), None)
+            value = tuple(
+                build_settings(item_type, item) if is_dataclass(item_type) and isinstance(item, dict) else item
+                for item in value
+            )
+        values[name] = value
+
+    return settings_cls(**values)
+
 
 class AppConfig:
     def __init__(self, cfg_path: DictConfig):
@@ -21,7 +289,7 @@ class AppConfig:
                 common_cfg = OmegaConf.load('./config/common.yaml')
                 
                 # Load environment-specific configuration
-                logger.info(f'Loading {env} config')
+                logger.info('Loading %s config', env)
                 env_cfg = None # Init a env_cfg variable
                 if env == "staging":
                     env_cfg = compose(config_name="staging")
@@ -33,15 +301,26 @@ class AppConfig:
                     env_cfg = compose(config_name="test")
 
                 # Merge common configuration with environment-specific configuration
-                logger.info(f'Merging common and {env} configs into one')
+                logger.info('Merging common and %s configs into one', env)
                 final_cfg = OmegaConf.merge(common_cfg, env_cfg)
                 logger.info("Config merged successfully")
 
             return OmegaConf.create(final_cfg)
         except FileNotFoundError:
-            logger.error(f"Error: Configuration file '{self.cfg_path}' not found.")
+            logger.error("Error: Configuration file '%s' not found.", self.cfg_path)
             sys.exit(1)
         except Exception as e:
-            logger.error(f"Error loading configuration: {e}")
+            logger.error("Error loading configuration: %s", e)
             sys.exit(1)
-            
\ No newline at end of file
+
+
+    def load_settings(self) -> Settings:
+        # Resolve the merged config into a plain dict
+        cfg = self.load_config()
+        data = OmegaConf.to_container(cfg, resolve=True)
+        data['environment'] = self.cfg_path
+
+        # Freeze it into a typed settings snapshot
+        logger.info('Building %s settings snapshot', self.cfg_path)
+        return build_settings(Settings, data)
+            
@@ -0,0 +1,158 @@
+from passlib.context import CryptContext
+from fastapi import HTTPException, status
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Optional, Tuple, Any
+import asyncio
+import os
+import time
+
+from app.utils.logging_helper import logger
+from app.utils.config_helper import get_config
+from app.utils.metrics_helper import record_hash_seconds
+
+
+# Init password context
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+def _timed_hash(password: str) -> Tuple[str, float, float]:
+    # Runs inside the worker, returns the hash with its start and end wall-clock times
+    started_at = time.time()
+    hashed_password = pwd_context.hash(password)
+    return hashed_password, started_at, time.time()
+
+
+def _timed_verify(plain_password: str, hashed_password: str) -> Tuple[bool, float, float]:
+    started_at = time.time()
+    try:
+        valid = pwd_context.verify(plain_password, hashed_password)
+    except Exception as e:
+        logger.error("Failed to verify password due to error: %s", e)
+        valid = False
+    return valid, started_at, time.time()
+
+
+class HashingMetrics:
+    def __init__(self):
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.in_flight = 0
+        self.queue_wait_seconds_total = 0.0
+        self.queue_wait_seconds_max = 0.0
+        self.hash_seconds_total = 0.0
+        self.hash_seconds_max = 0.0
+
+
+    def observe(self, queue_wait: float, hash_time: float) -> None:
+        self.completed += 1
+        self.queue_wait_seconds_total += queue_wait
+        self.queue_wait_seconds_max = max(self.queue_wait_seconds_max, queue_wait)
+        self.hash_seconds_total += hash_time
+        self.hash_seconds_max = max(self.hash_seconds_max, hash_time)
+
+
+    def snapshot(self) -> dict:
+        completed = self.completed or 1
+        return {
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'rejected': self.rejected,
+            'in_flight': self.in_flight,
+            'queue_wait_seconds_total': self.queue_wait_seconds_total,
+            'queue_wait_seconds_avg': self.queue_wait_seconds_total / completed,
+            'queue_wait_seconds_max': self.queue_wait_seconds_max,
+            'hash_seconds_total': self.hash_seconds_total,
+            'hash_seconds_avg': self.hash_seconds_total / completed,
+            'hash_seconds_max': self.hash_seconds_max,
+        }
+
+
+class PasswordHasher:
+    def __init__(self, executor: str = 'thread', workers: int = 0, max_queue: int = 64, retry_after_seconds: int = 1):
+        self.executor_type = executor
+        self.workers = workers if workers > 0 else (os.cpu_count() or 1)
+        self.max_queue = max_queue
+        self.retry_after_seconds = retry_after_seconds
+        self.metrics = HashingMetrics()
+        self._executor: Optional[Executor] = None
+
+
+    @property
+    def capacity(self) -> int:
+        # Jobs being hashed plus jobs allowed to wait for a worker
+        return self.workers + self.max_queue
+
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            logger.info("Starting %s password hashing pool with %s workers", self.executor_type, self.workers)
+            if self.executor_type == 'process':
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-hasher')
+        return self._executor
+
+
+    async def _submit(self, fn, *args) -> Any:
+        # Reject immediately instead of queueing unbounded work
+        if self.metrics.in_flight >= self.capacity:
+            self.metrics.rejected += 1
+            logger.warning("Password hashing pool saturated, rejecting request")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server busy, please retry",
+                headers={"Retry-After": str(self.retry_after_seconds)},
+            )
+
+        self.metrics.submitted += 1
+        self.metrics.in_flight += 1
+        submitted_at = time.time()
+        try:
+            loop = asyncio.get_running_loop()
+            result, started_at, finished_at = await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self.metrics.in_flight -= 1
+
+        self.metrics.observe(queue_wait=max(started_at - submitted_at, 0.0), hash_time=finished_at - started_at)
+        record_hash_seconds(finished_at - started_at)
+        return result
+
+
+    async def hash(self, password: str) -> str:
+        return await self._submit(_timed_hash, password)
+
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._submit(_timed_verify, plain_password, hashed_password)
+
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            logger.info("Shutting down password hashing pool")
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+# Process-wide hasher, created from the settings on first use
+_password_hasher: Optional[PasswordHasher] = None
+
+
+def get_password_hasher() -> PasswordHasher:
+    global _password_hasher
+    if _password_hasher is None:
+        settings = get_config().hashing
+        _password_hasher = PasswordHasher(
+            executor=settings.executor,
+            workers=settings.workers,
+            max_queue=settings.max_queue,
+            retry_after_seconds=settings.retry_after_seconds,
+        )
+    return _password_hasher
+
+
+def shutdown_password_hasher() -> None:
+    global _password_hasher
+    if _password_hasher is not None:
+        _password_hasher.shutdown()
+        _password_hasher = None
@@ -0,0 +1,128 @@
+from datetime import datetime, timezone
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional
+import hashlib
+
+from jose import jwk
+from jose.backends.base import Key
+from jose.constants import ALGORITHMS
+import orjson
+
+from app.core.configuration import SigningKeySettings, SigningSettings
+from app.utils.config_helper import get_config
+from app.utils.logging_helper import logger
+
+
+ASYMMETRIC_ALGORITHMS = ALGORITHMS.RSA_DS | ALGORITHMS.EC_DS
+EPOCH = datetime.min.replace(tzinfo=timezone.utc)
+
+
+class SigningKey:
+    def __init__(self, kid: str, algorithm: str, public_key: Key, private_key: Optional[Key] = None, active_from: Optional[datetime] = None):
+        self.kid = kid
+        self.algorithm = algorithm
+        self.public_key = public_key
+        self.private_key = private_key
+        self.active_from = active_from or EPOCH
+        # Public JWK as published in the JWKS
+        self.jwk = {**public_key.to_dict(), 'kid': kid, 'use': 'sig'}
+
+
+class Keyring:
+    """Parsed signing keys by kid.
+
+    The PEM files are parsed once per settings snapshot, signing and verification reuse the key
+    objects. The latest key past its active_from signs; every key, upcoming and retired ones
+    included, is published in the JWKS and verifies the tokens carrying its kid.
+    """
+
+    def __init__(self, algorithm: str, keys: List[SigningKey]):
+        self.algorithm = algorithm
+        self.keys: Dict[str, SigningKey] = {key.kid: key for key in keys}
+        self._signing_keys = sorted((key for key in keys if key.private_key is not None), key=lambda key: key.active_from, reverse=True)
+        # Served as is on every JWKS request
+        self.jwks = orjson.dumps({'keys': [key.jwk for key in keys]})
+        self.jwks_etag = f'"{hashlib.sha256(self.jwks).hexdigest()[:32]}"'
+
+
+    def get_signing_key(self, now: Optional[datetime] = None) -> SigningKey:
+        now = now or datetime.now(timezone.utc)
+        for key in self._signing_keys:
+            if key.active_from <= now:
+                return key
+        raise ValueError("No signing key is active yet")
+
+
+    def get_verifying_key(self, kid: Optional[str]) -> Optional[Key]:
+        key = self.keys.get(kid)
+        return key.public_key if key is not None else None
+
+
+def _parse_active_from(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    active_from = datetime.fromisoformat(value)
+    # Times without an offset are UTC
+    return active_from if active_from.tzinfo else active_from.replace(tzinfo=timezone.utc)
+
+
+def _load_signing_key(algorithm: str, key_settings: SigningKeySettings) -> SigningKey:
+    if key_settings.private_key_path:
+        private_key = jwk.construct(Path(key_settings.private_key_path).read_bytes(), algorithm)
+        public_key = private_key.public_key()
+    elif key_settings.public_key_path:
+        private_key = None
+        public_key = jwk.construct(Path(key_settings.public_key_path).read_bytes(), algorithm)
+    else:
+        raise ValueError(f"Signing key {key_settings.kid} has no private_key_path or public_key_path")
+
+    return SigningKey(
+        kid=key_settings.kid,
+        algorithm=algorithm,
+        public_key=public_key,
+        private_key=private_key,
+        active_from=_parse_active_from(key_settings.active_from),
+    )
+
+
+def load_keyring(settings: SigningSettings) -> Optional[Keyring]:
+    if not settings.algorithm:
+        return None
+    if settings.algorithm not in ASYMMETRIC_ALGORITHMS:
+        raise ValueError(f"Unsupported signing algorithm: {settings.algorithm}, expected one of {sorted(ASYMMETRIC_ALGORITHMS)}")
+
+    kids = [key_settings.kid for key_settings in settings.keys]
+    if len(set(kids)) != len(kids):
+        raise ValueError(f"Duplicate signing key ids: {kids}")
+
+    keyring = Keyring(
+        algorithm=settings.algorithm,
+        keys=[_load_signing_key(settings.algorithm, key_settings) for key_settings in settings.keys],
+    )
+    # Fail on startup or reload rather than on the first login
+    signing_key = keyring.get_signing_key()
+    logger.info("Loaded %s %s signing keys, signing with %s", len(keyring.keys), settings.algorithm, signing_key.kid)
+    return keyring
+
+
+@lru_cache(maxsize=16)
+def get_secret_key(secret: str, algorithm: str) -> Key:
+    # Key object of a shared secret, built once per secret
+    return jwk.construct(secret, algorithm)
+
+
+# Keyring of the current settings snapshot. None when the access tokens use the shared secret.
+_keyring: Optional[Keyring] = None
+_keyring_settings: Optional[SigningSettings] = None
+
+
+def get_keyring(settings: Optional[SigningSettings] = None) -> Optional[Keyring]:
+    global _keyring, _keyring_settings
+    settings = settings or get_config().signing
+    if settings is not _keyring_settings:
+        # A reload that leaves the signing section as it was keeps the parsed keys
+        if settings != _keyring_settings:
+            _keyring = load_keyring(settings)
+        _keyring_settings = settings
+    return _keyring
@@ -0,0 +1,219 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+import math
+import time
+
+from fastapi import Depends, HTTPException, Request, status
+
+from app.core.configuration import RateLimitSettings
+from app.core.security import get_current_account
+from app.schemas.account import AccountLogin, AccountSnapshot
+from app.utils.config_helper import get_config
+from app.utils.logging_helper import logger
+
+
+PERIOD_SECONDS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+# Buckets of the rate limit settings, keyed like the settings fields
+LIMIT_SCOPES = ('ip', 'account', 'login_ip', 'login_account', 'register_ip')
+
+
+@dataclass(frozen=True)
+class BucketLimit:
+    capacity: float
+    refill_per_second: float
+
+
+def parse_limit(value: Optional[str]) -> Optional[BucketLimit]:
+    # "<requests>/<period>", a full bucket allows a burst of all of them
+    if not value:
+        return None
+    count, _, period = value.partition('/')
+    if period not in PERIOD_SECONDS or not count.strip().isdigit() or int(count) <= 0:
+        raise ValueError(f"Invalid rate limit: {value}, expected <requests>/<{'|'.join(PERIOD_SECONDS)}>")
+    return BucketLimit(capacity=float(count), refill_per_second=int(count) / PERIOD_SECONDS[period])
+
+
+class RateLimitBackend(ABC):
+    """Storage of the token buckets.
+
+    hit takes a token from the bucket of the key and returns 0 when there was one, otherwise the
+    seconds until there will be. A backend shared by several nodes, e.g on Redis, has to refill
+    and take in one atomic step on the server, such as a Lua script over the same two values the
+    memory backend keeps: the tokens left and when they were counted.
+    """
+
+    @abstractmethod
+    async def hit(self, key: str, limit: BucketLimit) -> float:
+        ...
+
+
+    def snapshot(self) -> dict:
+        return {}
+
+
+    async def close(self) -> None:
+        pass
+
+
+class MemoryRateLimitBackend(RateLimitBackend):
+    """Buckets of this worker in an LRU, so memory stays bounded however many clients show up.
+
+    An evicted bucket comes back full, only keys that went quiet long enough to be the least
+    recently used are evicted.
+    """
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max(max_keys, 1)
+        self.evictions = 0
+        self._buckets: "OrderedDict[str, List[float]]" = OrderedDict()
+
+
+    def take(self, key: str, limit: BucketLimit) -> float:
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [limit.capacity, now]
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+                self.evictions += 1
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(limit.capacity, bucket[0] + (now - bucket[1]) * limit.refill_per_second)
+            bucket[1] = now
+
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0.0
+        return (1 - bucket[0]) / limit.refill_per_second
+
+
+    async def hit(self, key: str, limit: BucketLimit) -> float:
+        return self.take(key, limit)
+
+
+    def snapshot(self) -> dict:
+        return {
+            'keys': len(self._buckets),
+            'evictions': self.evictions,
+        }
+
+
+# Backend factories by the name used in rate_limit.backend. Multi-node deployments register
+# their shared backend here before the first request.
+RATE_LIMIT_BACKENDS: Dict[str, Callable[[RateLimitSettings], RateLimitBackend]] = {
+    'memory': lambda settings: MemoryRateLimitBackend(max_keys=settings.max_keys),
+}
+
+
+def register_rate_limit_backend(name: str, factory: Callable[[RateLimitSettings], RateLimitBackend]) -> None:
+    RATE_LIMIT_BACKENDS[name] = factory
+
+
+class RateLimitMetrics:
+    def __init__(self):
+        self.allowed = 0
+        self.limited = 0
+
+
+    def snapshot(self) -> dict:
+        return {
+            'allowed': self.allowed,
+            'limited': self.limited,
+        }
+
+
+class RateLimiter:
+    def __init__(self, backend: RateLimitBackend, limits: Dict[str, Optional[BucketLimit]]):
+        self.backend = backend
+        self.limits = limits
+        self.metrics = RateLimitMetrics()
+
+
+    async def check(self, scope: str, route: str, identity: str) -> None:
+        limit = self.limits.get(scope)
+        if limit is None:
+            return
+
+        retry_after = await self.backend.hit(f"{scope}:{route}:{identity}", limit)
+        if retry_after <= 0:
+            self.metrics.allowed += 1
+            return
+
+        self.metrics.limited += 1
+        logger.warning("Rate limited %s %s on %s", scope, identity, route)
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many requests, please retry later",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+
+
+# Process-wide rate limiter, created from the settings on first use. None when disabled.
+_rate_limiter: Optional[RateLimiter] = None
+_rate_limiter_loaded = False
+
+
+def get_rate_limiter() -> Optional[RateLimiter]:
+    global _rate_limiter, _rate_limiter_loaded
+    if not _rate_limiter_loaded:
+        settings = get_config().rate_limit
+        if settings.enabled:
+            factory = RATE_LIMIT_BACKENDS.get(settings.backend)
+            if factory is None:
+                raise ValueError(f"Unknown rate limit backend: {settings.backend}")
+            _rate_limiter = RateLimiter(
+                backend=factory(settings),
+                limits={scope: parse_limit(getattr(settings, scope)) for scope in LIMIT_SCOPES},
+            )
+        _rate_limiter_loaded = True
+    return _rate_limiter
+
+
+async def stop_rate_limiter() -> None:
+    global _rate_limiter, _rate_limiter_loaded
+    if _rate_limiter is not None:
+        await _rate_limiter.backend.close()
+    _rate_limiter = None
+    _rate_limiter_loaded = False
+
+
+def get_route_key(request: Request) -> str:
+    # The route template, so /tasks/1 and /tasks/2 share a bucket
+    return f"{request.method} {getattr(request.scope.get('route'), 'path', request.url.path)}"
+
+
+def get_client_ip(request: Request) -> str:
+    # Behind a trusted proxy uvicorn has already swapped in the forwarded client address
+    return request.client.host if request.client else 'unknown'
+
+
+async def limit_by_ip(request: Request) -> None:
+    # App-wide dependency, runs before authentication and any route dependency
+    rate_limiter = get_rate_limiter()
+    if rate_limiter is not None:
+        await rate_limiter.check('ip', get_route_key(request), get_client_ip(request))
+
+
+async def limit_by_account(request: Request, current_account: AccountSnapshot = Depends(get_current_account)) -> None:
+    rate_limiter = get_rate_limiter()
+    if rate_limiter is not None:
+        await rate_limiter.check('account', get_route_key(request), str(current_account.id))
+
+
+async def limit_login(request: Request, credentials: AccountLogin) -> None:
+    # Keyed by the submitted email, so guessing one account's password from many addresses is capped
+    # too. Runs before the account lookup and the bcrypt verify.
+    rate_limiter = get_rate_limiter()
+    if rate_limiter is not None:
+        route = get_route_key(request)
+        await rate_limiter.check('login_ip', route, get_client_ip(request))
+        await rate_limiter.check('login_account', route, credentials.email.lower())
+
+
+async def limit_register(request: Request) -> None:
+    rate_limiter = get_rate_limiter()
+    if rate_limiter is not None:
+        await rate_limiter.check('register_ip', get_route_key(request), get_client_ip(request))
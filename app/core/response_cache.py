@@ -0,0 +1,137 @@
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Set, Tuple
+
+from app.utils.config_helper import get_config
+from app.utils.logging_helper import logger
+
+
+class CachedResponse:
+    __slots__ = ('account_id', 'version', 'body', 'headers')
+
+    def __init__(self, account_id: int, version: int, body: bytes, headers: Dict[str, str]):
+        self.account_id = account_id
+        self.version = version
+        self.body = body
+        self.headers = headers
+
+
+class ResponseCacheMetrics:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.invalidations = 0
+
+
+    def snapshot(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'stale': self.stale,
+            'invalidations': self.invalidations,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+        }
+
+
+class ResponseCache:
+    """LRU of serialized read responses, each tagged with the version it was rendered from.
+
+    A lookup only hits when the caller's freshly read version matches, so entries written by
+    another worker never serve stale data. Local writes also drop their account's entries.
+    """
+
+    def __init__(self, max_entries: int = 10000, max_body_bytes: int = 262144):
+        self.max_entries = max_entries
+        self.max_body_bytes = max_body_bytes
+        self.metrics = ResponseCacheMetrics()
+        self._entries: "OrderedDict[Tuple[int, Hashable], CachedResponse]" = OrderedDict()
+        self._account_keys: Dict[int, Set[Tuple[int, Hashable]]] = {}
+
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+
+    def get(self, account_id: int, key: Hashable, version: int) -> Optional[CachedResponse]:
+        entry = self._entries.get((account_id, key))
+        if entry is None:
+            self.metrics.misses += 1
+            return None
+
+        if entry.version != version:
+            self.metrics.stale += 1
+            self.metrics.misses += 1
+            self._remove((account_id, key))
+            return None
+
+        self.metrics.hits += 1
+        self._entries.move_to_end((account_id, key))
+        return entry
+
+
+    def put(self, account_id: int, key: Hashable, version: int, body: bytes, headers: Optional[Dict[str, str]] = None) -> None:
+        if not self.enabled or len(body) > self.max_body_bytes:
+            return
+
+        cache_key = (account_id, key)
+        self._remove(cache_key)
+        self._entries[cache_key] = CachedResponse(account_id=account_id, version=version, body=body, headers=headers or {})
+        self._account_keys.setdefault(account_id, set()).add(cache_key)
+
+        # Evict the least recently used entries
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+
+    def invalidate_account(self, account_id: int) -> None:
+        cache_keys = self._account_keys.pop(account_id, None)
+        if not cache_keys:
+            return
+
+        self.metrics.invalidations += 1
+        logger.info("Invalidating %s cached responses for account: %s", len(cache_keys), account_id)
+        for cache_key in cache_keys:
+            self._entries.pop(cache_key, None)
+
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._account_keys.clear()
+
+
+    def _remove(self, cache_key: Tuple[int, Hashable]) -> None:
+        entry = self._entries.pop(cache_key, None)
+        if entry is None:
+            return
+
+        cache_keys = self._account_keys.get(entry.account_id)
+        if cache_keys is not None:
+            cache_keys.discard(cache_key)
+            if not cache_keys:
+                del self._account_keys[entry.account_id]
+
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# Process-wide response cache, created from the settings on first use
+_response_cache: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> ResponseCache:
+    global _response_cache
+    if _response_cache is None:
+        settings = get_config().response_cache
+        _response_cache = ResponseCache(
+            max_entries=settings.max_entries if settings.enabled else 0,
+            max_body_bytes=settings.max_body_bytes,
+        )
+    return _response_cache
+
+
+def invalidate_account_responses(account_id: int) -> None:
+    if _response_cache is not None:
+        _response_cache.invalidate_account(account_id)
@@ -1,22 +1,23 @@
-from passlib.context import CryptContext
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Annotated
+import time
 from app.schemas.token import TokenData
-from app.utils.db_helper import get_db
+from app.utils.db_helper import get_read_db
 from app.utils.logging_helper import logger
 from fastapi import Depends, HTTPException, status, Header
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.schemas import account
 from app.models import account as account_model
-from app.utils.config_helper import get_config
+from app.utils.config_helper import get_settings
+from app.core.configuration import Settings
+from app.enums.account_enum import AccountRoleEnum
+from app.core.hashing import get_password_hasher
+from app.core.token_cache import get_token_cache
+from app.core.keyring import Keyring, SigningKey, get_keyring, get_secret_key
+from app.utils.metrics_helper import record_jwt_seconds
 
-from omegaconf import DictConfig
-
-
-# Init password context
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 # Set credential exception
 credentials_exception = HTTPException(
@@ -26,33 +27,31 @@ credentials_exception = HTTPException(
     )
 
 
-def verify_password(plain_password, hashed_password) -> bool:
-    try:
-        return pwd_context.verify(plain_password, hashed_password)
-    except Exception as e:
-        logger.error(f"Failed to verify password due to error: {str(e)}")
+async def verify_password(plain_password, hashed_password) -> bool:
+    # Runs on the password hashing pool so bcrypt never blocks the event loop
+    return await get_password_hasher().verify(plain_password, hashed_password)
 
 
-def get_password_hash(password) -> str:
-    return pwd_context.hash(password)
+async def get_password_hash(password) -> str:
+    return await get_password_hasher().hash(password)
 
 
-async def authenticate_account(db: Session, credentials: account.AccountLogin) -> account_model.Account:
+async def authenticate_account(db: AsyncSession, credentials: account.AccountLogin) -> account_model.Account:
     # Check if account exists
-    logger.info(f"Checking if account with email: {credentials.email} exists")
+    logger.info("Checking if account with email: %s exists", credentials.email)
     account_exist = await account.Account.get_account_by_email(db=db, email=credentials.email)
     if not account_exist:
-        logger.warning(f"Account with email: {credentials.email} not found")
+        logger.warning("Account with email: %s not found", credentials.email)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid email"
         )
     
-    logger.info(f"Account with email: {credentials.email} found")
+    logger.info("Account with email: %s found", credentials.email)
 
     # Verify password
-    logger.info(f"Verifying password for account with id: {account_exist.id}")
-    valid_password = verify_password(hashed_password=account_exist.hashed_password, plain_password=credentials.password.get_secret_value())
+    logger.info("Verifying password for account with id: %s", account_exist.id)
+    valid_password = await verify_password(hashed_password=account_exist.hashed_password, plain_password=credentials.password.get_secret_value())
     if not valid_password:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -73,9 +72,9 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 
-def get_authorization_token(authorization: Annotated[str, Header()], config: DictConfig = Depends(get_config)) -> str:
+async def get_authorization_token(authorization: Annotated[str, Header()], config: Settings = Depends(get_settings)) -> str:
     # Split authorization token into token type and access token
-    logger.info(f"Spliting authorization token into token type and access token")
+    logger.info("Spliting authorization token into token type and access token")
     token_type, token = authorization.split(' ')
 
     # Check if token type is valid
@@ -86,29 +85,52 @@ def get_authorization_token(authorization: Annotated[str, Header()], config: Dic
     return token
 
 
-async def get_current_account(db: Session = Depends(get_db), token: str = Depends(get_authorization_token), config: DictConfig = Depends(get_config)) -> account_model.Account:
+async def get_current_account(db: AsyncSession = Depends(get_read_db), token: str = Depends(get_authorization_token), config: Settings = Depends(get_settings)) -> account.AccountSnapshot:
+    # Serve hot clients from the verified token cache, no decode and no account load. The cache is
+    # per worker, so unless turned off the auth state is re-read on every hit: a logout, delete or
+    # role change made through another worker or node takes effect at once.
+    token_cache = get_token_cache()
+    cached_token = token_cache.get(token)
+    if cached_token is not None:
+        cached_account = cached_token.account
+        if not config.token_cache.recheck_auth_state:
+            return cached_account
+        auth_state = await account.Account.get_account_auth_state(db=db, account_id=cached_account.id)
+        if auth_state is None:
+            token_cache.invalidate_account(cached_account.id)
+            raise credentials_exception
+        if tuple(auth_state) == (cached_account.is_active, cached_account.role):
+            return cached_account
+        # Changed elsewhere, drop the stale snapshots and load the account again
+        token_cache.invalidate_account(cached_account.id)
+
     # Verify token
-    logger.info(f"Verifying token")
-    payload = verify_token(token=token, secret=config.app.access_token_secret, config=config)
+    logger.info("Verifying token")
+    payload = verify_token(token=token, secret=config.app.access_token_secret, config=config, keyring=get_keyring(config.signing))
     if not payload:
         # Invalid token
-        logger.warning(f"Failed to decode token")
+        logger.warning("Failed to decode token")
         raise credentials_exception
     
     # Get account id
     logger.info('Fetchin account id from token payload')
     account_id = payload.get('id')
+    generation = token_cache.generation(account_id)
 
     # Get account with id
-    logger.info(f"Fetching account with id: {account_id}")
+    logger.info("Fetching account with id: %s", account_id)
     account_db = await account.Account.get_acccount_by_id(account_id=account_id, db=db)
     if account_db is None:
-        logger.warn(f"Account: {account_id} not found in database")
+        logger.warning("Account: %s not found in database", account_id)
         raise credentials_exception
-    return account_db
+
+    # Cache the verified claims with a compact account snapshot
+    account_snapshot = account.AccountSnapshot.model_validate(account_db)
+    token_cache.put(token=token, claims=payload, account=account_snapshot, generation=generation)
+    return account_snapshot
 
 
-async def get_current_active_account(current_account: account_model.Account = Depends(get_current_account)) -> account_model.Account:
+async def get_current_active_account(current_account: account.AccountSnapshot = Depends(get_current_account)) -> account.AccountSnapshot:
     if not current_account.is_active:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, 
@@ -118,25 +140,41 @@ async def get_current_active_account(current_account: account_model.Account = De
     return current_account
 
 
-def generate_jwt_token(payload: dict, secret: str, config: DictConfig):
-    # Encode token
+async def get_current_admin_account(current_account: account.AccountSnapshot = Depends(get_current_active_account)) -> account.AccountSnapshot:
+    if current_account.role != AccountRoleEnum.admin.value:
+        logger.warning("Account: %s attempted an admin operation", current_account.id)
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin privileges required",
+        )
+
+    return current_account
+
+
+def generate_jwt_token(payload: dict, secret: str, config: Settings, signing_key: Optional[SigningKey] = None):
+    # Encode token, with the keyring key when given and its kid in the header
+    started_at = time.perf_counter()
     try:
-        logger.info(f"Encoding token")
-        return jwt.encode(claims=payload, key=secret, algorithm=config.app.token_algorithm)
+        logger.info("Encoding token")
+        if signing_key is not None:
+            return jwt.encode(claims=payload, key=signing_key.private_key, algorithm=signing_key.algorithm, headers={'kid': signing_key.kid})
+        return jwt.encode(claims=payload, key=get_secret_key(secret, config.app.token_algorithm), algorithm=config.app.token_algorithm)
     except JWTError as err:
-        logger.error(f'Failed to create token due to error: {str(err)}')
+        logger.error('Failed to create token due to error: %s', err)
     except Exception as e:
-        logger.error(f'Failed to create token due to error: {str(e)}')
+        logger.error('Failed to create token due to error: %s', e)
+    finally:
+        record_jwt_seconds(time.perf_counter() - started_at)
 
 
-def get_access_and_refresh_tokens(config: DictConfig, account_data: dict):
+def get_access_and_refresh_tokens(config: Settings, account_data: dict):
     # Create token expiry
-    logger.info(f"Creating access and refresh token expiration for account: {account_data.get('id')}")
+    logger.info("Creating access and refresh token expiration for account: %s", account_data.get('id'))
     access_token_exp = datetime.utcnow() + timedelta(seconds=config.app.access_token_expiry_seconds)
     refresh_token_exp = datetime.utcnow() + timedelta(seconds=config.app.refresh_token_expiry_seconds)
     
     # Create access token payload
-    logger.info(f"Creating access token payload for account {account_data.get('id')}")
+    logger.info("Creating access token payload for account %s", account_data.get('id'))
     payload_access_token = {
         'iss': config.app.token_iss,
         'aud': config.app.token_aud,
@@ -149,7 +187,7 @@ def get_access_and_refresh_tokens(config: DictConfig, account_data: dict):
     }
 
     # Create refresh token payload
-    logger.info(f"Creating refresh token payload for account {account_data.get('id')}")
+    logger.info("Creating refresh token payload for account %s", account_data.get('id'))
     payload_refresh_token = {
         'iss': config.app.token_iss,
         'aud': config.app.token_aud,
@@ -162,31 +200,50 @@ def get_access_and_refresh_tokens(config: DictConfig, account_data: dict):
     }
     
     # Generate access token
-    logger.info(f"Generating access token for account {account_data.get('id')}")
-    access_token = generate_jwt_token(payload=payload_access_token, secret=config.app.access_token_secret, config=config)
+    logger.info("Generating access token for account %s", account_data.get('id'))
+    keyring = get_keyring(config.signing)
+    access_token = generate_jwt_token(
+        payload=payload_access_token,
+        secret=config.app.access_token_secret,
+        config=config,
+        signing_key=keyring.get_signing_key() if keyring is not None else None,
+    )
     
     # Generate refresh token
-    logger.info(f"Generating refresh token for account {account_data.get('id')}")    
+    logger.info("Generating refresh token for account %s", account_data.get('id'))    
     refresh_token = generate_jwt_token(payload=payload_refresh_token, secret=config.app.refresh_token_secret, config=config)
 
     return access_token, refresh_token
 
 
-def verify_token(token: str, secret: str, config: DictConfig) -> dict:
+def verify_token(token: str, secret: str, config: Settings, keyring: Optional[Keyring] = None) -> dict:
+    started_at = time.perf_counter()
     try:
-        logger.info(f"Decoding token")
+        if keyring is not None:
+            # Tokens of an unknown or removed kid fail
+            key = keyring.get_verifying_key(jwt.get_unverified_header(token).get('kid'))
+            if key is None:
+                raise JWTError("Unknown signing key")
+            algorithm = keyring.algorithm
+        else:
+            key = get_secret_key(secret, config.app.token_algorithm)
+            algorithm = config.app.token_algorithm
+
+        logger.info("Decoding token")
         payload = jwt.decode(
             token=token, 
-            key=secret, 
-            algorithms=config.app.token_algorithm, 
+            key=key, 
+            algorithms=algorithm, 
             audience=config.app.token_aud,
             subject=config.app.token_sub,
             issuer=config.app.token_iss
             ) 
 
-        logger.info(f"Token: decoded successfully")
+        logger.info("Token: decoded successfully")
         return payload
     except JWTError as err:
-        logger.error(f'Failed to verify token due to error: {str(err)}')
+        logger.error('Failed to verify token due to error: %s', err)
         raise credentials_exception
+    finally:
+        record_jwt_seconds(time.perf_counter() - started_at)
     
@@ -0,0 +1,134 @@
+from collections import OrderedDict
+from typing import Dict, Optional, Set
+import hashlib
+import time
+
+from pydantic import BaseModel
+from app.utils.config_helper import get_config
+from app.utils.logging_helper import logger
+
+
+class CachedToken:
+    __slots__ = ('claims', 'account', 'expires_at')
+
+    def __init__(self, claims: dict, account: BaseModel, expires_at: float):
+        self.claims = claims
+        self.account = account
+        self.expires_at = expires_at
+
+
+class TokenCache:
+    def __init__(self, max_entries: int = 10000, ttl_seconds: int = 300):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, CachedToken]" = OrderedDict()
+        self._account_digests: Dict[int, Set[str]] = {}
+        # Bumped on every invalidation so a lookup racing with a write cannot cache stale state.
+        # Only the most recently invalidated accounts are kept. An evicted generation raises the
+        # floor every other account starts from, so a lookup that raced with it still misses.
+        self._account_generations: "OrderedDict[int, int]" = OrderedDict()
+        self._generation_floor = 0
+
+
+    @staticmethod
+    def _digest(token: str) -> str:
+        # Never keep the bearer token itself in memory
+        return hashlib.sha256(token.encode()).hexdigest()
+
+
+    def get(self, token: str) -> Optional[CachedToken]:
+        digest = self._digest(token)
+        entry = self._entries.get(digest)
+        if entry is None:
+            return None
+
+        # Drop entries past the token exp or the cache ttl
+        if entry.expires_at <= time.time():
+            self._remove(digest)
+            return None
+
+        self._entries.move_to_end(digest)
+        return entry
+
+
+    def generation(self, account_id: int) -> int:
+        return self._account_generations.get(account_id, self._generation_floor)
+
+
+    def put(self, token: str, claims: dict, account: BaseModel, generation: int) -> None:
+        if self.max_entries <= 0 or generation != self.generation(account.id):
+            return
+
+        expires_at = time.time() + self.ttl_seconds
+        token_exp = claims.get('exp')
+        if token_exp is not None:
+            expires_at = min(expires_at, float(token_exp))
+
+        digest = self._digest(token)
+        self._remove(digest)
+        self._entries[digest] = CachedToken(claims=claims, account=account, expires_at=expires_at)
+        self._account_digests.setdefault(account.id, set()).add(digest)
+
+        # Evict the least recently used entries
+        while len(self._entries) > self.max_entries:
+            oldest_digest = next(iter(self._entries))
+            self._remove(oldest_digest)
+
+
+    def invalidate_account(self, account_id: int) -> None:
+        self._account_generations[account_id] = self.generation(account_id) + 1
+        self._account_generations.move_to_end(account_id)
+        while len(self._account_generations) > self.max_entries:
+            _, evicted_generation = self._account_generations.popitem(last=False)
+            self._generation_floor = max(self._generation_floor, evicted_generation)
+
+        digests = self._account_digests.pop(account_id, None)
+        if not digests:
+            return
+
+        logger.info("Invalidating %s cached tokens for account: %s", len(digests), account_id)
+        for digest in digests:
+            self._entries.pop(digest, None)
+
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._account_digests.clear()
+        self._account_generations.clear()
+        self._generation_floor = 0
+
+
+    def _remove(self, digest: str) -> None:
+        entry = self._entries.pop(digest, None)
+        if entry is None:
+            return
+
+        digests = self._account_digests.get(entry.account.id)
+        if digests is not None:
+            digests.discard(digest)
+            if not digests:
+                del self._account_digests[entry.account.id]
+
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# Process-wide token cache, created from the settings on first use
+_token_cache: Optional[TokenCache] = None
+
+
+def get_token_cache() -> TokenCache:
+    global _token_cache
+    if _token_cache is None:
+        settings = get_config().token_cache
+        _token_cache = TokenCache(
+            max_entries=settings.max_entries if settings.enabled else 0,
+            ttl_seconds=settings.ttl_seconds,
+        )
+    return _token_cache
+
+
+def invalidate_account_tokens(account_id: int) -> None:
+    if _token_cache is not None:
+        _token_cache.invalidate_account(account_id)
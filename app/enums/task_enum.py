@@ -0,0 +1,9 @@
+from enum import Enum
+
+class TaskSortEnum(str, Enum):
+    id = 'id'
+    id_desc = '-id'
+    created_at = 'created_at'
+    created_at_desc = '-created_at'
+    start_time = 'start_time'
+    start_time_desc = '-start_time'
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, text
 from sqlalchemy.orm import relationship
 
 from datetime import datetime
@@ -21,5 +21,7 @@ class Account(Base):
     role = Column(String, index=True, default=AccountRoleEnum.guest.value, nullable=False)
     created_at = Column(DateTime(), default=datetime.now(), nullable=False, index=True)
     updated_at = Column(DateTime(), nullable=True)
+    # Bumped by every write to the account's tasks, drives the ETag of task lists
+    tasks_version = Column(Integer, default=0, server_default=text('0'), nullable=False)
 
     tasks = relationship("Task", back_populates="owner")
@@ -1,20 +1,33 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Index, text
 from sqlalchemy.orm import relationship
 from app.utils.init_db import Base
 from datetime import datetime
 
 
+# Single column indexes replaced by the composite owner indexes
+OBSOLETE_TASK_INDEXES = ('ix_tasks_id', 'ix_tasks_title', 'ix_tasks_description', 'ix_tasks_created_at', 'ix_tasks_start_time')
+
+
 class Task(Base):
     __tablename__ = 'tasks'
+    __table_args__ = (
+        # Every task query is scoped to an owner, so each index leads with owner_id
+        Index('ix_tasks_owner_id_id', 'owner_id', 'id'),
+        Index('ix_tasks_owner_id_completed_start_time', 'owner_id', 'completed', 'start_time'),
+        Index('ix_tasks_owner_id_start_time_id', 'owner_id', 'start_time', 'id'),
+        Index('ix_tasks_owner_id_created_at_id', 'owner_id', 'created_at', 'id'),
+    )
 
-    id = Column(Integer, primary_key=True, index=True)
-    title = Column(String, index=True, nullable=False)
-    description = Column(String, index=True, nullable=False)
+    id = Column(Integer, primary_key=True)
+    title = Column(String, nullable=False)
+    description = Column(String, nullable=False)
     completed = Column(Boolean, default=False, nullable=False)
-    created_at = Column(DateTime(), default=datetime.now(), nullable=False, index=True)
+    created_at = Column(DateTime(), default=datetime.now, nullable=False)
     updated_at = Column(DateTime(), nullable=True)
-    start_time = Column(DateTime(), default=datetime.now(), nullable=False, index=True)
+    start_time = Column(DateTime(), default=datetime.now(), nullable=False)
     stop_time = Column(DateTime(), nullable=True)
     owner_id = Column(Integer, ForeignKey("accounts.id"))
+    # Bumped by every update, drives the ETag and optimistic concurrency checks
+    version = Column(Integer, default=1, server_default=text('1'), nullable=False)
 
     owner = relationship("Account", back_populates="tasks")
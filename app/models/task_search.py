@@ -0,0 +1,43 @@
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+
+# FTS5 index over the task title and description, stored as an external content table
+# so the text is not duplicated. Triggers keep it in sync with every write to tasks,
+# including bulk and core statements that bypass the ORM.
+TASK_SEARCH_TABLE = 'tasks_fts'
+
+TASK_SEARCH_DDL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {TASK_SEARCH_TABLE} USING fts5(title, description, content='tasks', content_rowid='id')",
+    f"""CREATE TRIGGER IF NOT EXISTS tasks_fts_after_insert AFTER INSERT ON tasks BEGIN
+        INSERT INTO {TASK_SEARCH_TABLE}(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS tasks_fts_after_delete AFTER DELETE ON tasks BEGIN
+        INSERT INTO {TASK_SEARCH_TABLE}({TASK_SEARCH_TABLE}, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS tasks_fts_after_update AFTER UPDATE OF title, description ON tasks BEGIN
+        INSERT INTO {TASK_SEARCH_TABLE}({TASK_SEARCH_TABLE}, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO {TASK_SEARCH_TABLE}(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END""",
+)
+
+
+def supports_task_search_index(connection: Connection) -> bool:
+    return connection.dialect.name == 'sqlite'
+
+
+def create_task_search_index(connection: Connection) -> None:
+    if not supports_task_search_index(connection):
+        return
+
+    exists = connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {'name': TASK_SEARCH_TABLE}
+    ).first()
+
+    for statement in TASK_SEARCH_DDL:
+        connection.execute(text(statement))
+
+    # Index the tasks written before the search table existed
+    if not exists:
+        connection.execute(text(f"INSERT INTO {TASK_SEARCH_TABLE}({TASK_SEARCH_TABLE}) VALUES ('rebuild')"))
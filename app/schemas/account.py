@@ -3,11 +3,15 @@ from typing import List, Optional, Dict
 from datetime import datetime
 from enum import Enum
 
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update as update_query, delete, case
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.schemas import account, task
 from app.models.account import Account as model_account
 from app.models.task import Task as model_task
+from app.core.token_cache import invalidate_account_tokens
+from app.utils.db_writer_helper import run_after_commit
+from app.enums.account_enum import AccountRoleEnum
 
 
 class AccountBase(BaseModel):
@@ -46,69 +50,125 @@ class AccountInDBBase(AccountBase):
         from_attributes = True
 
 
+class AccountSnapshot(BaseModel):
+    id: int = Field(..., title='Account ID', description='Unique identifier for the account.', examples=[1])
+    email: str = Field(..., title='Email Address', description='Email address of the account user', examples=['joe@example.com'])
+    username: str = Field(..., title='Username', description="Username of the account user.", examples=['jc'])
+    first_name: str = Field(..., title='Firstname', description='Firstname of the account user.', examples=['Confidence'])
+    last_name: str = Field(..., title='Lastname', description='Lastname of the account user', examples=['James'])
+    avatar: Optional[str] = Field(None, title='Avatar Image', description='Link to the avatar image of the account user', examples=['https://example.com/image.jpg'])
+    role: str = Field(..., title='Account Role', description='Role of the account', examples=['Admin', 'Guest', 'User'])
+    is_active: bool = Field(..., title='IsActive', description='Active status of the account', examples=[False])
+
+    class Config:
+        from_attributes = True
+        frozen = True
+
+
 class Account:
     def __init__(self):
         pass
     
     @staticmethod
-    async def get_acccount_by_id(db: Session, account_id: int) -> model_account:
-        return db.query(model_account).filter(model_account.id == account_id).first()
+    async def get_acccount_by_id(db: AsyncSession, account_id: int) -> model_account:
+        result = await db.execute(select(model_account).filter(model_account.id == account_id))
+        return result.scalars().first()
+
+    @staticmethod
+    async def get_account_auth_state(db: AsyncSession, account_id: int) -> Optional[tuple]:
+        # (is_active, role) of the account, None once it is deleted. A primary key read of two columns.
+        result = await db.execute(select(model_account.is_active, model_account.role).where(model_account.id == account_id))
+        return result.first()
+
 
     @staticmethod
-    async def get_account_by_email(db: Session, email: str) -> model_account:
-        return db.query(model_account).filter(model_account.email == email).first()
+    async def get_account_by_email(db: AsyncSession, email: str) -> model_account:
+        result = await db.execute(select(model_account).filter(model_account.email == email))
+        return result.scalars().first()
 
 
     @staticmethod
-    async def get_account_by_username(db: Session, username: str) -> model_account:
-        return db.query(model_account).filter(model_account.username == username).first()
+    async def get_account_by_username(db: AsyncSession, username: str) -> model_account:
+        result = await db.execute(select(model_account).filter(model_account.username == username))
+        return result.scalars().first()
 
 
     @staticmethod
-    async def get_accounts(db: Session, skip: int = 0, limit: int = 50) -> List[model_account]:
-        return db.query(model_account).offset(skip).limit(limit).all()
+    async def get_accounts(db: AsyncSession, skip: int = 0, limit: int = 50) -> List[model_account]:
+        result = await db.execute(select(model_account).offset(skip).limit(limit))
+        return result.scalars().all()
 
 
     @staticmethod
-    async def create_account(db: Session, account: account.AccountCreate, hashed_password: str) -> model_account:
+    async def create_account(db: AsyncSession, account: account.AccountCreate, hashed_password: str) -> model_account:
         # Create account db object
         db_account = model_account(**account.model_dump(exclude_none=True, exclude={'password', 'avatar'}), hashed_password=hashed_password, avatar=str(account.avatar))
 
         # Add new account to db
         db.add(db_account)
-        db.commit()
-        db.refresh(db_account)
+        await db.commit()
+        await db.refresh(db_account)
 
         return db_account
     
 
     @staticmethod
-    async def update_account(db: Session, account_id: int, update: dict, hashed_password: Optional[str] = None) -> model_account:
-        if hashed_password:
-            
-            db.query(model_account).filter(model_account.id == account_id).update(values=update, hashed_password=hashed_password)
-        else:
-            db.query(model_account).filter(model_account.id == account_id).update(values=update)
-        
+    async def transition_account(db: AsyncSession, account_id: int, values: dict, *conditions) -> Optional[model_account]:
+        # Apply the change and read the account back in a single UPDATE ... RETURNING.
+        # Returns None when the account is missing or the extra conditions do not hold.
+        result = await db.execute(
+            update_query(model_account)
+            .where(model_account.id == account_id, *conditions)
+            .values(**values)
+            .returning(model_account)
+            .execution_options(populate_existing=True)
+        )
+        db_account = result.scalars().first()
+
         # Commit changes to db
-        db.commit()
+        await db.commit()
+        if db_account is not None:
+            run_after_commit(db, lambda: invalidate_account_tokens(account_id))
+        return db_account
+
 
-        return await Account.get_acccount_by_id(db=db, account_id=account_id)
+    @staticmethod
+    async def update_account(db: AsyncSession, account_id: int, update: dict, hashed_password: Optional[str] = None) -> model_account:
+        values = dict(update)
+        if hashed_password:
+            values['hashed_password'] = hashed_password
+
+        if not values:
+            return await Account.get_acccount_by_id(db=db, account_id=account_id)
+        return await Account.transition_account(db, account_id, values)
+
+
+    @staticmethod
+    async def login_account(db: AsyncSession, account_id: int) -> Optional[model_account]:
+        # Activate the account and promote guests to users, unless it is already active
+        return await Account.transition_account(
+            db,
+            account_id,
+            {
+                'is_active': True,
+                'role': case((model_account.role == AccountRoleEnum.guest.value, AccountRoleEnum.user.value), else_=model_account.role),
+            },
+            model_account.is_active.is_(False),
+        )
 
 
     @staticmethod
-    async def deactivate_account(db: Session, account_id: int) -> None:
-        db.query(model_account).filter(model_account.id == account_id).update(values={'is_active': False})
-        db.commit()
+    async def deactivate_account(db: AsyncSession, account_id: int) -> Optional[model_account]:
+        return await Account.transition_account(db, account_id, {'is_active': False})
 
 
     @staticmethod
-    async def activate_account(db: Session, account_id: int) -> None:
-        db.query(model_account).filter(model_account.id == account_id).update(values={'is_active': True})
-        db.commit()
+    async def activate_account(db: AsyncSession, account_id: int) -> Optional[model_account]:
+        return await Account.transition_account(db, account_id, {'is_active': True})
 
 
     @staticmethod
-    async def delete_account(db: Session, account_id: int) -> None:
-        db.query(model_account).filter(model_account.id == account_id).delete()
-        db.commit()
\ No newline at end of file
+    async def delete_account(db: AsyncSession, account_id: int) -> None:
+        await db.execute(delete(model_account).filter(model_account.id == account_id))
+        await db.commit()
+        run_after_commit(db, lambda: invalidate_account_tokens(account_id))
@@ -2,13 +2,17 @@ from pydantic import BaseModel, Field
 from datetime import datetime
 from typing import Optional
 
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update as update_query, delete, and_, or_, tuple_, text, literal, literal_column, table, column
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.schemas import task, account
 from app.models.task import Task as model_task
+from app.models.account import Account as model_account
+from app.models.task_search import TASK_SEARCH_TABLE
 from app.utils.logging_helper import logger
+from app.enums.task_enum import TaskSortEnum
 
-from typing import List
+from typing import List, AsyncIterator, Any, Tuple, Dict, Sequence
 
 
 
@@ -31,53 +35,370 @@ class TaskUpdate(BaseModel):
 
 
 
+class TaskFilter(BaseModel):
+    completed: Optional[bool] = Field(None, title='Completed', description='Only tasks with this completion status', examples=[False])
+    start_time_from: Optional[datetime] = Field(None, title='Start Time From', description='Only tasks starting at or after this time', examples=['2024-05-17T00:00:00'])
+    start_time_to: Optional[datetime] = Field(None, title='Start Time To', description='Only tasks starting before this time', examples=['2024-05-18T00:00:00'])
+    stop_time_from: Optional[datetime] = Field(None, title='Stop Time From', description='Only tasks ending at or after this time', examples=['2024-05-17T00:00:00'])
+    stop_time_to: Optional[datetime] = Field(None, title='Stop Time To', description='Only tasks ending before this time', examples=['2024-05-18T00:00:00'])
+    created_at_from: Optional[datetime] = Field(None, title='Created At From', description='Only tasks created at or after this time', examples=['2024-05-17T00:00:00'])
+    created_at_to: Optional[datetime] = Field(None, title='Created At To', description='Only tasks created before this time', examples=['2024-05-18T00:00:00'])
+
+
+class TaskBulkUpdate(TaskUpdate):
+    id: int = Field(..., title='Task ID', description='Unique identifier of the task to update', examples=[1])
+
+
+class TaskBulkDelete(BaseModel):
+    ids: List[int] = Field(..., title='Task IDs', description='Unique identifiers of the tasks to delete', examples=[[1, 2, 3]])
+
+
+class BulkItemResult(BaseModel):
+    index: int = Field(..., title='Item Index', description='Position of the item in the request batch', examples=[0])
+    id: Optional[int] = Field(None, title='Task ID', description='Unique identifier of the affected task', examples=[1])
+    version: Optional[int] = Field(None, title='Version', description='Version of the task after the item was applied, for If-Match', examples=[2])
+    status: str = Field(..., title='Item Status', description='Outcome of the item', examples=['created', 'updated', 'deleted', 'not_found', 'invalid'])
+    detail: Optional[str] = Field(None, title='Item Detail', description='Reason the item was not applied', examples=['Task not found'])
+
+
+class BulkResult(BaseModel):
+    succeeded: int = Field(..., title='Succeeded', description='Number of items applied', examples=[2])
+    failed: int = Field(..., title='Failed', description='Number of items not applied', examples=[0])
+    items: List[BulkItemResult] = Field(..., title='Items', description='Per item results in request order')
+
+
 class TaskInDB(TaskBase):
     id: int = Field(..., title='Task ID', description='Unique identifier for the task')
     completed: bool = Field(..., title='Task Completed', description='Completion status of the task', examples=[True])
+    version: int = Field(..., title='Task Version', description='Incremented on every update of the task', examples=[1])
   
     class Config:
         from_attributes = True
 
 
+# Response fields of a task in order, read as plain rows by the hot read endpoints
+TASK_RESPONSE_COLUMNS = tuple(TaskInDB.model_fields)
+
+# Escape character of the LIKE patterns built from search terms
+LIKE_ESCAPE = '\\'
+
+
 class Task:
     def __init__(self):
         pass
 
 
     @staticmethod
-    async def get_task_by_id(db: Session, task_id: int, account_id: int) -> model_task:
-        return db.query(model_task).filter(model_task.id == task_id and model_task.owner_id == account_id).first()
+    async def get_task_by_id(db: AsyncSession, task_id: int, account_id: int) -> model_task:
+        result = await db.execute(select(model_task).filter(model_task.id == task_id, model_task.owner_id == account_id))
+        return result.scalars().first()
+
+
+    @staticmethod
+    async def get_task_row(db: AsyncSession, task_id: int, account_id: int, columns: Sequence[str] = TASK_RESPONSE_COLUMNS):
+        result = await db.execute(select(*[getattr(model_task, column) for column in columns]).filter(model_task.id == task_id, model_task.owner_id == account_id))
+        return result.first()
+
+
+    @staticmethod
+    async def get_task_version(db: AsyncSession, task_id: int, account_id: int) -> Optional[int]:
+        result = await db.execute(select(model_task.version).filter(model_task.id == task_id, model_task.owner_id == account_id))
+        return result.scalar()
+
+
+    @staticmethod
+    async def get_tasks_version(db: AsyncSession, account_id: int) -> int:
+        result = await db.execute(select(model_account.tasks_version).filter(model_account.id == account_id))
+        return result.scalar() or 0
+
+
+    @staticmethod
+    async def get_tasks_versions(db: AsyncSession, account_ids: List[int]) -> Dict[int, int]:
+        result = await db.execute(select(model_account.id, model_account.tasks_version).filter(model_account.id.in_(account_ids)))
+        return {account_id: tasks_version for account_id, tasks_version in result.all()}
+
+
+    # Session info key holding the collection versions a write moved through
+    TASKS_VERSION_SPAN = 'tasks_version_span'
+
+
+    @staticmethod
+    async def bump_tasks_version(db: AsyncSession, account_id: int) -> int:
+        # Every change to the account's tasks moves the version of its task lists
+        result = await db.execute(
+            update_query(model_account)
+            .where(model_account.id == account_id)
+            .values(tasks_version=model_account.tasks_version + 1)
+            .returning(model_account.tasks_version)
+            .execution_options(synchronize_session=False)
+        )
+        tasks_version = result.scalar()
+
+        # Remember the span so the change feed can publish it once the write is committed
+        db.info.setdefault(Task.TASKS_VERSION_SPAN, [tasks_version - 1, tasks_version])[1] = tasks_version
+        return tasks_version
 
 
     @staticmethod
-    async def create_task(db: Session, account_id: int, task: task.TaskCreate) -> model_task:
+    def pop_tasks_version_span(db: AsyncSession) -> Optional[Tuple[int, int]]:
+        span = db.info.pop(Task.TASKS_VERSION_SPAN, None)
+        return tuple(span) if span is not None else None
+
+
+    @staticmethod
+    async def create_task(db: AsyncSession, account_id: int, task: task.TaskCreate) -> model_task:
         # Create task db object
         db_task = model_task(**task.model_dump(exclude_none=True), owner_id=account_id)
 
         # Add new task to db
         db.add(db_task)
-        db.commit()
-        db.refresh(db_task)
+        await Task.bump_tasks_version(db=db, account_id=account_id)
+        await db.commit()
+        await db.refresh(db_task)
 
         return db_task
 
 
     @staticmethod
-    async def get_account_tasks(db: Session, account_id: int, skip: int, limit: int) -> List[model_task]:
-        return db.query(model_task).filter(model_task.owner_id == account_id).offset(skip).limit(limit).all()
+    def get_filter_conditions(task_filter: TaskFilter) -> list:
+        conditions = []
+        if task_filter.completed is not None:
+            conditions.append(model_task.completed == task_filter.completed)
+        if task_filter.start_time_from is not None:
+            conditions.append(model_task.start_time >= task_filter.start_time_from)
+        if task_filter.start_time_to is not None:
+            conditions.append(model_task.start_time < task_filter.start_time_to)
+        if task_filter.stop_time_from is not None:
+            conditions.append(model_task.stop_time >= task_filter.stop_time_from)
+        if task_filter.stop_time_to is not None:
+            conditions.append(model_task.stop_time < task_filter.stop_time_to)
+        if task_filter.created_at_from is not None:
+            conditions.append(model_task.created_at >= task_filter.created_at_from)
+        if task_filter.created_at_to is not None:
+            conditions.append(model_task.created_at < task_filter.created_at_to)
+        return conditions
+
+
+    @staticmethod
+    async def get_account_tasks(
+        db: AsyncSession,
+        account_id: int,
+        skip: int,
+        limit: int,
+        after: Optional[Tuple[Any, int]] = None,
+        task_filter: Optional[TaskFilter] = None,
+        sort: TaskSortEnum = TaskSortEnum.id,
+        columns: Optional[Sequence[str]] = None
+    ) -> list:
+        # Every sort ends with the id so pages are stable and served by the (owner_id, <sort>, id) indexes
+        descending = sort.value.startswith('-')
+        sort_name = sort.value.lstrip('-')
+        sort_column = getattr(model_task, sort_name)
+        sort_key = [model_task.id] if sort_column is model_task.id else [sort_column, model_task.id]
+
+        if columns is None:
+            query = select(model_task)
+        else:
+            # Plain rows instead of tasks, with the sort column appended when the cursor needs it
+            names = list(columns) if sort_name in columns else [*columns, sort_name]
+            query = select(*[getattr(model_task, name) for name in names])
+        query = query.filter(model_task.owner_id == account_id)
+        if task_filter is not None:
+            query = query.filter(*Task.get_filter_conditions(task_filter))
+
+        if after is not None:
+            # Keyset: continue right after the last (sort value, id) seen
+            after_value, after_id = after
+            after_key = [after_id] if sort_column is model_task.id else [after_value, after_id]
+            if descending:
+                query = query.filter(tuple_(*sort_key) < tuple_(*after_key))
+            else:
+                query = query.filter(tuple_(*sort_key) > tuple_(*after_key))
+        else:
+            query = query.offset(skip)
+
+        order_by = [column.desc() for column in sort_key] if descending else sort_key
+        result = await db.execute(query.order_by(*order_by).limit(limit))
+        return result.scalars().all() if columns is None else result.all()
+
+
+    @staticmethod
+    def build_match_query(query: str) -> str:
+        # Quote every term so user input is never parsed as FTS5 syntax, a trailing * keeps prefix matching
+        terms = []
+        for term in query.split():
+            prefix = term.endswith('*')
+            term = term.rstrip('*')
+            if term:
+                terms.append('"' + term.replace('"', '""') + '"' + ('*' if prefix else ''))
+        return ' '.join(terms)
+
+
+    @staticmethod
+    def build_like_patterns(query: str) -> List[str]:
+        # One substring pattern per term, LIKE wildcards in user input match literally. A substring
+        # match already covers prefixes, so the trailing * of the FTS5 syntax is dropped.
+        patterns = []
+        for term in query.split():
+            term = term.rstrip('*')
+            if term:
+                escaped = term.replace(LIKE_ESCAPE, LIKE_ESCAPE * 2).replace('%', LIKE_ESCAPE + '%').replace('_', LIKE_ESCAPE + '_')
+                patterns.append(f"%{escaped}%")
+        return patterns
+
+
+    @staticmethod
+    async def search_account_tasks(db: AsyncSession, account_id: int, query: str, limit: int, after: Optional[Tuple[float, int]] = None) -> List[Tuple[model_task, float]]:
+        if db.bind.dialect.name != 'sqlite':
+            # No FTS5 on this backend, fall back to an unranked substring scan where every term must match
+            rank = literal(0.0)
+            search_query = select(model_task, rank.label('rank')).filter(
+                model_task.owner_id == account_id,
+                *[
+                    or_(model_task.title.ilike(pattern, escape=LIKE_ESCAPE), model_task.description.ilike(pattern, escape=LIKE_ESCAPE))
+                    for pattern in Task.build_like_patterns(query)
+                ]
+            )
+            if after is not None:
+                search_query = search_query.filter(model_task.id > after[1])
+            result = await db.execute(search_query.order_by(model_task.id).limit(limit))
+            return [tuple(row) for row in result.all()]
+
+        # Ranked by bm25 (lower is better), ties broken by id for stable keyset pages
+        search_table = table(TASK_SEARCH_TABLE, column('rowid'))
+        rank = literal_column(f"bm25({TASK_SEARCH_TABLE})")
+        search_query = (
+            select(model_task, rank.label('rank'))
+            .join(search_table, search_table.c.rowid == model_task.id)
+            .filter(text(f"{TASK_SEARCH_TABLE} MATCH :match").bindparams(match=Task.build_match_query(query)))
+            .filter(model_task.owner_id == account_id)
+        )
+        if after is not None:
+            after_rank, after_id = after
+            search_query = search_query.filter(or_(rank > after_rank, and_(rank == after_rank, model_task.id > after_id)))
+
+        result = await db.execute(search_query.order_by(rank, model_task.id).limit(limit))
+        return [tuple(row) for row in result.all()]
+
+
+    @staticmethod
+    def get_version_conditions(task_id: int, account_id: int, expected_versions: Optional[List[int]] = None) -> list:
+        conditions = [model_task.id == task_id, model_task.owner_id == account_id]
+        if expected_versions is not None:
+            conditions.append(model_task.version.in_(expected_versions))
+        return conditions
 
 
     @staticmethod
-    async def update_task(db: Session, task_id: int, account_id: int, update: task.TaskUpdate) -> model_task:
+    async def update_task(db: AsyncSession, task_id: int, account_id: int, update: task.TaskUpdate, expected_versions: Optional[List[int]] = None) -> Optional[model_task]:
+        # Returns None when the task is missing or its version is not one of the expected ones
+        conditions = Task.get_version_conditions(task_id=task_id, account_id=account_id, expected_versions=expected_versions)
+        values = update.model_dump(exclude_none=True)
+        if not values:
+            result = await db.execute(select(model_task).filter(*conditions))
+            return result.scalars().first()
+
+        # Conditional update that returns the new row, no re-select needed
         logger.info("Creating task update query")
-        db.query(model_task).filter(model_task.id == task_id and model_task.owner_id == account_id).update(values=update.model_dump(exclude_none=True))
-        
+        result = await db.execute(
+            update_query(model_task)
+            .where(*conditions)
+            .values(**values, version=model_task.version + 1, updated_at=datetime.now())
+            .returning(model_task)
+            .execution_options(populate_existing=True)
+        )
+        updated_task = result.scalars().first()
+        if updated_task is not None:
+            await Task.bump_tasks_version(db=db, account_id=account_id)
+
         logger.info("Commiting changes to database")
-        db.commit()
-        return await Task.get_task_by_id(db=db, task_id=task_id, account_id=account_id)
+        await db.commit()
+        return updated_task
+
+
+    @staticmethod
+    async def delete_task(db: AsyncSession, task_id: int, account_id: int, expected_versions: Optional[List[int]] = None) -> bool:
+        conditions = Task.get_version_conditions(task_id=task_id, account_id=account_id, expected_versions=expected_versions)
+        result = await db.execute(delete(model_task).where(*conditions).returning(model_task.id).execution_options(synchronize_session=False))
+        deleted = result.first() is not None
+        if deleted:
+            await Task.bump_tasks_version(db=db, account_id=account_id)
+        await db.commit()
+        return deleted
+
+
+    @staticmethod
+    async def create_tasks(db: AsyncSession, account_id: int, tasks: List[task.TaskCreate], commit: bool = True) -> List[model_task]:
+        # Insert the whole batch with a single flush, ids are returned by the insert
+        db_tasks = [model_task(**new_task.model_dump(exclude_none=True), owner_id=account_id) for new_task in tasks]
+        db.add_all(db_tasks)
+        await db.flush()
+        await Task.bump_tasks_version(db=db, account_id=account_id)
+
+        if commit:
+            await db.commit()
+        return db_tasks
+
+
+    @staticmethod
+    async def update_tasks(db: AsyncSession, account_id: int, updates: List[task.TaskBulkUpdate]) -> List[Optional[int]]:
+        # Every update runs in the same transaction, committed once. Returns the version of each
+        # task after its update, None when the task is not found.
+        versions = []
+        changed = False
+        for task_update in updates:
+            task_filter = and_(model_task.id == task_update.id, model_task.owner_id == account_id)
+            values = task_update.model_dump(exclude_none=True, exclude={'id'})
+            if values:
+                result = await db.execute(
+                    update_query(model_task)
+                    .where(task_filter)
+                    .values(**values, version=model_task.version + 1, updated_at=datetime.now())
+                    .returning(model_task.version)
+                    .execution_options(synchronize_session=False)
+                )
+                version = result.scalar()
+                changed = changed or version is not None
+            else:
+                # Nothing to change, only report whether the task exists
+                result = await db.execute(select(model_task.version).where(task_filter))
+                version = result.scalar()
+            versions.append(version)
+
+        if changed:
+            await Task.bump_tasks_version(db=db, account_id=account_id)
+        await db.commit()
+        return versions
+
+
+    @staticmethod
+    async def delete_tasks(db: AsyncSession, account_id: int, task_ids: List[int]) -> set:
+        result = await db.execute(
+            delete(model_task)
+            .where(and_(model_task.owner_id == account_id, model_task.id.in_(task_ids)))
+            .returning(model_task.id)
+            .execution_options(synchronize_session=False)
+        )
+        deleted_ids = set(result.scalars().all())
+        if deleted_ids:
+            await Task.bump_tasks_version(db=db, account_id=account_id)
+        await db.commit()
+        return deleted_ids
+
+
+    # Columns written by the export, in output order
+    EXPORT_COLUMNS = ('id', 'title', 'description', 'completed', 'start_time', 'stop_time', 'created_at', 'updated_at')
 
 
     @staticmethod
-    async def delete_task(db: Session, task_id: int, account_id: int) -> None:
-        db.query(model_task).filter(model_task.id == task_id and model_task.owner_id == account_id).delete()
-        db.commit()
+    async def stream_account_tasks(db: AsyncSession, account_id: int, batch_size: int) -> AsyncIterator[list]:
+        # Server side cursor: rows are fetched batch_size at a time instead of all at once
+        query = (
+            select(*[getattr(model_task, column) for column in Task.EXPORT_COLUMNS])
+            .filter(model_task.owner_id == account_id)
+            .order_by(model_task.id)
+            .execution_options(yield_per=batch_size)
+        )
+        result = await db.stream(query)
+        async for rows in result.partitions():
+            yield rows
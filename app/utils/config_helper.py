@@ -1,24 +1,149 @@
 import argparse
-from app.utils.logging_helper import logger
-from app.core.configuration import AppConfig
+import dataclasses
+import os
+import threading
+from app.utils.logging_helper import logger, configure_logging
+from app.core.configuration import AppConfig, Settings
 import sys
 
-from omegaconf import DictConfig
+from typing import List, Optional
 
 
-def get_config() -> DictConfig:
-    # Load configuration from command line
+# Process-wide settings snapshot. It is only ever replaced as a whole, never mutated.
+_settings: Optional[Settings] = None
+_environment: Optional[str] = None
+_settings_lock = threading.Lock()
+
+ENVIRONMENTS = ("dev", "staging", "prod", "test")
+ENVIRONMENT_VARIABLE = "APP_ENV"
+
+# Settings read from the snapshot on every use, a reload applies them. Everything else builds a
+# subsystem once per worker, e.g the engines, the writer, the caches, the rate limiter, the
+# hashing pool or the change feed, or the server itself, and only takes effect on a restart.
+RELOADABLE_SETTINGS = (
+    'logging',
+    'signing',
+    'tasks',
+    'profiling.enabled',
+    'profiling.max_seconds',
+    'profiling.interval_ms',
+    'change_feed.heartbeat_seconds',
+    'change_feed.long_poll_timeout_seconds',
+    'token_cache.recheck_auth_state',
+    'metrics.scrape_token',
+    'app.refresh_token_secret',
+    'app.access_token_secret',
+    'app.access_token_expiry_seconds',
+    'app.refresh_token_expiry_seconds',
+    'app.token_algorithm',
+    'app.token_aud',
+    'app.token_iss',
+    'app.token_sub',
+    'app.token_type',
+)
+
+
+class RestartRequiredError(Exception):
+    def __init__(self, keys: List[str]):
+        super().__init__(f"Changing {', '.join(keys)} requires a restart")
+        self.keys = keys
+
+
+def get_environment() -> str:
+    global _environment
+    if _environment is not None:
+        return _environment
+
+    # Load configuration from the APP_ENV variable, e.g under a test runner, or the command line
     logger.info('Loading configuration environment')
-    parser = argparse.ArgumentParser(description="CLI tool to load application configuration environments from the command line.")
-    parser.add_argument("environment", type=str, help="Usage: python main.py [dev|staging|prod]")
-    args = parser.parse_args()
-    
-    # Ensure a valid command line argument is provided
-    if args.environment not in ["dev", "staging", "prod"]:
-        logger.error("Usage: python main.py [dev|staging|prod]")
+    environment = os.environ.get(ENVIRONMENT_VARIABLE)
+    if environment is None:
+        parser = argparse.ArgumentParser(description="CLI tool to load application configuration environments from the command line.")
+        parser.add_argument("environment", type=str, help="Usage: python main.py [dev|staging|prod|test]")
+        environment = parser.parse_args().environment
+
+    # Ensure a valid environment is provided
+    if environment not in ENVIRONMENTS:
+        logger.error("Usage: python main.py [dev|staging|prod|test]")
         sys.exit(1)
 
-    # Load the configuration based on the provided environment
-    app_config = AppConfig(args.environment)
-    cfg = app_config.load_config()
-    return cfg
+    _environment = environment
+    return _environment
+
+
+def apply_logging_settings(settings: Settings) -> None:
+    # Rebuild the logging pipeline with the environment levels and sinks
+    configure_logging(
+        level=settings.logging.level,
+        json_lines=settings.logging.json_lines,
+        info_sample_rate=settings.logging.info_sample_rate,
+        file_path=settings.logging.file_path,
+        stdout=settings.logging.stdout,
+        queue_size=settings.logging.queue_size,
+        batch_size=settings.logging.batch_size,
+        flush_interval_seconds=settings.logging.flush_interval_seconds,
+    )
+
+
+def get_config() -> Settings:
+    global _settings
+
+    # Fast path: the snapshot is already loaded
+    settings = _settings
+    if settings is not None:
+        return settings
+
+    with _settings_lock:
+        if _settings is None:
+            # Load the configuration based on the provided environment
+            app_config = AppConfig(get_environment())
+            _settings = app_config.load_settings()
+            apply_logging_settings(_settings)
+        return _settings
+
+
+async def get_settings() -> Settings:
+    # Zero-cost FastAPI dependency, awaited inline instead of dispatched to the threadpool
+    return _settings if _settings is not None else get_config()
+
+
+def get_changed_settings(old: Settings, new: Settings) -> List[str]:
+    # Dotted keys whose value differs between two snapshots, e.g database.pool_size
+    changed = []
+    for section in dataclasses.fields(Settings):
+        old_section, new_section = getattr(old, section.name), getattr(new, section.name)
+        if old_section == new_section:
+            continue
+        if not dataclasses.is_dataclass(old_section):
+            changed.append(section.name)
+            continue
+        changed += [
+            f"{section.name}.{key.name}" for key in dataclasses.fields(old_section)
+            if getattr(old_section, key.name) != getattr(new_section, key.name)
+        ]
+    return changed
+
+
+def get_restart_required_settings(old: Settings, new: Settings) -> List[str]:
+    return [
+        key for key in get_changed_settings(old, new)
+        if key not in RELOADABLE_SETTINGS and key.split('.', 1)[0] not in RELOADABLE_SETTINGS
+    ]
+
+
+def reload_config() -> Settings:
+    global _settings
+
+    # Build the new snapshot completely before publishing it
+    with _settings_lock:
+        logger.info('Reloading %s configuration', get_environment())
+        new_settings = AppConfig(get_environment()).load_settings()
+        # Swapping in settings the running subsystems were not built from would only pretend to apply them
+        restart_keys = get_restart_required_settings(_settings, new_settings) if _settings is not None else []
+        if restart_keys:
+            raise RestartRequiredError(restart_keys)
+        _settings = new_settings
+        apply_logging_settings(new_settings)
+
+    logger.info('Configuration snapshot swapped successfully')
+    return new_settings
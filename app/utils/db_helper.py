@@ -1,10 +1,65 @@
-from app.utils.init_db import SessionLocal, engine
+import asyncio
+from typing import Optional
+
+from sqlalchemy import text
+
+from app.utils.init_db import new_async_session, new_read_session, get_async_engine
+from app.utils.logging_helper import logger
 
 
 # SQLALCHEMY dependency
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with new_async_session() as db:
+        yield db
+
+
+# Read-only session dependency, writes go through the database writer
+async def get_read_db():
+    async with new_read_session() as db:
         yield db
-    finally:
-        db.close()
+
+
+async def run_db_maintenance() -> None:
+    async_engine = get_async_engine()
+    if async_engine.dialect.name != 'sqlite':
+        return
+
+    # Fold the WAL back into the database without blocking readers or writers,
+    # then let SQLite refresh the statistics of the tables that need it
+    async with async_engine.connect() as connection:
+        busy, wal_pages, checkpointed_pages = (await connection.execute(text("PRAGMA wal_checkpoint(PASSIVE)"))).one()
+        await connection.execute(text("PRAGMA optimize"))
+    logger.info("Database maintenance done, checkpointed %s of %s wal pages", checkpointed_pages, wal_pages)
+
+
+async def db_maintenance_loop(interval_seconds: int) -> None:
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            await run_db_maintenance()
+        except Exception as e:
+            logger.error("Database maintenance failed due to error: %s", e)
+
+
+_maintenance_task: Optional[asyncio.Task] = None
+
+
+def start_db_maintenance(interval_seconds: int) -> None:
+    global _maintenance_task
+    if interval_seconds > 0 and _maintenance_task is None:
+        logger.info("Scheduling database maintenance every %s seconds", interval_seconds)
+        _maintenance_task = asyncio.get_running_loop().create_task(db_maintenance_loop(interval_seconds))
+
+
+async def stop_db_maintenance() -> None:
+    global _maintenance_task
+    if _maintenance_task is not None:
+        _maintenance_task.cancel()
+        try:
+            await _maintenance_task
+        except asyncio.CancelledError:
+            pass
+        _maintenance_task = None
+
+    # Final checkpoint so the WAL does not outlive the process
+    await run_db_maintenance()
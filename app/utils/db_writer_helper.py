@@ -0,0 +1,217 @@
+import asyncio
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.utils.init_db import get_write_engine
+from app.utils.config_helper import get_config
+from app.utils.logging_helper import logger
+from app.utils.metrics_helper import RequestStats, bind_request_stats, get_request_stats, unbind_request_stats
+
+
+class GroupCommitSession(AsyncSession):
+    """Session handed to write jobs. Their commits only flush, the writer commits the whole batch."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.after_commit_callbacks: List[Callable[[], None]] = []
+
+
+    async def commit(self) -> None:
+        await self.flush()
+
+
+    async def rollback(self) -> None:
+        # The savepoint of the failing job is rolled back by the writer
+        pass
+
+
+    async def group_commit(self) -> None:
+        await super().commit()
+
+
+    async def group_rollback(self) -> None:
+        await super().rollback()
+
+
+WriteSessionLocal = async_sessionmaker(class_=GroupCommitSession, autoflush=False, expire_on_commit=False)
+
+
+def run_after_commit(db: AsyncSession, callback: Callable[[], None]) -> None:
+    # Defer side effects such as cache invalidation until the batch is durable
+    if isinstance(db, GroupCommitSession):
+        db.after_commit_callbacks.append(callback)
+    else:
+        callback()
+
+
+class WriteJob:
+    __slots__ = ('fn', 'future', 'request_stats')
+
+    def __init__(self, fn: Callable[[AsyncSession], Awaitable[Any]], future: asyncio.Future, request_stats: Optional[RequestStats] = None):
+        self.fn = fn
+        self.future = future
+        # The queries of the job are charged to the request that submitted it
+        self.request_stats = request_stats
+
+
+class WriterMetrics:
+    def __init__(self):
+        self.jobs = 0
+        self.failed_jobs = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self.max_batch_size = 0
+        self.commit_seconds_total = 0.0
+
+
+    def observe(self, batch_size: int, commit_seconds: float) -> None:
+        self.batches += 1
+        self.jobs += batch_size
+        self.max_batch_size = max(self.max_batch_size, batch_size)
+        self.commit_seconds_total += commit_seconds
+
+
+    def snapshot(self) -> dict:
+        batches = self.batches or 1
+        return {
+            'jobs': self.jobs,
+            'failed_jobs': self.failed_jobs,
+            'batches': self.batches,
+            'failed_batches': self.failed_batches,
+            'avg_batch_size': self.jobs / batches,
+            'max_batch_size': self.max_batch_size,
+            'commit_seconds_avg': self.commit_seconds_total / batches,
+        }
+
+
+class DatabaseWriter:
+    def __init__(self, max_batch: int = 64, batch_window_ms: float = 0):
+        self.max_batch = max(max_batch, 1)
+        self.batch_window_seconds = batch_window_ms / 1000
+        self.metrics = WriterMetrics()
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+    def _ensure_started(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._task is not None and self._loop is loop and not self._task.done():
+            return
+
+        logger.info("Starting database writer with batches of up to %s jobs", self.max_batch)
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._task = loop.create_task(self._run())
+
+
+    async def submit(self, fn: Callable[[AsyncSession], Awaitable[Any]]) -> Any:
+        self._ensure_started()
+        future = self._loop.create_future()
+        self._queue.put_nowait(WriteJob(fn, future, get_request_stats()))
+        return await future
+
+
+    async def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            job = await self._queue.get()
+            if job is None:
+                break
+
+            # Give concurrent writers a moment to join the batch, then drain whatever is ready
+            if self.batch_window_seconds > 0:
+                await asyncio.sleep(self.batch_window_seconds)
+            batch = [job]
+            while len(batch) < self.max_batch:
+                try:
+                    job = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                if job is None:
+                    stopping = True
+                    break
+                batch.append(job)
+
+            try:
+                await self._execute(batch)
+            except Exception as e:
+                logger.error("Database writer batch failed due to error: %s", e)
+                for job in batch:
+                    if not job.future.done():
+                        job.future.set_exception(e)
+
+
+    async def _execute(self, batch: List[WriteJob]) -> None:
+        applied: List[Tuple[WriteJob, Any, List[Callable[[], None]]]] = []
+        loop = asyncio.get_running_loop()
+
+        async with WriteSessionLocal(bind=get_write_engine()) as session:
+            # Each job runs in its own savepoint so one failure does not sink the batch
+            for job in batch:
+                if job.future.done():
+                    continue
+                session.after_commit_callbacks = []
+                stats_token = bind_request_stats(job.request_stats)
+                try:
+                    async with session.begin_nested():
+                        result = await job.fn(session)
+                except Exception as e:
+                    self.metrics.failed_jobs += 1
+                    job.future.set_exception(e)
+                    continue
+                finally:
+                    unbind_request_stats(stats_token)
+                applied.append((job, result, session.after_commit_callbacks))
+
+            if not applied:
+                await session.group_rollback()
+                return
+
+            started_at = loop.time()
+            try:
+                await session.group_commit()
+            except Exception:
+                self.metrics.failed_batches += 1
+                raise
+            self.metrics.observe(len(applied), loop.time() - started_at)
+
+        for job, result, callbacks in applied:
+            for callback in callbacks:
+                callback()
+            if not job.future.done():
+                job.future.set_result(result)
+
+
+    async def stop(self) -> None:
+        if self._task is None or self._task.done():
+            return
+
+        # Let the queued jobs drain before the writer exits
+        self._queue.put_nowait(None)
+        await self._task
+        self._task = None
+
+
+# Process-wide writer, created from the settings on first use
+_db_writer: Optional[DatabaseWriter] = None
+
+
+def get_db_writer() -> DatabaseWriter:
+    global _db_writer
+    if _db_writer is None:
+        settings = get_config().database
+        _db_writer = DatabaseWriter(max_batch=settings.writer_max_batch, batch_window_ms=settings.writer_batch_window_ms)
+    return _db_writer
+
+
+async def submit_write(fn: Callable[[AsyncSession], Awaitable[Any]]) -> Any:
+    return await get_db_writer().submit(fn)
+
+
+async def stop_db_writer() -> None:
+    global _db_writer
+    if _db_writer is not None:
+        await _db_writer.stop()
+        _db_writer = None
@@ -0,0 +1,51 @@
+from typing import List, Optional
+
+
+# Headers of the conditional request protocol
+ETAG_HEADER = "ETag"
+IF_MATCH_HEADER = "If-Match"
+IF_NONE_MATCH_HEADER = "If-None-Match"
+
+
+def task_etag(task_id: int, version: int) -> str:
+    # Strong validator, changes on every update of the task
+    return f'"{task_id}-{version}"'
+
+
+def parse_entity_tags(header: Optional[str]) -> Optional[List[str]]:
+    if header is None:
+        return None
+    return [tag.strip() for tag in header.split(',') if tag.strip()]
+
+
+def get_expected_versions(if_match: Optional[str], task_id: int) -> Optional[List[int]]:
+    # Versions accepted by an If-Match header, None when any version is accepted
+    tags = parse_entity_tags(if_match)
+    if tags is None or '*' in tags:
+        return None
+
+    versions = []
+    for tag in tags:
+        # Weak tags never match, If-Match uses the strong comparison
+        if tag.startswith('W/'):
+            continue
+        try:
+            tag_task_id, version = tag.strip('"').split('-')
+            if int(tag_task_id) == task_id:
+                versions.append(int(version))
+        except ValueError:
+            continue
+    return versions
+
+
+def task_collection_etag(account_id: int, tasks_version: int) -> str:
+    # Strong validator of every task list of the account, changes on any task write
+    return f'"tasks-{account_id}-{tasks_version}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    # If-None-Match uses the weak comparison, so W/ prefixes are ignored
+    tags = parse_entity_tags(if_none_match)
+    if not tags:
+        return False
+    return any(tag == '*' or tag.removeprefix('W/') == etag for tag in tags)
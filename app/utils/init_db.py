@@ -1,21 +1,191 @@
-from sqlalchemy import create_engine
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession, AsyncEngine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
 
-from app.core.configuration import AppConfig
+from app.core.configuration import DatabaseSettings, Settings
 from app.utils.config_helper import get_config
 
-# Load app configuration
-cfg = get_config()
+from typing import Dict
 
-# Init the SQLite database url
-SQLALCHEMY_DATABASE_URL = cfg.app.db_url
-    
-# Create engine
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+# Async drivers used for each sync database dialect
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+}
+
+
+def get_async_database_url(database_url: str) -> str:
+    # Swap the sync driver for its async counterpart, e.g sqlite -> sqlite+aiosqlite
+    url = make_url(database_url)
+    async_driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    if async_driver is None:
+        raise ValueError(f"No async driver configured for database backend: {url.get_backend_name()}")
+    return url.set(drivername=async_driver).render_as_string(hide_password=False)
+
+
+def build_sqlite_pragmas(settings: DatabaseSettings) -> list:
+    return [
+        f"PRAGMA journal_mode={settings.journal_mode}",
+        f"PRAGMA synchronous={settings.synchronous}",
+        f"PRAGMA mmap_size={settings.mmap_size}",
+        f"PRAGMA cache_size={settings.cache_size}",
+        f"PRAGMA busy_timeout={settings.busy_timeout_ms}",
+        f"PRAGMA temp_store={settings.temp_store}",
+    ]
+
+
+def register_sqlite_pragmas(sync_engine, settings: DatabaseSettings) -> None:
+    if sync_engine.dialect.name != 'sqlite':
+        return
+
+    pragmas = build_sqlite_pragmas(settings)
+
+    # Pragmas are per connection, apply them as soon as the pool opens one
+    @event.listens_for(sync_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+
+def register_read_only(sync_engine) -> None:
+    if sync_engine.dialect.name != 'sqlite':
+        return
+
+    # Reject writes on the read pool at the connection level
+    @event.listens_for(sync_engine, "connect")
+    def set_query_only(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute("PRAGMA query_only=ON")
+        finally:
+            cursor.close()
+
+
+def register_immediate_transactions(sync_engine) -> None:
+    if sync_engine.dialect.name != 'sqlite':
+        return
+
+    # Let SQLAlchemy own transaction boundaries instead of the sqlite driver, so
+    # savepoints work, and take the write lock as soon as the transaction starts
+    @event.listens_for(sync_engine, "connect")
+    def disable_driver_transactions(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(sync_engine, "begin")
+    def begin_immediate(connection):
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+def get_pool_options(settings: DatabaseSettings, pool_size: int = None, max_overflow: int = None) -> dict:
+    return {
+        'pool_size': settings.pool_size if pool_size is None else pool_size,
+        'max_overflow': settings.max_overflow if max_overflow is None else max_overflow,
+        'pool_timeout': settings.pool_timeout_seconds,
+        'pool_recycle': settings.pool_recycle_seconds,
+        'pool_pre_ping': settings.pool_pre_ping,
+    }
+
+
+def get_connect_args(database_url: str, settings: DatabaseSettings, read_only: bool = False) -> dict:
+    backend = make_url(database_url).get_backend_name()
+    if backend == 'sqlite':
+        # Connections are handed between threads by the pool and the aiosqlite worker
+        return {"check_same_thread": False}
+
+    if backend == 'postgresql' and make_url(database_url).get_driver_name() == 'asyncpg':
+        connect_args = {'statement_cache_size': settings.statement_cache_size}
+        if read_only:
+            connect_args['server_settings'] = {'default_transaction_read_only': 'on'}
+        return connect_args
+
+    return {}
+
+
+def create_async_database_engine(database_url: str, settings: DatabaseSettings, read_only: bool = False, **pool_overrides):
+    async_url = make_url(get_async_database_url(database_url))
+    if async_url.get_driver_name() == 'asyncpg':
+        # SQLAlchemy keeps its own cache of asyncpg prepared statements, size it like the driver cache
+        async_url = async_url.update_query_dict({'prepared_statement_cache_size': str(settings.statement_cache_size)})
+    async_url = async_url.render_as_string(hide_password=False)
+
+    return create_async_engine(async_url, connect_args=get_connect_args(async_url, settings, read_only=read_only), **get_pool_options(settings, **pool_overrides))
+
+
+def _create_primary_engine(settings: Settings) -> AsyncEngine:
+    primary_engine = create_async_database_engine(settings.app.db_url, settings.database)
+    register_sqlite_pragmas(primary_engine.sync_engine, settings.database)
+    return primary_engine
+
+
+def _create_read_engine(settings: Settings) -> AsyncEngine:
+    # Read-only engine used by read endpoints, optionally pointing at a replica
+    read_engine = create_async_database_engine(settings.database.read_url or settings.app.db_url, settings.database, read_only=True, pool_size=settings.database.read_pool_size)
+    register_sqlite_pragmas(read_engine.sync_engine, settings.database)
+    register_read_only(read_engine.sync_engine)
+    return read_engine
+
+
+def _create_write_engine(settings: Settings) -> AsyncEngine:
+    # Engine of the single serialized writer, one connection is all it ever needs
+    write_engine = create_async_database_engine(settings.app.db_url, settings.database, pool_size=1, max_overflow=0)
+    register_sqlite_pragmas(write_engine.sync_engine, settings.database)
+    register_immediate_transactions(write_engine.sync_engine)
+    return write_engine
+
+
+ENGINE_FACTORIES = {
+    'primary': _create_primary_engine,
+    'read': _create_read_engine,
+    'write': _create_write_engine,
+}
+
+# Engines are created from the settings on first use, so importing the app does no I/O
+_engines: Dict[str, AsyncEngine] = {}
+
+
+def _get_engine(name: str) -> AsyncEngine:
+    engine = _engines.get(name)
+    if engine is None:
+        engine = _engines[name] = ENGINE_FACTORIES[name](get_config())
+    return engine
+
+
+def get_async_engine() -> AsyncEngine:
+    return _get_engine('primary')
+
+
+def get_read_engine() -> AsyncEngine:
+    return _get_engine('read')
+
+
+def get_write_engine() -> AsyncEngine:
+    return _get_engine('write')
+
+
+async def dispose_engines() -> None:
+    while _engines:
+        _, engine = _engines.popitem()
+        await engine.dispose()
+
+
+# Async session classes, bound to their engine when a session is opened. Objects stay
+# loaded after commit so they can be serialized without lazy loading outside of the session.
+AsyncSessionLocal = async_sessionmaker(class_=AsyncSession, autoflush=False, expire_on_commit=False)
+ReadSessionLocal = async_sessionmaker(class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+
+def new_async_session() -> AsyncSession:
+    return AsyncSessionLocal(bind=get_async_engine())
+
+
+def new_read_session() -> AsyncSession:
+    return ReadSessionLocal(bind=get_read_engine())
 
-# Create a local session class instance
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 # set the base class to be inherited by SQLALCHEMY models
-Base = declarative_base()
\ No newline at end of file
+Base = declarative_base()
@@ -1,21 +1,193 @@
 import os
 import sys
+import json
+import queue
+import atexit
+import random
 import logging
+import threading
+from logging.handlers import QueueHandler
+from typing import List, Optional, TextIO
 
 
 logging_str = "[%(asctime)s: %(levelname)s: %(module)s: %(message)s]"
 
 log_dir = "log"
 log_filepath = os.path.join(log_dir, "audit.log")
-os.makedirs(log_dir, exist_ok=True)
-
-logging.basicConfig(
-    level=logging.DEBUG,
-    format=logging_str,
-    handlers=[
-        logging.FileHandler(log_filepath),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
-
-logger = logging.getLogger("task_management_api")
\ No newline at end of file
+
+# Name of the application logger whose info logs are sampled
+APP_LOGGER_NAME = "task_management_api"
+
+
+class JsonLinesFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'module': record.module,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class InfoSamplingFilter(logging.Filter):
+    def __init__(self, rate: float = 1.0):
+        super().__init__()
+        self.rate = rate
+
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        # Only info logs are sampled, warnings and errors always pass
+        if record.levelno != logging.INFO or self.rate >= 1.0:
+            return True
+        return random.random() < self.rate
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Message formatting is deferred to the writer thread
+        return record
+
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        # Never block the caller, drop records when the writer falls behind
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class BatchingLogWriter(threading.Thread):
+    def __init__(self, log_queue: queue.Queue, streams: List[TextIO], formatter: logging.Formatter, batch_size: int = 256, flush_interval_seconds: float = 0.5):
+        super().__init__(name="log-writer", daemon=True)
+        self.queue = log_queue
+        self.streams = streams
+        self.formatter = formatter
+        self.batch_size = batch_size
+        self.flush_interval_seconds = flush_interval_seconds
+        self._stopped = threading.Event()
+
+
+    def run(self) -> None:
+        while not (self._stopped.is_set() and self.queue.empty()):
+            # Wait for the first record, then drain whatever else is ready
+            try:
+                batch = [self.queue.get(timeout=self.flush_interval_seconds)]
+            except queue.Empty:
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._write(batch)
+
+
+    def _write(self, batch: List[logging.LogRecord]) -> None:
+        lines = []
+        for record in batch:
+            try:
+                lines.append(self.formatter.format(record) + "\n")
+            except Exception:
+                lines.append(f"[log formatting failed: {record.msg!r}]\n")
+
+        # One write and one flush per stream for the whole batch
+        payload = "".join(lines)
+        for stream in self.streams:
+            try:
+                stream.write(payload)
+                stream.flush()
+            except Exception:
+                pass
+
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self.join()
+
+
+_log_queue: queue.Queue = queue.Queue()
+_queue_handler: Optional[NonBlockingQueueHandler] = None
+_log_writer: Optional[BatchingLogWriter] = None
+_log_file: Optional[TextIO] = None
+_sampling_filter = InfoSamplingFilter()
+_configure_lock = threading.Lock()
+
+
+def configure_logging(
+    level: str = "DEBUG",
+    json_lines: bool = False,
+    info_sample_rate: float = 1.0,
+    file_path: str = log_filepath,
+    stdout: bool = True,
+    queue_size: int = 10000,
+    batch_size: int = 256,
+    flush_interval_seconds: float = 0.5,
+) -> None:
+    global _log_queue, _queue_handler, _log_writer, _log_file
+
+    with _configure_lock:
+        # Build the new sinks
+        streams = []
+        log_file = None
+        if file_path:
+            os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+            log_file = open(file_path, "a", encoding="utf-8")
+            streams.append(log_file)
+        if stdout:
+            streams.append(sys.stdout)
+
+        formatter = JsonLinesFormatter() if json_lines else logging.Formatter(logging_str)
+        log_queue = queue.Queue(maxsize=queue_size)
+        log_writer = BatchingLogWriter(log_queue, streams=streams, formatter=formatter, batch_size=batch_size, flush_interval_seconds=flush_interval_seconds)
+        log_writer.start()
+        queue_handler = NonBlockingQueueHandler(log_queue)
+
+        # Swap the root handler, then drain and close the previous pipeline
+        root = logging.getLogger()
+        root.setLevel(level)
+        if _queue_handler is not None:
+            root.removeHandler(_queue_handler)
+        root.addHandler(queue_handler)
+        _sampling_filter.rate = info_sample_rate
+
+        previous_writer, previous_file = _log_writer, _log_file
+        _log_queue, _queue_handler, _log_writer, _log_file = log_queue, queue_handler, log_writer, log_file
+
+    if previous_writer is not None:
+        previous_writer.stop()
+    if previous_file is not None:
+        previous_file.close()
+
+
+def shutdown_logging() -> None:
+    global _queue_handler, _log_writer, _log_file
+
+    with _configure_lock:
+        if _queue_handler is not None:
+            logging.getLogger().removeHandler(_queue_handler)
+        if _log_writer is not None:
+            _log_writer.stop()
+        if _log_file is not None:
+            _log_file.close()
+        _queue_handler, _log_writer, _log_file = None, None, None
+
+
+def get_dropped_log_count() -> int:
+    return _queue_handler.dropped if _queue_handler is not None else 0
+
+
+# Log to stdout only until the environment configuration is loaded, so importing the app opens no files
+configure_logging(file_path=None)
+atexit.register(shutdown_logging)
+
+logger = logging.getLogger(APP_LOGGER_NAME)
+logger.addFilter(_sampling_filter)
@@ -0,0 +1,300 @@
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence, Tuple
+import random
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.utils.config_helper import get_config
+from app.utils.logging_helper import logger
+
+
+# Upper bounds of the histogram buckets, +Inf is implied
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+PROMETHEUS_MEDIA_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# Label of requests that matched no route, so unknown paths cannot blow up the series count
+UNMATCHED_ROUTE = 'unmatched'
+EVENT_STREAM_MEDIA_TYPE = b'text/event-stream'
+QUERY_STARTED_AT_KEY = 'metrics_query_started_at'
+# Statements that only delimit transactions, they ride along with the queries they wrap
+TRANSACTION_CONTROL_PREFIXES = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE')
+
+
+class RequestStats:
+    """Database, hashing and JWT time of the request being served, found through a context variable."""
+
+    __slots__ = ('max_statements', 'db_queries', 'db_seconds', 'hash_seconds', 'jwt_seconds', 'statements')
+
+    def __init__(self, max_statements: int = 0):
+        self.max_statements = max_statements
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.hash_seconds = 0.0
+        self.jwt_seconds = 0.0
+        self.statements: List[Tuple[str, float]] = []
+
+
+    def observe_query(self, statement: str, seconds: float, counted: bool) -> None:
+        self.db_seconds += seconds
+        if counted:
+            self.db_queries += 1
+        if len(self.statements) < self.max_statements:
+            self.statements.append((statement, seconds))
+
+
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar('request_stats', default=None)
+
+
+def get_request_stats() -> Optional[RequestStats]:
+    return _request_stats.get()
+
+
+def bind_request_stats(stats: Optional[RequestStats]):
+    # Lets work done on behalf of a request elsewhere, e.g the database writer, be charged to it
+    return _request_stats.set(stats)
+
+
+def unbind_request_stats(token) -> None:
+    _request_stats.reset(token)
+
+
+def record_hash_seconds(seconds: float) -> None:
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.hash_seconds += seconds
+
+
+def record_jwt_seconds(seconds: float) -> None:
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.jwt_seconds += seconds
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+
+    def observe(self, value: float) -> None:
+        # Buckets are upper bounds, the last slot counts everything above them
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class RouteMetrics:
+    __slots__ = ('latency', 'db_queries', 'db_seconds', 'hash_seconds', 'jwt_seconds', 'statuses')
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.db_queries = Histogram(QUERY_COUNT_BUCKETS)
+        self.db_seconds = 0.0
+        self.hash_seconds = 0.0
+        self.jwt_seconds = 0.0
+        self.statuses: Dict[int, int] = {}
+
+
+class RequestMetrics:
+    """Per-route request metrics of this worker, rendered in the Prometheus text format.
+
+    Everything is updated from the event loop thread: the middleware, the SQLAlchemy cursor
+    hooks of the async engines and the hashing pool, which reports after its executor returns.
+    Plain counters are enough, nothing on the request path takes a lock.
+    """
+
+    def __init__(self, slow_request_ms: float = 1000, slow_request_sample_rate: float = 1.0, slow_request_max_statements: int = 50):
+        self.slow_request_seconds = slow_request_ms / 1000
+        self.slow_request_sample_rate = slow_request_sample_rate
+        self.slow_request_max_statements = slow_request_max_statements
+        self.routes: Dict[Tuple[str, str], RouteMetrics] = {}
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.slow_requests = 0
+        self.slow_requests_logged = 0
+
+
+    def new_request_stats(self) -> RequestStats:
+        return RequestStats(max_statements=self.slow_request_max_statements)
+
+
+    def observe_query(self, seconds: float, counted: bool) -> None:
+        # Every statement of the worker, including background work outside of a request
+        self.db_seconds += seconds
+        if counted:
+            self.db_queries += 1
+
+
+    def observe_request(self, method: str, route: str, status_code: int, seconds: float, stats: RequestStats, streaming: bool = False) -> None:
+        route_metrics = self.routes.get((method, route))
+        if route_metrics is None:
+            route_metrics = self.routes[(method, route)] = RouteMetrics()
+
+        route_metrics.latency.observe(seconds)
+        route_metrics.db_queries.observe(stats.db_queries)
+        route_metrics.db_seconds += stats.db_seconds
+        route_metrics.hash_seconds += stats.hash_seconds
+        route_metrics.jwt_seconds += stats.jwt_seconds
+        route_metrics.statuses[status_code] = route_metrics.statuses.get(status_code, 0) + 1
+
+        # Event streams stay open by design, their duration says nothing about the server
+        if seconds >= self.slow_request_seconds and not streaming:
+            self.slow_requests += 1
+            if random.random() < self.slow_request_sample_rate:
+                self.slow_requests_logged += 1
+                self.log_slow_request(method, route, status_code, seconds, stats)
+
+
+    def log_slow_request(self, method: str, route: str, status_code: int, seconds: float, stats: RequestStats) -> None:
+        statements = '\n'.join(f"  {statement_seconds * 1000:.1f} ms: {' '.join(statement.split())}" for statement, statement_seconds in stats.statements)
+        logger.warning(
+            "Slow request %s %s %s in %.1f ms, %s queries in %.1f ms, hashing %.1f ms, jwt %.1f ms%s",
+            method, route, status_code, seconds * 1000, stats.db_queries, stats.db_seconds * 1000, stats.hash_seconds * 1000, stats.jwt_seconds * 1000,
+            f":\n{statements}" if statements else '',
+        )
+
+
+    def render(self) -> str:
+        lines: List[str] = []
+
+        def header(name: str, metric_type: str, help_text: str) -> None:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+
+        def histogram(name: str, select) -> None:
+            for (method, route), route_metrics in self.routes.items():
+                values = select(route_metrics)
+                labels = f'method="{escape_label(method)}",route="{escape_label(route)}"'
+                cumulative = 0
+                for bound, count in zip(values.buckets, values.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {values.count}')
+                lines.append(f'{name}_sum{{{labels}}} {values.sum}')
+                lines.append(f'{name}_count{{{labels}}} {values.count}')
+
+        def route_counter(name: str, help_text: str, select) -> None:
+            header(name, 'counter', help_text)
+            for (method, route), route_metrics in self.routes.items():
+                lines.append(f'{name}{{method="{escape_label(method)}",route="{escape_label(route)}"}} {select(route_metrics)}')
+
+        header('http_requests_total', 'counter', 'Requests served, by route and status code.')
+        for (method, route), route_metrics in self.routes.items():
+            for status_code, count in route_metrics.statuses.items():
+                lines.append(f'http_requests_total{{method="{escape_label(method)}",route="{escape_label(route)}",status="{status_code}"}} {count}')
+
+        header('http_request_duration_seconds', 'histogram', 'Time from receiving the request to sending the last byte of the response.')
+        histogram('http_request_duration_seconds', lambda route_metrics: route_metrics.latency)
+        header('http_request_db_queries', 'histogram', 'Database queries per request, transaction control statements excluded.')
+        histogram('http_request_db_queries', lambda route_metrics: route_metrics.db_queries)
+        route_counter('http_request_db_seconds_total', 'Time spent executing database statements on behalf of requests.', lambda route_metrics: route_metrics.db_seconds)
+        route_counter('http_request_password_hash_seconds_total', 'Time spent hashing or verifying passwords on behalf of requests.', lambda route_metrics: route_metrics.hash_seconds)
+        route_counter('http_request_jwt_seconds_total', 'Time spent encoding or decoding JWTs on behalf of requests.', lambda route_metrics: route_metrics.jwt_seconds)
+
+        header('db_queries_total', 'counter', 'Database queries of this worker, transaction control statements excluded.')
+        lines.append(f'db_queries_total {self.db_queries}')
+        header('db_query_seconds_total', 'counter', 'Time spent executing database statements in this worker.')
+        lines.append(f'db_query_seconds_total {self.db_seconds}')
+        header('http_slow_requests_total', 'counter', 'Requests slower than the slow request threshold.')
+        lines.append(f'http_slow_requests_total {self.slow_requests}')
+        return '\n'.join(lines) + '\n'
+
+
+def escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_gauges(prefix: str, snapshot: dict, help_text: str) -> str:
+    # Numeric values of a metrics snapshot as gauges, e.g the admin metrics of a subsystem
+    lines = []
+    for key, value in snapshot.items():
+        if isinstance(value, bool):
+            value = int(value)
+        if not isinstance(value, (int, float)):
+            continue
+        name = f"{prefix}_{key}"
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {value}")
+    return '\n'.join(lines) + '\n' if lines else ''
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    conn.info[QUERY_STARTED_AT_KEY] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    started_at = conn.info.pop(QUERY_STARTED_AT_KEY, None)
+    if started_at is None or _request_metrics is None:
+        return
+
+    seconds = time.perf_counter() - started_at
+    counted = not statement[:16].lstrip().upper().startswith(TRANSACTION_CONTROL_PREFIXES)
+    _request_metrics.observe_query(seconds, counted)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.observe_query(statement, seconds, counted)
+
+
+class RequestMetricsMiddleware:
+    """Plain ASGI middleware, so streaming responses pass through untouched."""
+
+    def __init__(self, app):
+        self.app = app
+
+
+    async def __call__(self, scope, receive, send) -> None:
+        request_metrics = get_request_metrics() if scope['type'] == 'http' else None
+        if request_metrics is None:
+            await self.app(scope, receive, send)
+            return
+
+        stats = request_metrics.new_request_stats()
+        response = {'status': 500, 'streaming': False}
+
+        async def send_with_status(message) -> None:
+            if message['type'] == 'http.response.start':
+                response['status'] = message['status']
+                response['streaming'] = any(name == b'content-type' and value.startswith(EVENT_STREAM_MEDIA_TYPE) for name, value in message.get('headers', ()))
+            await send(message)
+
+        token = _request_stats.set(stats)
+        started_at = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            seconds = time.perf_counter() - started_at
+            _request_stats.reset(token)
+            # The router leaves the matched route in the scope, its path template is the label
+            route = getattr(scope.get('route'), 'path', None) or UNMATCHED_ROUTE
+            request_metrics.observe_request(scope['method'], route, response['status'], seconds, stats, streaming=response['streaming'])
+
+
+# Process-wide request metrics, created from the settings on first use. None when disabled.
+_request_metrics: Optional[RequestMetrics] = None
+_request_metrics_loaded = False
+
+
+def get_request_metrics() -> Optional[RequestMetrics]:
+    global _request_metrics, _request_metrics_loaded
+    if not _request_metrics_loaded:
+        settings = get_config().metrics
+        if settings.enabled:
+            _request_metrics = RequestMetrics(
+                slow_request_ms=settings.slow_request_ms,
+                slow_request_sample_rate=settings.slow_request_sample_rate,
+                slow_request_max_statements=settings.slow_request_max_statements,
+            )
+            # Listening on the Engine class covers the sync side of every async engine
+            event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        _request_metrics_loaded = True
+    return _request_metrics
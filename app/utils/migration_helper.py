@@ -0,0 +1,99 @@
+from datetime import datetime
+from typing import Callable, List, Tuple
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, insert, inspect, select, text
+from sqlalchemy.engine import Connection
+
+from app.utils.init_db import Base, get_write_engine
+from app.utils.logging_helper import logger
+from app.models import account as model_account, task as model_task
+from app.models.task_search import create_task_search_index
+
+
+# Applied schema versions, kept out of Base.metadata so create_all never touches it
+SCHEMA_VERSION_TABLE = Table(
+    'schema_version',
+    MetaData(),
+    Column('version', Integer, primary_key=True),
+    Column('description', String, nullable=False),
+    Column('applied_at', DateTime(), nullable=False),
+)
+
+# Serializes concurrent workers migrating the same Postgres database
+MIGRATION_LOCK_KEY = 7316
+
+
+def create_tables(connection: Connection) -> None:
+    Base.metadata.create_all(bind=connection, tables=[model_account.Account.__table__, model_task.Task.__table__])
+
+
+def create_composite_task_indexes(connection: Connection) -> None:
+    # Create indexes added after the table was first created
+    for index in model_task.Task.__table__.indexes:
+        index.create(bind=connection, checkfirst=True)
+
+    # Drop the single column indexes superseded by the composite ones
+    for index_name in model_task.OBSOLETE_TASK_INDEXES:
+        connection.execute(text(f"DROP INDEX IF EXISTS {index_name}"))
+
+
+def add_missing_column(connection: Connection, table_name: str, column_name: str, column_ddl: str) -> None:
+    # Tables created by create_all after the column was added already have it
+    columns = {column['name'] for column in inspect(connection).get_columns(table_name)}
+    if column_name not in columns:
+        connection.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_ddl}"))
+
+
+def add_task_version(connection: Connection) -> None:
+    add_missing_column(connection, 'tasks', 'version', "INTEGER NOT NULL DEFAULT 1")
+
+
+def add_account_tasks_version(connection: Connection) -> None:
+    add_missing_column(connection, 'accounts', 'tasks_version', "INTEGER NOT NULL DEFAULT 0")
+
+
+# Migrations are never edited once released, append a new version instead. Databases
+# created before versioning get every migration applied, so each one is idempotent.
+MIGRATIONS: Tuple[Tuple[int, str, Callable[[Connection], None]], ...] = (
+    (1, "Create the accounts and tasks tables", create_tables),
+    (2, "Replace the single column task indexes with composite owner indexes", create_composite_task_indexes),
+    (3, "Create the task full-text search index", create_task_search_index),
+    (4, "Add the task version column", add_task_version),
+    (5, "Add the account task collection version column", add_account_tasks_version),
+)
+
+
+def get_schema_version(connection: Connection) -> int:
+    SCHEMA_VERSION_TABLE.create(bind=connection, checkfirst=True)
+    return connection.execute(select(func.max(SCHEMA_VERSION_TABLE.c.version))).scalar() or 0
+
+
+def apply_migrations(connection: Connection) -> List[int]:
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {'key': MIGRATION_LOCK_KEY})
+
+    current_version = get_schema_version(connection)
+    applied = []
+    for version, description, migrate in MIGRATIONS:
+        if version <= current_version:
+            continue
+
+        logger.info("Applying schema migration %s: %s", version, description)
+        migrate(connection)
+        connection.execute(insert(SCHEMA_VERSION_TABLE).values(version=version, description=description, applied_at=datetime.now()))
+        applied.append(version)
+
+    return applied
+
+
+async def run_migrations() -> List[int]:
+    # One transaction for every pending migration. On SQLite the writer engine takes
+    # the write lock up front, so workers starting together migrate one at a time.
+    async with get_write_engine().begin() as connection:
+        applied = await connection.run_sync(apply_migrations)
+
+    if applied:
+        logger.info("Database schema migrated to version %s", applied[-1])
+    else:
+        logger.info("Database schema up to date")
+    return applied
@@ -0,0 +1,40 @@
+import json
+from typing import AsyncIterator, Any
+
+from fastapi import HTTPException, Request, status
+
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+async def iter_ndjson(request: Request, max_line_bytes: int = 65536) -> AsyncIterator[Any]:
+    # Decode one JSON document per line as the body arrives, never buffering the whole body
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        # Complete lines of a large chunk count as much as the unterminated tail
+        _check_line_size(buffer, max_line_bytes)
+        for line in lines:
+            _check_line_size(line, max_line_bytes)
+            if line.strip():
+                yield _decode_line(line)
+
+    if buffer.strip():
+        yield _decode_line(buffer)
+
+
+def _check_line_size(line: bytes, max_line_bytes: int) -> None:
+    if len(line) > max_line_bytes:
+        raise HTTPException(
+            status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+            detail=f"NDJSON line exceeds {max_line_bytes} bytes"
+        )
+
+
+def _decode_line(line: bytes) -> Any:
+    try:
+        return json.loads(line)
+    except ValueError:
+        # Surface malformed lines to the caller as per item failures
+        return None
@@ -0,0 +1,63 @@
+import base64
+import json
+import math
+from datetime import datetime
+from typing import Any, Callable, Optional
+
+from fastapi import Depends, HTTPException, Query, status
+
+from app.core.configuration import Settings
+from app.utils.config_helper import get_settings
+
+
+async def get_page_limit(limit: int = Query(20, ge=1, description="Page size, at most tasks.max_page_size"), config: Settings = Depends(get_settings)) -> int:
+    # The upper bound follows the settings snapshot, so it is checked here rather than in the signature
+    if limit > config.tasks.max_page_size:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_CONTENT,
+            detail=f"Page size is limited to {config.tasks.max_page_size}"
+        )
+    return limit
+
+
+def encode_cursor(last_id: int, sort: Optional[str] = None, sort_value: Any = None) -> str:
+    # Opaque url-safe cursor pointing after the last returned row
+    cursor = {'id': last_id}
+    if sort:
+        cursor.update({'sort': sort, 'value': sort_value})
+    payload = json.dumps(cursor, separators=(',', ':'), default=str).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+
+def decode_cursor(cursor: Optional[str], parse_value: Optional[Callable[[Any], Any]] = None) -> Optional[dict]:
+    # Cursors come back from clients, anything tampered or stale is a 400, never a 500
+    if not cursor:
+        return None
+
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        decoded = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(decoded, dict) or type(decoded.get('id')) is not int:
+            raise ValueError("Cursor id must be an integer")
+        if not isinstance(decoded.get('sort', ''), str):
+            raise ValueError("Cursor sort must be a string")
+        if parse_value is not None:
+            decoded['value'] = parse_value(decoded.get('value'))
+        return decoded
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+
+def parse_datetime_value(value: Any) -> datetime:
+    if not isinstance(value, str):
+        raise ValueError("Cursor value must be an ISO 8601 string")
+    return datetime.fromisoformat(value)
+
+
+def parse_float_value(value: Any) -> float:
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise ValueError("Cursor value must be a finite number")
+    return float(value)
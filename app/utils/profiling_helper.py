@@ -0,0 +1,262 @@
+from collections import Counter
+from typing import Dict, List, Literal, Optional, Tuple, get_args
+import asyncio
+import linecache
+import os
+import sys
+import threading
+import time
+import traceback
+
+from app.utils.logging_helper import logger
+
+
+# Accepted by the admin profile endpoint and checked again by the sampler and the controller
+ProfileMode = Literal['wall', 'cpu']
+ProfileFormat = Literal['collapsed', 'speedscope']
+PROFILE_MODES = get_args(ProfileMode)
+PROFILE_FORMATS = get_args(ProfileFormat)
+SPEEDSCOPE_SCHEMA = 'https://www.speedscope.app/file-format-schema.json'
+
+# Leaf frames of a thread parked on I/O or a queue, and the blocking calls a leaf line can be
+# waiting in, e.g the queue get of the aiosqlite connection threads. CPU profiles leave those out.
+IDLE_FRAMES = {
+    ('selectors.py', 'select'),
+    ('threading.py', 'wait'),
+    ('threading.py', '_wait_for_tstate_lock'),
+    ('queue.py', 'get'),
+    ('thread.py', '_worker'),
+}
+IDLE_CALLS = ('.get(', '.wait(', '.select(', '.acquire(', '.accept(', 'sleep(')
+
+
+class Profile:
+    """Stack samples of every thread of the worker, aggregated by stack."""
+
+    def __init__(self, mode: str, interval_seconds: float):
+        self.mode = mode
+        self.interval_seconds = interval_seconds
+        self.duration_seconds = 0.0
+        self.samples = 0
+        self.stacks: Counter = Counter()
+
+
+    def to_collapsed(self) -> str:
+        # One line per stack, root first, as read by flamegraph.pl and speedscope
+        return ''.join(
+            f"{thread_name};{';'.join(f'{name} ({file}:{line})'.replace(';', ':') for name, file, line in stack)} {count}\n"
+            for (thread_name, stack), count in self.stacks.most_common()
+        )
+
+
+    def to_speedscope(self) -> dict:
+        frames: List[dict] = []
+        frame_indexes: Dict[Tuple[str, str, int], int] = {}
+        profiles: Dict[str, dict] = {}
+
+        for (thread_name, stack), count in self.stacks.items():
+            profile = profiles.get(thread_name)
+            if profile is None:
+                profile = profiles[thread_name] = {
+                    'type': 'sampled',
+                    'name': thread_name,
+                    'unit': 'seconds',
+                    'startValue': 0,
+                    'endValue': self.duration_seconds,
+                    'samples': [],
+                    'weights': [],
+                }
+
+            sample = []
+            for frame in stack:
+                index = frame_indexes.get(frame)
+                if index is None:
+                    index = frame_indexes[frame] = len(frames)
+                    name, file, line = frame
+                    frames.append({'name': name, 'file': file, 'line': line})
+                sample.append(index)
+            profile['samples'].append(sample)
+            profile['weights'].append(count * self.interval_seconds)
+
+        return {
+            '$schema': SPEEDSCOPE_SCHEMA,
+            'name': f"{self.mode} profile of worker {os.getpid()}",
+            'exporter': 'task-management-api',
+            'shared': {'frames': frames},
+            'profiles': list(profiles.values()),
+        }
+
+
+class SamplingProfiler:
+    """Samples the stacks of every thread from a background thread, one profile at a time."""
+
+    def __init__(self):
+        self.running = False
+        self._frames: Dict[object, Tuple[str, str, int]] = {}
+        self._idle_lines: Dict[Tuple[object, int], bool] = {}
+
+
+    def _frame(self, code) -> Tuple[str, str, int]:
+        frame = self._frames.get(code)
+        if frame is None:
+            file = code.co_filename
+            # Trim the interpreter and site-packages prefixes, keep the path inside the project or package
+            prefixes = [path for path in sys.path if path and file.startswith(path)]
+            if prefixes:
+                file = file[len(max(prefixes, key=len)):].lstrip(os.sep)
+            frame = self._frames[code] = (getattr(code, 'co_qualname', code.co_name), file, code.co_firstlineno)
+        return frame
+
+
+    def _is_idle(self, frame) -> bool:
+        key = (frame.f_code, frame.f_lineno)
+        idle = self._idle_lines.get(key)
+        if idle is None:
+            code = frame.f_code
+            line = linecache.getline(code.co_filename, frame.f_lineno)
+            idle = self._idle_lines[key] = (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES or any(call in line for call in IDLE_CALLS)
+        return idle
+
+
+    def sample(self, seconds: float, interval_seconds: float, mode: str = 'wall') -> Profile:
+        # Blocking, run it off the event loop
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode: {mode}, expected one of {PROFILE_MODES}")
+        profile = Profile(mode=mode, interval_seconds=interval_seconds)
+        own_thread_id = threading.get_ident()
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+
+        started_at = time.perf_counter()
+        deadline = started_at + seconds
+        while time.perf_counter() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread_id:
+                    continue
+                if mode == 'cpu' and self._is_idle(frame):
+                    continue
+
+                stack = []
+                while frame is not None:
+                    stack.append(self._frame(frame.f_code))
+                    frame = frame.f_back
+                thread_name = thread_names.get(thread_id)
+                if thread_name is None:
+                    thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+                    thread_name = thread_names.get(thread_id, str(thread_id))
+                profile.stacks[(thread_name, tuple(reversed(stack)))] += 1
+            profile.samples += 1
+            time.sleep(interval_seconds)
+
+        profile.duration_seconds = time.perf_counter() - started_at
+        return profile
+
+
+class LoopLagMetrics:
+    def __init__(self):
+        self.stalls = 0
+        self.stall_seconds_total = 0.0
+        self.stall_seconds_max = 0.0
+
+
+    def observe(self, lag_seconds: float) -> None:
+        self.stalls += 1
+        self.stall_seconds_total += lag_seconds
+        self.stall_seconds_max = max(self.stall_seconds_max, lag_seconds)
+
+
+    def snapshot(self) -> dict:
+        return {
+            'stalls': self.stalls,
+            'stall_seconds_total': self.stall_seconds_total,
+            'stall_seconds_max': self.stall_seconds_max,
+        }
+
+
+class LoopLagMonitor:
+    """Logs the stack of whatever blocks the event loop longer than the threshold.
+
+    The loop stamps a heartbeat every quarter of the threshold. A watchdog thread that finds
+    the heartbeat late grabs the loop thread's current stack, so the log shows the blocking
+    call itself, e.g a synchronous bcrypt or database call, while it is still running.
+    """
+
+    def __init__(self, threshold_ms: float):
+        self.threshold_seconds = threshold_ms / 1000
+        self.interval_seconds = self.threshold_seconds / 4
+        self.metrics = LoopLagMetrics()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat: Optional[asyncio.TimerHandle] = None
+        self._last_beat = time.monotonic()
+        self._reported_beat: Optional[float] = None
+        self._stopped = threading.Event()
+        self._watchdog: Optional[threading.Thread] = None
+
+
+    def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._heartbeat = self._loop.call_later(self.interval_seconds, self._beat)
+        self._watchdog = threading.Thread(target=self._watch, name='loop-lag-watchdog', daemon=True)
+        self._watchdog.start()
+
+
+    def _beat(self) -> None:
+        now = time.monotonic()
+        lag = now - self._last_beat - self.interval_seconds
+        if lag > self.threshold_seconds:
+            self.metrics.observe(lag)
+            logger.warning("Event loop was blocked for %.1f ms", lag * 1000)
+        self._last_beat = now
+        self._heartbeat = self._loop.call_later(self.interval_seconds, self._beat)
+
+
+    def _watch(self) -> None:
+        while not self._stopped.wait(self.interval_seconds):
+            last_beat = self._last_beat
+            lag = time.monotonic() - last_beat - self.interval_seconds
+            # One stack per stall, taken while the loop is still blocked
+            if lag <= self.threshold_seconds or self._reported_beat == last_beat:
+                continue
+            self._reported_beat = last_beat
+
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            stack = ''.join(traceback.format_stack(frame))
+            logger.warning("Event loop blocked for over %.1f ms in:\n%s", lag * 1000, stack)
+
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            self._heartbeat = None
+        if self._watchdog is not None:
+            self._watchdog.join(timeout=1)
+            self._watchdog = None
+
+
+# Process-wide profiler and event loop monitor of this worker
+sampling_profiler = SamplingProfiler()
+_loop_lag_monitor: Optional[LoopLagMonitor] = None
+
+
+def get_loop_lag_monitor() -> Optional[LoopLagMonitor]:
+    return _loop_lag_monitor
+
+
+def start_loop_lag_monitor(threshold_ms: float) -> None:
+    global _loop_lag_monitor
+    if threshold_ms > 0 and _loop_lag_monitor is None:
+        logger.info("Watching for event loop stalls over %s ms", threshold_ms)
+        _loop_lag_monitor = LoopLagMonitor(threshold_ms)
+        _loop_lag_monitor.start()
+
+
+def stop_loop_lag_monitor() -> None:
+    global _loop_lag_monitor
+    if _loop_lag_monitor is not None:
+        _loop_lag_monitor.stop()
+        _loop_lag_monitor = None
@@ -0,0 +1,24 @@
+from typing import Any, Iterable, Sequence
+
+import orjson
+from fastapi.responses import JSONResponse
+
+
+class ORJSONResponse(JSONResponse):
+    # Same as fastapi.responses.ORJSONResponse, which warns on every use since it was deprecated
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+def dump_row(row: Sequence[Any], columns: Sequence[str]) -> bytes:
+    return orjson.dumps(_row_to_dict(row, columns))
+
+
+def dump_rows(rows: Iterable[Sequence[Any]], columns: Sequence[str]) -> bytes:
+    # Row tuples straight to a JSON array, no models built and no response validation
+    return orjson.dumps([_row_to_dict(row, columns) for row in rows])
+
+
+def _row_to_dict(row: Sequence[Any], columns: Sequence[str]) -> dict:
+    # Columns past the named ones are dropped and None values are left out, like response_model_exclude_none
+    return {column: value for column, value in zip(columns, row) if value is not None}
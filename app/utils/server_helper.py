@@ -0,0 +1,76 @@
+import importlib.util
+import os
+import ssl
+from typing import Callable
+
+from uvicorn import Config
+
+from app.core.configuration import Settings
+from app.utils.config_helper import ENVIRONMENT_VARIABLE, get_config
+from app.utils.logging_helper import logger
+
+
+def resolve_workers(workers: int) -> int:
+    return workers if workers > 0 else (os.cpu_count() or 1)
+
+
+def resolve_implementation(configured: str, fast: str, fallback: str) -> str:
+    # Report what 'auto' resolves to, uvicorn makes the same choice
+    if configured != "auto":
+        return configured
+    return fast if importlib.util.find_spec(fast) is not None else fallback
+
+
+def create_ssl_context(config: Config, default_factory: Callable[[], ssl.SSLContext]) -> ssl.SSLContext:
+    # Called by uvicorn inside every worker. An SSLContext cannot be shared between
+    # processes, so each worker loads the cert and key itself and applies the same policy.
+    ssl_context = default_factory()
+    ssl_context.minimum_version = getattr(ssl.TLSVersion, get_config().server.tls_minimum_version)
+    return ssl_context
+
+
+def get_uvicorn_options(cfg: Settings) -> dict:
+    server = cfg.server
+    options = {
+        'host': cfg.app.host,
+        'port': cfg.app.port,
+        'lifespan': cfg.app.lifespan,
+        'reload': cfg.app.reload,
+        'loop': server.loop,
+        'http': server.http,
+        'backlog': server.backlog,
+        'timeout_keep_alive': server.timeout_keep_alive,
+        'timeout_graceful_shutdown': server.timeout_graceful_shutdown,
+        'limit_concurrency': server.limit_concurrency,
+        'limit_max_requests': server.limit_max_requests,
+        'limit_max_requests_jitter': server.limit_max_requests_jitter,
+        'proxy_headers': server.proxy_headers,
+        'forwarded_allow_ips': server.forwarded_allow_ips,
+        'ssl_certfile': cfg.app.tls_cert_path,
+        'ssl_keyfile': cfg.app.tls_key_path,
+        'ssl_context_factory': create_ssl_context,
+    }
+
+    # uvicorn runs a single process under the reloader
+    if not cfg.app.reload:
+        options['workers'] = resolve_workers(server.workers)
+    return options
+
+
+def log_server_plan(cfg: Settings, options: dict) -> None:
+    logger.info(
+        "Serving %s on %s:%s with %s worker(s), %s loop and %s http parser",
+        cfg.app.entry_point,
+        cfg.app.host,
+        cfg.app.port,
+        options.get('workers', 1),
+        resolve_implementation(cfg.server.loop, 'uvloop', 'asyncio'),
+        resolve_implementation(cfg.server.http, 'httptools', 'h11'),
+    )
+    if options.get('workers', 1) > 1:
+        logger.info("Send SIGHUP to restart the workers gracefully, SIGTTIN/SIGTTOU to add or remove one")
+
+
+def prepare_worker_environment(cfg: Settings) -> None:
+    # Workers resolve the environment from APP_ENV instead of re-parsing the command line
+    os.environ[ENVIRONMENT_VARIABLE] = cfg.environment
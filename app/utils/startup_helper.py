@@ -0,0 +1,35 @@
+import time
+from typing import Dict, Optional
+
+
+class StartupTimer:
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.ready_seconds: Optional[float] = None
+        self._last_mark = self.started_at
+
+
+    def mark(self, stage: str) -> float:
+        # Time spent since the previous mark, recorded under the stage name
+        now = time.perf_counter()
+        elapsed = now - self._last_mark
+        self.stages[stage] = elapsed
+        self._last_mark = now
+        return elapsed
+
+
+    def ready(self) -> float:
+        self.ready_seconds = time.perf_counter() - self.started_at
+        return self.ready_seconds
+
+
+    def snapshot(self) -> dict:
+        return {
+            'stages_ms': {stage: round(seconds * 1000, 3) for stage, seconds in self.stages.items()},
+            'ready_ms': round(self.ready_seconds * 1000, 3) if self.ready_seconds is not None else None,
+        }
+
+
+# Started when main begins importing, so the import itself is part of the measurement
+startup_timer = StartupTimer()
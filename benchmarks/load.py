@@ -0,0 +1,418 @@
+"""Throughput and latency of recorded request mixes, in process and over a live server.
+
+Seeds a scratch database of the test profile with accounts and tasks, logs every account in,
+then replays one request mix after the other:
+
+- login_burst: a herd of logged out accounts logging in at once, bound by the hashing pool.
+  An account only logs in once, so the mix is capped at --login-accounts requests.
+- list_polling: conditional polling of the first task page and of single tasks
+- churn: task creates, updates and deletes
+
+The asgi target drives main.app in process through httpx, the uvicorn target starts a uvicorn
+server on the same database. Each mix reports RPS, p50/p95/p99 per route and the CPU time spent
+per request: the whole process for the asgi target, the server processes for uvicorn.
+
+The generated requests are deterministic for a given --seed. --record writes them as JSON lines
+and --replay sends a recorded file again, with the same --accounts, --tasks and --login-accounts
+it was recorded with. --output writes the results as JSON, --compare diffs them with a previous results file.
+
+    python -m benchmarks.load --target asgi --accounts 20 --tasks 200 --requests 2000 --output before.json
+    python -m benchmarks.load --target uvicorn --workers 2 --compare before.json
+"""
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PASSWORD = 'benchmark-password'
+MIXES = ('login_burst', 'list_polling', 'churn')
+
+LOGIN_ROUTE = 'POST /api/v1/accounts/login'
+LIST_ROUTE = 'GET /api/v1/tasks/'
+GET_ROUTE = 'GET /api/v1/tasks/{task_id}'
+CREATE_ROUTE = 'POST /api/v1/tasks/create/'
+UPDATE_ROUTE = 'PUT /api/v1/tasks/update/{task_id}'
+DELETE_ROUTE = 'DELETE /api/v1/tasks/remove/{task_id}'
+
+
+def request_spec(mix: str, route: str, path: str, account: int, body: Optional[dict] = None, conditional: bool = False) -> dict:
+    spec = {'mix': mix, 'route': route, 'method': route.split(' ', 1)[0], 'path': path, 'account': account}
+    if body is not None:
+        spec['json'] = body
+    if conditional:
+        spec['conditional'] = True
+    return spec
+
+
+def generate_requests(mix: str, count: int, seeded: List[dict], login_accounts: List[dict], rng: random.Random) -> List[dict]:
+    if mix == 'login_burst':
+        return [
+            request_spec(mix, LOGIN_ROUTE, '/api/v1/accounts/login', index, {'email': account['email'], 'password': PASSWORD})
+            for index, account in enumerate(login_accounts[:count])
+        ]
+
+    requests = []
+    # Updates and reads target the first half of each account's tasks, deletes use up the second half
+    deletable = [list(reversed(account['task_ids'][len(account['task_ids']) // 2:])) for account in seeded]
+
+    for _ in range(count):
+        index = rng.randrange(len(seeded))
+        account = seeded[index]
+        stable_ids = account['task_ids'][:max(len(account['task_ids']) // 2, 1)]
+        roll = rng.random()
+
+        if mix == 'list_polling':
+            if roll < 0.7 or not account['task_ids']:
+                requests.append(request_spec(mix, LIST_ROUTE, '/api/v1/tasks/?limit=20', index, conditional=True))
+            else:
+                requests.append(request_spec(mix, GET_ROUTE, f"/api/v1/tasks/{rng.choice(stable_ids)}", index, conditional=True))
+        elif mix == 'churn':
+            if roll < 0.4 or not account['task_ids']:
+                requests.append(request_spec(mix, CREATE_ROUTE, '/api/v1/tasks/create/', index, {'title': f"Task {rng.randrange(10 ** 6)}", 'description': 'Created by the load benchmark'}))
+            elif roll < 0.85 or not deletable[index]:
+                requests.append(request_spec(mix, UPDATE_ROUTE, f"/api/v1/tasks/update/{rng.choice(stable_ids)}", index, {'completed': rng.random() < 0.5}))
+            else:
+                requests.append(request_spec(mix, DELETE_ROUTE, f"/api/v1/tasks/remove/{deletable[index].pop()}", index))
+        else:
+            raise SystemExit(f"Unknown request mix: {mix}")
+    return requests
+
+
+async def seed_database(accounts: int, tasks: int, login_accounts: int) -> Tuple[List[dict], List[dict]]:
+    # Through the app's own schema layer, so the seeded rows look like the ones the API writes
+    from app.core.hashing import shutdown_password_hasher
+    from app.core.security import get_password_hash
+    from app.schemas.account import Account as schema_account, AccountCreate
+    from app.schemas.task import Task as schema_task, TaskCreate
+    from app.utils.init_db import dispose_engines, new_async_session
+    from app.utils.migration_helper import run_migrations
+
+    await run_migrations()
+    # One bcrypt hash shared by every account, seeding should not take minutes
+    hashed_password = await get_password_hash(PASSWORD)
+    shutdown_password_hasher()
+
+    seeded, login_seeded = [], []
+    async with new_async_session() as db:
+        for index in range(accounts + login_accounts):
+            account = await schema_account.create_account(
+                db=db,
+                account=AccountCreate(last_name='Bench', first_name=f"User{index}", username=f"bench{index}", email=f"bench{index}@example.com", password=PASSWORD),
+                hashed_password=hashed_password,
+            )
+            if index >= accounts:
+                login_seeded.append({'id': account.id, 'email': account.email})
+                continue
+
+            new_tasks = [TaskCreate(title=f"Task {number}", description='Seeded by the load benchmark') for number in range(tasks)]
+            db_tasks = await schema_task.create_tasks(db=db, account_id=account.id, tasks=new_tasks) if new_tasks else []
+            seeded.append({'id': account.id, 'email': account.email, 'task_ids': [task.id for task in db_tasks]})
+
+    await dispose_engines()
+    return seeded, login_seeded
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    # Nearest rank, so p99 of a small sample is an observed latency
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(math.ceil(fraction * len(sorted_values)) - 1, 0)]
+
+
+def summarize_latencies(latencies: List[float], duration: float) -> dict:
+    values = sorted(latencies)
+    return {
+        'requests': len(values),
+        'rps': len(values) / duration if duration else 0.0,
+        'mean_ms': sum(values) / len(values) if values else 0.0,
+        'p50_ms': percentile(values, 0.50),
+        'p95_ms': percentile(values, 0.95),
+        'p99_ms': percentile(values, 0.99),
+        'max_ms': values[-1] if values else 0.0,
+    }
+
+
+def read_process_cpu_seconds(pid: int) -> Optional[float]:
+    # User and system time of a process and its direct children, from /proc. None off Linux.
+    try:
+        pids = [pid] + [int(child) for child in open(f"/proc/{pid}/task/{pid}/children").read().split()]
+        ticks = 0
+        for process_id in pids:
+            fields = open(f"/proc/{process_id}/stat").read().rsplit(')', 1)[1].split()
+            ticks += int(fields[11]) + int(fields[12])
+        return ticks / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class LoadRunner:
+    def __init__(self, client: httpx.AsyncClient, tokens: Dict[int, str], concurrency: int):
+        self.client = client
+        self.tokens = tokens
+        self.concurrency = concurrency
+        self.etags: Dict[tuple, str] = {}
+
+
+    async def send(self, spec: dict) -> int:
+        headers = {}
+        if spec['route'] != LOGIN_ROUTE:
+            headers['authorization'] = f"Bearer {self.tokens[spec['account']]}"
+        etag = self.etags.get((spec['account'], spec['path'])) if spec.get('conditional') else None
+        if etag is not None:
+            headers['if-none-match'] = etag
+
+        response = await self.client.request(spec['method'], spec['path'], json=spec.get('json'), headers=headers)
+        if spec.get('conditional') and response.status_code == 200 and 'etag' in response.headers:
+            self.etags[(spec['account'], spec['path'])] = response.headers['etag']
+        return response.status_code
+
+
+    async def run(self, specs: List[dict], cpu_seconds) -> dict:
+        latencies: Dict[str, List[float]] = defaultdict(list)
+        statuses: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        pending = iter(specs)
+
+        async def worker():
+            for spec in pending:
+                started_at = time.perf_counter()
+                try:
+                    status_code = await self.send(spec)
+                except httpx.HTTPError:
+                    status_code = 0
+                latencies[spec['route']].append((time.perf_counter() - started_at) * 1000)
+                statuses[spec['route']][str(status_code) if status_code else 'error'] += 1
+
+        cpu_started = cpu_seconds()
+        started_at = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        duration = time.perf_counter() - started_at
+        cpu_finished = cpu_seconds()
+
+        result = summarize_latencies([latency for values in latencies.values() for latency in values], duration)
+        result['duration_s'] = duration
+        result['cpu_ms_per_request'] = (cpu_finished - cpu_started) * 1000 / len(specs) if specs and cpu_started is not None and cpu_finished is not None else None
+        result['status'] = {}
+        for route_statuses in statuses.values():
+            for status_code, count in route_statuses.items():
+                result['status'][status_code] = result['status'].get(status_code, 0) + count
+        result['routes'] = {route: {**summarize_latencies(values, duration), 'status': dict(statuses[route])} for route, values in latencies.items()}
+        return result
+
+
+async def log_in_accounts(client: httpx.AsyncClient, seeded: List[dict]) -> Dict[int, str]:
+    # Warm up and activate every account, a few at a time to stay under the hashing pool capacity
+    tokens = {}
+    semaphore = asyncio.Semaphore(4)
+
+    async def login(index: int, account: dict):
+        async with semaphore:
+            for _ in range(20):
+                response = await client.post('/api/v1/accounts/login', json={'email': account['email'], 'password': PASSWORD})
+                if response.status_code == 200:
+                    tokens[index] = response.json()['access_token']
+                    return
+                await asyncio.sleep(float(response.headers.get('retry-after', 0.1)))
+            raise SystemExit(f"Failed to log in {account['email']}: {response.status_code} {response.text}")
+
+    await asyncio.gather(*(login(index, account) for index, account in enumerate(seeded)))
+    return tokens
+
+
+async def run_mixes(client: httpx.AsyncClient, seeded: List[dict], specs_by_mix: Dict[str, List[dict]], concurrency: int, cpu_seconds) -> Dict[str, dict]:
+    tokens = await log_in_accounts(client, seeded)
+    runner = LoadRunner(client, tokens, concurrency)
+    return {mix: await runner.run(specs, cpu_seconds) for mix, specs in specs_by_mix.items()}
+
+
+async def run_asgi(seeded: List[dict], specs_by_mix: Dict[str, List[dict]], concurrency: int) -> Dict[str, dict]:
+    import main
+
+    async with main.lifespan(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://benchmark', timeout=60) as client:
+            return await run_mixes(client, seeded, specs_by_mix, concurrency, time.process_time)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def wait_until_ready(client: httpx.AsyncClient, server: subprocess.Popen, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise SystemExit(f"uvicorn exited with code {server.returncode}")
+        try:
+            if (await client.get('/openapi.json')).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.1)
+    raise SystemExit("uvicorn did not start in time")
+
+
+async def run_uvicorn(seeded: List[dict], specs_by_mix: Dict[str, List[dict]], concurrency: int, workers: int) -> Dict[str, dict]:
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'main:app', '--host', '127.0.0.1', '--port', str(port), '--workers', str(workers), '--no-access-log', '--log-level', 'warning'],
+        cwd=ROOT_DIR,
+        env=os.environ.copy(),
+    )
+    try:
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60) as client:
+            await wait_until_ready(client, server)
+            return await run_mixes(client, seeded, specs_by_mix, concurrency, lambda: read_process_cpu_seconds(server.pid))
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+def read_specs(path: str) -> Dict[str, List[dict]]:
+    specs_by_mix: Dict[str, List[dict]] = {}
+    with open(path) as file:
+        for line in file:
+            if line.strip():
+                spec = json.loads(line)
+                specs_by_mix.setdefault(spec['mix'], []).append(spec)
+    return specs_by_mix
+
+
+def write_specs(path: str, specs: Iterable[dict]) -> None:
+    with open(path, 'w') as file:
+        for spec in specs:
+            file.write(json.dumps(spec, separators=(',', ':')) + '\n')
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_results(baseline: dict, results: dict) -> List[dict]:
+    rows = []
+    for mix, mix_result in results['mixes'].items():
+        baseline_mix = baseline.get('mixes', {}).get(mix)
+        if baseline_mix is None:
+            continue
+        for route, route_result in [('*', mix_result)] + sorted(mix_result['routes'].items()):
+            baseline_route = baseline_mix if route == '*' else baseline_mix['routes'].get(route)
+            if baseline_route is None:
+                continue
+            row = {'mix': mix, 'route': route}
+            for metric in ('rps', 'p50_ms', 'p99_ms'):
+                before, after = baseline_route[metric], route_result[metric]
+                row[metric] = {'before': before, 'after': after, 'change': (after - before) / before if before else None}
+            rows.append(row)
+    return rows
+
+
+def print_results(results: dict) -> None:
+    print(f"{results['target']} at {results['git_commit']}: {results['accounts']} accounts, {results['tasks']} tasks each, concurrency {results['concurrency']}")
+    for mix, mix_result in results['mixes'].items():
+        cpu = mix_result['cpu_ms_per_request']
+        print(f"\n{mix}: {mix_result['requests']} requests, {mix_result['rps']:.0f} rps, cpu {'n/a' if cpu is None else f'{cpu:.2f} ms'} per request, status {mix_result['status']}")
+        print(f"  {'route':<40}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for route, route_result in sorted(mix_result['routes'].items()):
+            print(f"  {route:<40}{route_result['rps']:>9.0f}{route_result['p50_ms']:>10.2f}{route_result['p95_ms']:>10.2f}{route_result['p99_ms']:>10.2f}")
+
+
+def print_comparison(rows: List[dict]) -> None:
+    print(f"\n  {'mix':<14}{'route':<40}{'rps':>9}{'p50':>9}{'p99':>9}")
+    for row in rows:
+        changes = [row[metric]['change'] for metric in ('rps', 'p50_ms', 'p99_ms')]
+        print(f"  {row['mix']:<14}{row['route']:<40}" + ''.join(f"{'n/a' if change is None else f'{change:+.1%}':>9}" for change in changes))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load benchmark replaying request mixes against the app")
+    parser.add_argument('--target', choices=('asgi', 'uvicorn'), default='asgi')
+    parser.add_argument('--workers', type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument('--accounts', type=int, default=20)
+    parser.add_argument('--tasks', type=int, default=200, help="Tasks seeded per account")
+    parser.add_argument('--login-accounts', type=int, default=50, help="Logged out accounts seeded for the login burst")
+    parser.add_argument('--mix', action='append', choices=MIXES, help="Mix to run, repeat for several, all of them by default")
+    parser.add_argument('--requests', type=int, default=1000, help="Requests per mix")
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--database-url', help="Run against this database instead of a scratch SQLite file")
+    parser.add_argument('--record', help="Write the generated requests to this JSON lines file")
+    parser.add_argument('--replay', help="Send the requests of this JSON lines file instead of generating them")
+    parser.add_argument('--output', help="Write the results to this JSON file")
+    parser.add_argument('--compare', help="Results JSON of a previous run to diff against")
+    parser.add_argument('--json', action='store_true', help="Print the results as JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        # The test profile reads its database from TEST_DATABASE_URL, the uvicorn server inherits both
+        os.environ['APP_ENV'] = 'test'
+        os.environ['TEST_DATABASE_URL'] = args.database_url or f"sqlite:///{os.path.join(directory, 'load.db')}"
+        sys.path.insert(0, ROOT_DIR)
+
+        seeded, login_accounts = asyncio.run(seed_database(args.accounts, args.tasks, args.login_accounts))
+        if args.replay:
+            specs_by_mix = read_specs(args.replay)
+        else:
+            rng = random.Random(args.seed)
+            specs_by_mix = {mix: generate_requests(mix, args.requests, seeded, login_accounts, rng) for mix in args.mix or MIXES}
+        if args.record:
+            write_specs(args.record, (spec for specs in specs_by_mix.values() for spec in specs))
+
+        if args.target == 'asgi':
+            mixes = asyncio.run(run_asgi(seeded, specs_by_mix, args.concurrency))
+        else:
+            mixes = asyncio.run(run_uvicorn(seeded, specs_by_mix, args.concurrency, args.workers))
+
+    results = {
+        'target': args.target,
+        'workers': args.workers if args.target == 'uvicorn' else None,
+        'cpu_scope': 'process' if args.target == 'asgi' else 'server',
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'accounts': args.accounts,
+        'tasks': args.tasks,
+        'login_accounts': args.login_accounts,
+        'concurrency': args.concurrency,
+        'seed': args.seed,
+        'replay': args.replay,
+        'mixes': mixes,
+    }
+    if args.compare:
+        with open(args.compare) as file:
+            results['comparison'] = compare_results(json.load(file), results)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    if args.json:
+        print(json.dumps(results))
+        return
+
+    print_results(results)
+    if args.compare:
+        print_comparison(results['comparison'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+"""Cost of turning a page of tasks into response bytes, per 1k tasks.
+
+Compares the paths a task list has taken through the app:
+
+- stdlib: response_model validation, jsonable_encoder and json.dumps, the old JSONResponse path
+- pydantic: response_model validation and pydantic's own dump_json
+- orjson: response_model validation, then ORJSONResponse, what an app-wide ORJSONResponse
+  default does to every route with a response model
+- rows: plain row tuples straight to orjson, the hot read path
+
+The fetch section reads the same tasks from a scratch SQLite database as ORM objects and as
+row tuples, so it includes the cost of hydrating the ORM objects.
+
+    python -m benchmarks.serialization --tasks 1000 --repeat 50
+"""
+from datetime import datetime, timedelta
+from typing import Callable, List
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from app.models.account import Account as model_account
+from app.models.task import Task as model_task
+from app.schemas.task import TaskInDB, TASK_RESPONSE_COLUMNS, Task as schema_task
+from app.utils.init_db import Base
+from app.utils.serialization_helper import ORJSONResponse, dump_rows
+
+
+TASK_LIST_ADAPTER = TypeAdapter(List[TaskInDB])
+
+
+def encode_stdlib(tasks) -> bytes:
+    validated = TASK_LIST_ADAPTER.validate_python(tasks, from_attributes=True)
+    return json.dumps(jsonable_encoder(validated, exclude_none=True)).encode()
+
+
+def encode_pydantic(tasks) -> bytes:
+    return TASK_LIST_ADAPTER.dump_json(TASK_LIST_ADAPTER.validate_python(tasks, from_attributes=True), exclude_none=True)
+
+
+def encode_orjson(tasks) -> bytes:
+    validated = TASK_LIST_ADAPTER.validate_python(tasks, from_attributes=True)
+    return ORJSONResponse(TASK_LIST_ADAPTER.dump_python(validated, mode='json', exclude_none=True)).body
+
+
+def encode_rows(rows) -> bytes:
+    return dump_rows(rows, TASK_RESPONSE_COLUMNS)
+
+
+def build_tasks(count: int) -> list:
+    started_at = datetime(2024, 5, 17, 9, 30)
+    return [
+        model_task(
+            id=index + 1,
+            title=f"Task {index}",
+            description="Hike to the top of the hill and back before noon",
+            completed=index % 2 == 0,
+            start_time=started_at + timedelta(minutes=index),
+            stop_time=None if index % 3 else started_at + timedelta(hours=1, minutes=index),
+            created_at=started_at,
+            owner_id=1,
+            version=1,
+        )
+        for index in range(count)
+    ]
+
+
+def measure_ms(fn: Callable[[], object], repeat: int) -> float:
+    fn()
+    started_at = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started_at) / repeat * 1000
+
+
+async def measure_async_ms(fn, repeat: int) -> float:
+    await fn()
+    started_at = time.perf_counter()
+    for _ in range(repeat):
+        await fn()
+    return (time.perf_counter() - started_at) / repeat * 1000
+
+
+async def run_fetch(tasks: list, repeat: int) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(directory, 'bench.db')}")
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all, tables=[model_account.__table__, model_task.__table__])
+            await connection.execute(insert(model_account).values(id=1, first_name='a', last_name='b', username='bench', email='bench@example.com', hashed_password='x', role='User', created_at=datetime.now()))
+            await connection.execute(insert(model_task), [{column.key: getattr(task, column.key) for column in model_task.__table__.columns} for task in tasks])
+
+        session_factory = async_sessionmaker(bind=engine, expire_on_commit=False)
+
+        async def fetch_models():
+            async with session_factory() as db:
+                return encode_pydantic(await schema_task.get_account_tasks(db=db, account_id=1, skip=0, limit=len(tasks)))
+
+        async def fetch_rows():
+            async with session_factory() as db:
+                return encode_rows(await schema_task.get_account_tasks(db=db, account_id=1, skip=0, limit=len(tasks), columns=TASK_RESPONSE_COLUMNS))
+
+        if await fetch_models() != await fetch_rows():
+            raise SystemExit("Row encoding differs from the response model encoding")
+
+        results = {
+            'fetch_models': await measure_async_ms(fetch_models, repeat),
+            'fetch_rows': await measure_async_ms(fetch_rows, repeat),
+        }
+        await engine.dispose()
+        return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Task list serialization benchmark")
+    parser.add_argument('--tasks', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--json', action='store_true', help="Print the results as JSON")
+    args = parser.parse_args()
+
+    tasks = build_tasks(args.tasks)
+    rows = [tuple(getattr(task, column) for column in TASK_RESPONSE_COLUMNS) for task in tasks]
+    if encode_rows(rows) != encode_pydantic(tasks):
+        raise SystemExit("Row encoding differs from the response model encoding")
+
+    timings = {
+        'stdlib': measure_ms(lambda: encode_stdlib(tasks), args.repeat),
+        'pydantic': measure_ms(lambda: encode_pydantic(tasks), args.repeat),
+        'orjson': measure_ms(lambda: encode_orjson(tasks), args.repeat),
+        'rows': measure_ms(lambda: encode_rows(rows), args.repeat),
+    }
+    timings.update(asyncio.run(run_fetch(tasks, args.repeat)))
+
+    # Normalized to 1k tasks whatever the page size
+    per_1k = {name: value * 1000 / args.tasks for name, value in timings.items()}
+    if args.json:
+        print(json.dumps({'tasks': args.tasks, 'repeat': args.repeat, 'ms_per_1k_tasks': per_1k}))
+        return
+
+    baseline = per_1k['stdlib']
+    for name, value in per_1k.items():
+        print(f"{name:<14}{value:>9.3f} ms per 1k tasks{baseline / value:>8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,48 +1,90 @@
+from app.utils.startup_helper import startup_timer
 import sys
 from app.utils.logging_helper import logger
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI
 import uvicorn
 
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 
+from app.core.configuration import AppSettings, Settings
 from app.utils.config_helper import get_config
-from app.api.api_v1 import account, task
+from app.api.api_v1 import account, task, admin
+from app.api import metrics, well_known
+from app.core.hashing import shutdown_password_hasher
+from app.core.change_feed import stop_change_feed
+from app.core.keyring import get_keyring
+from app.core.rate_limit import limit_by_ip, stop_rate_limiter
+from app.utils.db_helper import start_db_maintenance, stop_db_maintenance
+from app.utils.db_writer_helper import stop_db_writer
+from app.utils.init_db import dispose_engines
+from app.utils.metrics_helper import RequestMetricsMiddleware, get_request_metrics
+from app.utils.migration_helper import run_migrations
+from app.utils.profiling_helper import start_loop_lag_monitor, stop_loop_lag_monitor
+from app.utils.server_helper import get_uvicorn_options, prepare_worker_environment, log_server_plan
+
+
+def apply_app_settings(app: FastAPI, cfg: Settings) -> None:
+    # Fill in the OpenAPI metadata from the loaded settings
+    app.title = cfg.app.title
+    app.version = cfg.app.version
+    app.description = cfg.app.description
+    app.contact = {
+        'name': cfg.app.developer_name,
+        'url': cfg.app.developer_repo_url,
+        'email': cfg.app.developer_email
+    }
+    app.openapi_schema = None
 
-import ssl
 
+async def on_startup(app: FastAPI):
+    startup_timer.mark('import')
 
-# Load app configuration
-cfg = get_config()
+    # Load app configuration
+    cfg = get_config()
+    apply_app_settings(app, cfg)
+    # Install the query hooks before the first statement runs
+    get_request_metrics()
+    # Parse the signing keys now, a bad key fails the worker instead of the first login
+    get_keyring(cfg.signing)
+    startup_timer.mark('config')
 
+    logger.info('Starting %s', cfg.app.title)
+    await run_migrations()
+    startup_timer.mark('migrations')
 
-async def on_startup():
-    logger.info(f'Starting {cfg.app.title}')
+    start_db_maintenance(cfg.database.maintenance_interval_seconds)
+    start_loop_lag_monitor(cfg.profiling.loop_lag_threshold_ms)
+    startup_timer.ready()
+    logger.info('Worker ready in %.1f ms %s', startup_timer.ready_seconds * 1000, startup_timer.snapshot()['stages_ms'])
 
 
 async def on_shut_down():
-    logger.info(f'Shutting down {cfg.app.title}')
+    logger.info('Shutting down %s', get_config().app.title)
+    stop_loop_lag_monitor()
+    shutdown_password_hasher()
+    await stop_change_feed()
+    await stop_rate_limiter()
+    await stop_db_writer()
+    await stop_db_maintenance()
+    await dispose_engines()
 
 
 # init app lifecyle
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    await on_startup()
+    await on_startup(app)
     yield
     await on_shut_down()
 
 
-# Init fastapi
+# Init fastapi. The metadata is filled in from the settings on startup, so importing
+# main does no I/O. The per-IP rate limit runs ahead of every route's own dependencies.
 app = FastAPI(    
     lifespan=lifespan,
-    title=cfg.app.title,
-    version=cfg.app.version,
-    description=cfg.app.description,
-    contact={
-        'name': cfg.app.developer_name,
-        'url': cfg.app.developer_repo_url,
-        'email': cfg.app.developer_email
-    }
+    dependencies=[Depends(limit_by_ip)],
+    title=AppSettings.title,
+    version=AppSettings.version,
 )
 
 
@@ -52,16 +94,12 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_credentials=True,
-    allow_headers=['application/json', 'authorization', 'x-refresh-token'],
+    allow_headers=['application/json', 'authorization', 'x-refresh-token', 'if-match', 'if-none-match', 'last-event-id'],
+    expose_headers=['x-next-cursor', 'etag', 'retry-after'],
 )
 
-# Create ssl context
-logger.info("Creating ssl context")
-ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
-
-# Load ssl cert and key
-logger.info("Loading tls cert.pem and key.pem files")
-ssl_context.load_cert_chain(certfile=cfg.app.tls_cert_path, keyfile=cfg.app.tls_key_path)
+# Outermost, so the latency covers the whole middleware stack
+app.add_middleware(RequestMetricsMiddleware)
 
 # Include user authentication routes
 app.include_router(account.router)
@@ -69,11 +107,24 @@ app.include_router(account.router)
 # Include task management routes
 app.include_router(task.router)
 
+# Include admin routes
+app.include_router(admin.router)
+
+# Include the Prometheus metrics route
+app.include_router(metrics.router)
+
+# Include the JWKS route
+app.include_router(well_known.router)
+
 
 
 if __name__ == "__main__":
+    cfg = get_config()
+    options = get_uvicorn_options(cfg)
+    prepare_worker_environment(cfg)
+    log_server_plan(cfg, options)
     try:
-        uvicorn.run(cfg.app.entry_point, host=cfg.app.host, port=cfg.app.port, reload=cfg.app.reload, lifespan=cfg.app.lifespan, ssl=ssl_context)
+        uvicorn.run(cfg.app.entry_point, **options)
     except KeyboardInterrupt as e:
-        logger.warning(f'Stopping {cfg.app.title} server due to keyboard interuption')
+        logger.warning('Stopping %s server due to keyboard interuption', cfg.app.title)
         sys.exit(1)
\ No newline at end of file
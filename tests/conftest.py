@@ -0,0 +1,159 @@
+import os
+import tempfile
+import uuid
+from typing import List
+
+import pytest
+
+# Select the test profile before the app reads its configuration. Without TEST_DATABASE_URL
+# every run gets a fresh SQLite file; against Postgres the accounts are kept unique instead.
+os.environ.setdefault('APP_ENV', 'test')
+if 'TEST_DATABASE_URL' not in os.environ:
+    os.environ['TEST_DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='task-api-tests-'), 'test.db')}"
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from fastapi.testclient import TestClient
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+
+import main
+from app.core.configuration import SigningKeySettings
+from app.utils.init_db import new_async_session
+from app.utils.metrics_helper import TRANSACTION_CONTROL_PREFIXES
+
+
+PASSWORD = '12345678'
+
+
+class QueryCounter:
+    """Counts the SQL statements sent by every engine while active.
+
+    Usage in tests:
+
+        with count_queries() as counter:
+            client.post('/api/v1/accounts/login', json=credentials)
+        counter.assert_at_most(2)
+    """
+
+    def __init__(self):
+        self.statements: List[str] = []
+
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        self.statements.append(statement)
+
+
+    @property
+    def queries(self) -> List[str]:
+        return [statement for statement in self.statements if not statement.lstrip().upper().startswith(TRANSACTION_CONTROL_PREFIXES)]
+
+
+    @property
+    def count(self) -> int:
+        return len(self.queries)
+
+
+    def assert_at_most(self, expected: int) -> None:
+        if self.count > expected:
+            raise AssertionError(f"Expected at most {expected} queries, got {self.count}:\n" + "\n".join(self.queries))
+
+
+    def __enter__(self) -> "QueryCounter":
+        # Listening on the Engine class covers the sync side of every async engine
+        event.listen(Engine, "before_cursor_execute", self._before_cursor_execute)
+        return self
+
+
+    def __exit__(self, *exc_info) -> None:
+        event.remove(Engine, "before_cursor_execute", self._before_cursor_execute)
+
+
+@pytest.fixture(scope='session')
+def client():
+    # One app lifespan for the whole run, the engines and the writer live on its event loop
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+
+@pytest.fixture(scope='session')
+def execute_sql(client):
+    # Change the database behind the app's back, e.g as another worker would
+    def execute(statement: str, **params) -> None:
+        async def run():
+            async with new_async_session() as db:
+                await db.execute(text(statement), params)
+                await db.commit()
+        client.portal.call(run)
+    return execute
+
+
+@pytest.fixture(scope='session')
+def create_account(client, execute_sql):
+    def create(role: str = None) -> dict:
+        name = f"u{uuid.uuid4().hex[:12]}"
+        email = f"{name}@example.com"
+        response = client.post('/api/v1/accounts/register', json={
+            'last_name': 'Test',
+            'first_name': 'Account',
+            'username': name,
+            'email': email,
+            'password': PASSWORD,
+            'avatar': 'https://example.com/avatar.png',
+        })
+        assert response.status_code == 200, response.text
+        account_id = response.json()['id']
+        if role is not None:
+            execute_sql("UPDATE accounts SET role = :role WHERE id = :id", role=role, id=account_id)
+
+        response = client.post('/api/v1/accounts/login', json={'email': email, 'password': PASSWORD})
+        assert response.status_code == 200, response.text
+        tokens = response.json()
+        return {
+            'id': account_id,
+            'email': email,
+            'password': PASSWORD,
+            'access_token': tokens['access_token'],
+            'refresh_token': tokens['refresh_token'],
+            'headers': {'authorization': f"Bearer {tokens['access_token']}"},
+        }
+    return create
+
+
+@pytest.fixture
+def account(create_account):
+    return create_account()
+
+
+@pytest.fixture(scope='session')
+def count_queries():
+    return QueryCounter
+
+
+@pytest.fixture(scope='session')
+def signing_key(tmp_path_factory):
+    # Small generated keys written as PEM files, as the signing settings reference them
+    def create(kid: str, algorithm: str = 'RS256', active_from: str = None, public_only: bool = False) -> SigningKeySettings:
+        if algorithm.startswith('RS'):
+            private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        else:
+            private_key = ec.generate_private_key(ec.SECP256R1())
+        if public_only:
+            pem = private_key.public_key().public_bytes(serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo)
+        else:
+            pem = private_key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+        path = tmp_path_factory.mktemp('keys') / f"{kid}.pem"
+        path.write_bytes(pem)
+        if public_only:
+            return SigningKeySettings(kid=kid, public_key_path=str(path), active_from=active_from)
+        return SigningKeySettings(kid=kid, private_key_path=str(path), active_from=active_from)
+    return create
+
+
+@pytest.fixture(scope='session')
+def create_task(client):
+    def create(headers: dict, title: str = 'Task', start_time: str = '2026-01-01T09:00:00') -> dict:
+        response = client.post('/api/v1/tasks/create/', headers=headers, json={'title': title, 'description': 'Description', 'start_time': start_time})
+        assert response.status_code == 200, response.text
+        return response.json()
+    return create
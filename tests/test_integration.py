@@ -1 +1,768 @@
-# Will contain the integration test cases
\ No newline at end of file
+import asyncio
+import base64
+import csv
+import dataclasses
+import io
+import json
+
+import pytest
+from jose import jwt
+from sqlalchemy import create_engine, inspect, text
+
+from app.controllers import task as task_controller
+from app.controllers.task import get_task_changes_ctrl
+from app.core import rate_limit
+from app.core.change_feed import get_change_feed
+from app.core.configuration import SigningSettings
+from app.core.hashing import get_password_hasher
+from app.core.token_cache import get_token_cache
+from app.models.task_search import TASK_SEARCH_TABLE
+from app.utils import config_helper
+from app.utils.config_helper import apply_logging_settings, get_config, reload_config
+from app.utils.db_helper import run_db_maintenance
+from app.utils.db_writer_helper import DatabaseWriter
+from app.utils.init_db import get_async_engine, get_read_engine, get_write_engine, new_async_session
+from app.utils.logging_helper import logger
+from app.utils.migration_helper import MIGRATIONS, apply_migrations
+
+
+# Token cache
+
+def test_cached_token_rejected_after_logout(client, account, create_task):
+    task = create_task(account['headers'])
+    assert client.get(f"/api/v1/tasks/{task['id']}", headers=account['headers']).status_code == 200
+
+    assert client.get('/api/v1/accounts/logout', headers=account['headers']).status_code == 200
+    response = client.get(f"/api/v1/tasks/{task['id']}", headers=account['headers'])
+    assert response.status_code == 400
+    assert response.json()['detail'] == "Inactive account"
+
+
+def test_cached_token_rejected_after_logout_on_another_worker(client, account, create_task, execute_sql):
+    task = create_task(account['headers'])
+    assert client.get(f"/api/v1/tasks/{task['id']}", headers=account['headers']).status_code == 200
+    assert get_token_cache().get(account['access_token']) is not None
+
+    # Another worker logs the account out, this worker's cache is never told
+    execute_sql("UPDATE accounts SET is_active = :is_active WHERE id = :id", is_active=False, id=account['id'])
+    response = client.get(f"/api/v1/tasks/{task['id']}", headers=account['headers'])
+    assert response.status_code == 400
+    assert get_token_cache().get(account['access_token']).account.is_active is False
+
+
+def test_cached_token_rejected_after_delete_on_another_worker(client, account, create_task, execute_sql):
+    task = create_task(account['headers'])
+    assert client.get(f"/api/v1/tasks/{task['id']}", headers=account['headers']).status_code == 200
+
+    execute_sql("DELETE FROM tasks WHERE owner_id = :id", id=account['id'])
+    execute_sql("DELETE FROM accounts WHERE id = :id", id=account['id'])
+    assert client.get(f"/api/v1/tasks/{task['id']}", headers=account['headers']).status_code == 401
+
+
+def test_cached_token_picks_up_role_change_on_another_worker(client, create_account, execute_sql):
+    admin = create_account(role='Admin')
+    assert client.get('/api/v1/admin/metrics/startup', headers=admin['headers']).status_code == 200
+
+    execute_sql("UPDATE accounts SET role = :role WHERE id = :id", role='User', id=admin['id'])
+    assert client.get('/api/v1/admin/metrics/startup', headers=admin['headers']).status_code == 403
+
+
+def test_cached_token_skips_the_auth_state_query_when_recheck_is_off(client, account, create_task, execute_sql, monkeypatch, count_queries):
+    settings = get_config()
+    monkeypatch.setattr(config_helper, '_settings', dataclasses.replace(settings, token_cache=dataclasses.replace(settings.token_cache, recheck_auth_state=False)))
+    task = create_task(account['headers'])
+    assert client.get(f"/api/v1/tasks/{task['id']}", headers=account['headers']).status_code == 200
+
+    # A logout through another worker goes unnoticed until the entry expires
+    execute_sql("UPDATE accounts SET is_active = :is_active WHERE id = :id", is_active=False, id=account['id'])
+    with count_queries() as counter:
+        assert client.get(f"/api/v1/tasks/{task['id']}", headers=account['headers']).status_code == 200
+    assert counter.count == 1 and 'accounts' not in counter.queries[0]
+
+    # This worker's own writes still invalidate at once
+    get_token_cache().invalidate_account(account['id'])
+    assert client.get(f"/api/v1/tasks/{task['id']}", headers=account['headers']).status_code == 400
+
+
+# Logging
+
+def test_config_reload_applies_the_logging_section(client, tmp_path, monkeypatch):
+    settings = get_config()
+    log_path = tmp_path / 'audit.log'
+    logging_settings = dataclasses.replace(settings.logging, level='ERROR', json_lines=True, file_path=str(log_path), stdout=False, flush_interval_seconds=0.01)
+    monkeypatch.setattr(config_helper, '_settings', settings)
+    monkeypatch.setattr(config_helper.AppConfig, 'load_settings', lambda self: dataclasses.replace(settings, logging=logging_settings))
+    try:
+        reload_config()
+        logger.warning("Below the reloaded level")
+        logger.error("Logged after the reload")
+    finally:
+        # Drains the reloaded pipeline into its file
+        apply_logging_settings(settings)
+
+    entries = [json.loads(line) for line in log_path.read_text().splitlines()]
+    assert [(entry['level'], entry['message']) for entry in entries] == [('ERROR', "Logged after the reload")]
+
+
+# Query budgets
+
+def test_login_renew_and_logout_query_budgets(client, account, count_queries):
+    assert client.get('/api/v1/accounts/logout', headers=account['headers']).status_code == 200
+
+    # The credential lookup, then the activating UPDATE ... RETURNING
+    with count_queries() as counter:
+        response = client.post('/api/v1/accounts/login', json={'email': account['email'], 'password': account['password']})
+    assert response.status_code == 200
+    counter.assert_at_most(2)
+    tokens = response.json()
+
+    with count_queries() as counter:
+        response = client.get('/api/v1/accounts/renew-access-token', headers={'x-refresh-token': tokens['refresh_token']})
+    assert response.status_code == 200
+    counter.assert_at_most(1)
+
+    # Authenticating the token, then the deactivating UPDATE
+    with count_queries() as counter:
+        response = client.get('/api/v1/accounts/logout', headers={'authorization': f"Bearer {tokens['access_token']}"})
+    assert response.status_code == 200
+    counter.assert_at_most(2)
+
+
+def test_cached_token_costs_one_auth_state_query(client, account, create_task, count_queries):
+    task = create_task(account['headers'])
+    assert client.get(f"/api/v1/tasks/{task['id']}", headers=account['headers']).status_code == 200
+
+    with count_queries() as counter:
+        assert client.get('/api/v1/accounts/logout', headers=account['headers']).status_code == 200
+    counter.assert_at_most(2)
+    assert counter.queries[0].startswith('SELECT accounts.is_active, accounts.role')
+
+
+# Ownership
+
+def test_tasks_of_another_account_are_not_found(client, create_account, create_task):
+    owner, other = create_account(), create_account()
+    task = create_task(owner['headers'], title='Private')
+
+    assert client.get(f"/api/v1/tasks/{task['id']}", headers=other['headers']).status_code == 404
+    assert client.put(f"/api/v1/tasks/update/{task['id']}", headers=other['headers'], json={'title': 'Taken'}).status_code == 404
+    assert client.delete(f"/api/v1/tasks/remove/{task['id']}", headers=other['headers']).status_code == 404
+    assert client.get('/api/v1/tasks/', headers=other['headers']).status_code == 404
+
+    response = client.put('/api/v1/tasks/bulk/update', headers=other['headers'], json=[{'id': task['id'], 'title': 'Taken'}])
+    assert response.json()['items'][0]['status'] == 'not_found'
+    response = client.post('/api/v1/tasks/bulk/remove', headers=other['headers'], json={'ids': [task['id']]})
+    assert response.json()['items'][0]['status'] == 'not_found'
+
+    response = client.get(f"/api/v1/tasks/{task['id']}", headers=owner['headers'])
+    assert response.status_code == 200
+    assert response.json()['title'] == 'Private' and response.json()['version'] == task['version']
+
+
+# ETags
+
+def test_task_etag_answers_not_modified_until_the_task_changes(client, account, create_task):
+    task = create_task(account['headers'])
+    etag = client.get(f"/api/v1/tasks/{task['id']}", headers=account['headers']).headers['etag']
+    assert etag == f"\"{task['id']}-{task['version']}\""
+
+    response = client.get(f"/api/v1/tasks/{task['id']}", headers={**account['headers'], 'if-none-match': etag})
+    assert response.status_code == 304 and response.headers['etag'] == etag
+
+    assert client.put(f"/api/v1/tasks/update/{task['id']}", headers=account['headers'], json={'title': 'Changed'}).status_code == 200
+    response = client.get(f"/api/v1/tasks/{task['id']}", headers={**account['headers'], 'if-none-match': etag})
+    assert response.status_code == 200 and response.headers['etag'] != etag
+
+
+def test_task_list_etag_answers_not_modified_until_a_task_changes(client, account, create_task):
+    create_task(account['headers'])
+    etag = client.get('/api/v1/tasks/', headers=account['headers']).headers['etag']
+    assert client.get('/api/v1/tasks/', headers={**account['headers'], 'if-none-match': etag}).status_code == 304
+
+    create_task(account['headers'])
+    response = client.get('/api/v1/tasks/', headers={**account['headers'], 'if-none-match': etag})
+    assert response.status_code == 200 and len(response.json()) == 2
+
+
+def test_task_delete_with_stale_if_match_fails(client, account, create_task):
+    task = create_task(account['headers'])
+    stale_etag = f"\"{task['id']}-{task['version']}\""
+    current_etag = client.put(f"/api/v1/tasks/update/{task['id']}", headers=account['headers'], json={'completed': True}).headers['etag']
+
+    response = client.delete(f"/api/v1/tasks/remove/{task['id']}", headers={**account['headers'], 'if-match': stale_etag})
+    assert response.status_code == 412
+    assert response.headers['etag'] == current_etag
+
+    assert client.delete(f"/api/v1/tasks/remove/{task['id']}", headers={**account['headers'], 'if-match': current_etag}).status_code == 200
+    assert client.get(f"/api/v1/tasks/{task['id']}", headers=account['headers']).status_code == 404
+
+
+# Change feed
+
+def poll_changes(client, headers: dict, **params) -> dict:
+    response = client.get('/api/v1/tasks/changes', headers=headers, params={'mode': 'poll', 'timeout': 0.01, **params})
+    assert response.status_code == 200
+    return response.json()
+
+
+def read_sse(client, account: dict, after=None, heartbeat_seconds: float = 30, during=None, count: int = 1) -> list:
+    # The test client buffers whole responses, so the endless stream is read on the app's loop
+    config = get_config()
+    config = dataclasses.replace(config, change_feed=dataclasses.replace(config.change_feed, heartbeat_seconds=heartbeat_seconds))
+
+    async def run():
+        response = await get_task_changes_ctrl(account_id=account['id'], mode='sse', after=after, timeout=None, config=config)
+        assert response.media_type == 'text/event-stream'
+        chunks = response.body_iterator
+        try:
+            messages = [await anext(chunks)]
+            if during is not None:
+                # Writes go through the app from another thread while the stream waits
+                await asyncio.to_thread(during)
+            while len(messages) < count + 1:
+                messages.append(await asyncio.wait_for(anext(chunks), timeout=5))
+            return messages
+        finally:
+            await chunks.aclose()
+
+    return client.portal.call(run)
+
+
+def test_sse_streams_ready_changes_and_heartbeats(client, account, create_task):
+    seq = poll_changes(client, account['headers'])['seq']
+    subscribers = get_change_feed().subscriber_count
+
+    ready, heartbeat = read_sse(client, account, heartbeat_seconds=0.01)
+    assert ready == f"event: ready\ndata: {json.dumps({'seq': seq})}\n\n"
+    assert heartbeat == ": keep-alive\n\n"
+
+    created = {}
+    messages = read_sse(client, account, during=lambda: created.update(create_task(account['headers'])))
+    assert messages[1] == (
+        f"id: {seq + 1}\nevent: tasks\n"
+        f"data: {json.dumps({'seq': seq + 1, 'type': 'tasks', 'changes': [{'op': 'created', 'id': created['id'], 'version': created['version']}]}, separators=(',', ':'))}\n\n"
+    )
+    # Closed streams unsubscribe
+    assert get_change_feed().subscriber_count == subscribers
+
+
+def test_sse_resumes_after_the_last_event_id(client, account, create_task):
+    seq = poll_changes(client, account['headers'])['seq']
+    first, second = create_task(account['headers']), create_task(account['headers'])
+
+    ready, replayed = read_sse(client, account, after=seq + 1)
+    assert ready.startswith('event: ready\n') and 'id:' not in ready
+    assert replayed.startswith(f"id: {seq + 2}\nevent: tasks\n") and f'"id":{second["id"]}' in replayed
+
+    # The long poll takes the same position from the Last-Event-ID header
+    changes = poll_changes(client, {**account['headers'], 'last-event-id': str(seq)})
+    assert [change['id'] for event in changes['events'] for change in event['changes']] == [first['id'], second['id']]
+    assert changes['seq'] == seq + 2
+
+
+def test_change_feed_resyncs_on_a_gap_and_on_large_writes(client, account, create_task, execute_sql, monkeypatch):
+    create_task(account['headers'])
+    seq = poll_changes(client, account['headers'])['seq']
+
+    # A write through another worker never reached this worker's history
+    execute_sql("UPDATE accounts SET tasks_version = tasks_version + 1 WHERE id = :id", id=account['id'])
+    changes = poll_changes(client, account['headers'], after=seq)
+    assert changes['events'] == [{'seq': seq + 1, 'type': 'resync'}]
+
+    monkeypatch.setattr(get_change_feed(), 'max_event_changes', 1)
+    task = {'title': 'Task', 'description': 'Description', 'start_time': '2026-01-01T09:00:00'}
+    assert client.post('/api/v1/tasks/bulk/create', headers=account['headers'], json=[task, task]).status_code == 200
+    changes = poll_changes(client, account['headers'], after=seq + 1)
+    assert changes['events'] == [{'seq': seq + 2, 'type': 'resync'}]
+
+
+def test_change_feed_rejects_subscribers_past_the_cap(client, account, monkeypatch):
+    change_feed = get_change_feed()
+    monkeypatch.setattr(change_feed, 'max_subscribers', change_feed.subscriber_count)
+    response = client.get('/api/v1/tasks/changes', headers=account['headers'], params={'mode': 'poll', 'timeout': 0.01})
+    assert response.status_code == 503
+    assert response.headers['retry-after'] == '5'
+
+
+# Database writer
+
+def test_writer_commits_concurrent_writes_as_one_batch(client, account, execute_sql):
+    writer = DatabaseWriter(max_batch=64)
+
+    def rename(username: str, fail: bool = False):
+        async def job(db):
+            await db.execute(text("UPDATE accounts SET username = :username WHERE id = :id"), {'username': username, 'id': account['id']})
+            if fail:
+                raise ValueError("Job failed")
+            return username
+        return job
+
+    async def run():
+        try:
+            return await asyncio.gather(
+                *(writer.submit(rename(f"{account['id']}-{index}")) for index in range(4)),
+                writer.submit(rename('never-committed', fail=True)),
+                return_exceptions=True,
+            )
+        finally:
+            await writer.stop()
+
+    *results, failure = client.portal.call(run)
+    assert results == [f"{account['id']}-{index}" for index in range(4)]
+    assert isinstance(failure, ValueError)
+
+    metrics = writer.metrics.snapshot()
+    assert metrics['batches'] == 1 and metrics['jobs'] == 4 and metrics['failed_jobs'] == 1
+
+    # The failed job's savepoint was rolled back, the last applied write stands
+    async def read_username():
+        async with new_async_session() as db:
+            return (await db.execute(text("SELECT username FROM accounts WHERE id = :id"), {'id': account['id']})).scalar()
+    assert client.portal.call(read_username) == f"{account['id']}-3"
+
+
+# Password hashing
+
+def test_login_fails_fast_when_the_hashing_pool_is_saturated(client, account, monkeypatch):
+    hasher = get_password_hasher()
+    monkeypatch.setattr(hasher.metrics, 'in_flight', hasher.capacity)
+    rejected = hasher.metrics.rejected
+
+    response = client.post('/api/v1/accounts/login', json={'email': account['email'], 'password': account['password']})
+    assert response.status_code == 503
+    assert response.headers['retry-after'] == str(hasher.retry_after_seconds)
+    assert hasher.metrics.rejected == rejected + 1
+
+
+def test_hashing_metrics_for_admins_only(client, account, create_account):
+    admin = create_account(role='Admin')
+    assert client.get('/api/v1/admin/metrics/hashing', headers=account['headers']).status_code == 403
+
+    response = client.get('/api/v1/admin/metrics/hashing', headers=admin['headers'])
+    assert response.status_code == 200
+    metrics = response.json()
+    assert metrics['completed'] >= 2 and metrics['in_flight'] == 0
+    assert metrics['hash_seconds_max'] >= metrics['hash_seconds_avg'] > 0
+
+
+# Keyset pagination
+
+def encode_raw_cursor(payload) -> str:
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+
+def test_tasks_keyset_pages_follow_the_sort(client, account, create_task):
+    for hour in (12, 9, 15):
+        create_task(account['headers'], title=f"At {hour}", start_time=f"2026-01-01T{hour:02d}:00:00")
+
+    titles = []
+    cursor = None
+    while True:
+        params = {'limit': 2, 'sort': '-start_time'}
+        if cursor:
+            params['cursor'] = cursor
+        response = client.get('/api/v1/tasks/', headers=account['headers'], params=params)
+        assert response.status_code == 200
+        titles += [task['title'] for task in response.json()]
+        cursor = response.headers.get('x-next-cursor')
+        if cursor is None:
+            break
+    assert titles == ["At 15", "At 12", "At 9"]
+
+
+@pytest.mark.parametrize('limit', [0, -2, 101])
+def test_tasks_rejects_out_of_range_limits(client, account, create_task, limit):
+    create_task(account['headers'])
+    response = client.get('/api/v1/tasks/', headers=account['headers'], params={'limit': limit})
+    assert response.status_code == 422
+
+
+@pytest.mark.parametrize('cursor', [
+    'not-a-cursor',
+    encode_raw_cursor([1]),
+    encode_raw_cursor({'id': '1'}),
+    encode_raw_cursor({'id': 1, 'sort': 'start_time', 'value': 5}),
+    encode_raw_cursor({'id': 1, 'sort': 'start_time', 'value': 'yesterday'}),
+    encode_raw_cursor({'id': 1, 'sort': 'start_time'}),
+    encode_raw_cursor({'id': 1, 'sort': 'created_at', 'value': '2026-01-01T00:00:00'}),
+])
+def test_tasks_rejects_invalid_cursors(client, account, create_task, cursor):
+    create_task(account['headers'])
+    response = client.get('/api/v1/tasks/', headers=account['headers'], params={'sort': 'start_time', 'cursor': cursor})
+    assert response.status_code == 400
+
+
+# Search
+
+def test_search_pages_by_rank(client, account, create_task):
+    for index in range(3):
+        create_task(account['headers'], title=f"Quarterly report {index}")
+    create_task(account['headers'], title="Groceries")
+
+    ids = []
+    cursor = None
+    while True:
+        params = {'q': 'report', 'limit': 2}
+        if cursor:
+            params['cursor'] = cursor
+        response = client.get('/api/v1/tasks/search', headers=account['headers'], params=params)
+        assert response.status_code == 200
+        ids += [task['id'] for task in response.json()]
+        cursor = response.headers.get('x-next-cursor')
+        if cursor is None:
+            break
+    assert len(ids) == len(set(ids)) == 3
+
+
+@pytest.mark.parametrize('limit', [0, -1, 101])
+def test_search_rejects_out_of_range_limits(client, account, create_task, limit):
+    create_task(account['headers'], title="Quarterly report")
+    response = client.get('/api/v1/tasks/search', headers=account['headers'], params={'q': 'report', 'limit': limit})
+    assert response.status_code == 422
+
+
+@pytest.mark.parametrize('cursor', [
+    encode_raw_cursor({'id': 1, 'sort': 'rank', 'value': 'best'}),
+    encode_raw_cursor({'id': 1, 'sort': 'rank'}),
+    encode_raw_cursor({'id': 1, 'sort': 'start_time', 'value': 1.0}),
+])
+def test_search_rejects_invalid_cursors(client, account, cursor):
+    response = client.get('/api/v1/tasks/search', headers=account['headers'], params={'q': 'report', 'cursor': cursor})
+    assert response.status_code == 400
+
+
+# Bulk operations
+
+def test_bulk_update_returns_versions_usable_with_if_match(client, account, create_task):
+    task = create_task(account['headers'])
+    seq = client.get('/api/v1/tasks/changes', headers=account['headers'], params={'mode': 'poll', 'timeout': 0.01}).json()['seq']
+
+    response = client.put('/api/v1/tasks/bulk/update', headers=account['headers'], json=[{'id': task['id'], 'completed': True}, {'id': 10 ** 9, 'title': 'Missing'}])
+    assert response.status_code == 200
+    updated, missing = response.json()['items']
+    assert updated['status'] == 'updated' and updated['version'] == task['version'] + 1
+    assert missing['status'] == 'not_found' and missing['version'] is None
+
+    changes = client.get('/api/v1/tasks/changes', headers=account['headers'], params={'mode': 'poll', 'after': seq, 'timeout': 0.01}).json()
+    assert changes['events'][0]['changes'] == [{'op': 'updated', 'id': task['id'], 'version': updated['version']}]
+
+    stale = client.put(f"/api/v1/tasks/update/{task['id']}", headers={**account['headers'], 'if-match': f"\"{task['id']}-{task['version']}\""}, json={'title': 'Stale'})
+    assert stale.status_code == 412
+    fresh = client.put(f"/api/v1/tasks/update/{task['id']}", headers={**account['headers'], 'if-match': f"\"{task['id']}-{updated['version']}\""}, json={'title': 'Fresh'})
+    assert fresh.status_code == 200
+    assert fresh.headers['etag'] == f"\"{task['id']}-{updated['version'] + 1}\""
+
+
+def import_tasks(client, headers: dict, lines: list):
+    body = ''.join(f"{line if isinstance(line, str) else json.dumps(line)}\n" for line in lines)
+    return client.post('/api/v1/tasks/bulk/import', headers={**headers, 'content-type': 'application/x-ndjson'}, content=body)
+
+
+def with_task_settings(monkeypatch, **values):
+    settings = get_config()
+    monkeypatch.setattr(config_helper, '_settings', dataclasses.replace(settings, tasks=dataclasses.replace(settings.tasks, **values)))
+
+
+def test_import_reports_invalid_lines_and_inserts_the_rest_in_chunks(client, account, monkeypatch):
+    with_task_settings(monkeypatch, bulk_chunk_size=2)
+    # Force the spool to disk to cover reading it back from the file
+    monkeypatch.setattr(task_controller, 'IMPORT_SPOOL_MAX_BYTES', 64)
+    seq = poll_changes(client, account['headers'])['seq']
+    task = {'description': 'Imported', 'start_time': '2026-01-01T09:00:00'}
+
+    response = import_tasks(client, account['headers'], [
+        {**task, 'title': 'First'},
+        '{"title": ',
+        {**task, 'title': 'Second'},
+        {'title': 'No start time'},
+        {**task, 'title': 'Third'},
+        {**task, 'title': 'Fourth'},
+        {**task, 'title': 'Fifth'},
+    ])
+    assert response.status_code == 200
+    result = response.json()
+    assert (result['succeeded'], result['failed']) == (5, 2)
+    assert [item['index'] for item in result['items']] == list(range(7))
+    assert [item['status'] for item in result['items']] == ['created', 'invalid', 'created', 'invalid', 'created', 'created', 'created']
+
+    created = [item for item in result['items'] if item['status'] == 'created']
+    titles = {task['id']: task['title'] for task in client.get('/api/v1/tasks/', headers=account['headers']).json()}
+    assert [titles[item['id']] for item in created] == ['First', 'Second', 'Third', 'Fourth', 'Fifth']
+    assert all(item['version'] == 1 for item in created)
+
+    # Three chunks in one transaction, published as one event
+    events = poll_changes(client, account['headers'], after=seq)['events']
+    assert len(events) == 1
+    assert [change['id'] for change in events[0]['changes']] == [item['id'] for item in created]
+
+
+def test_import_rejects_streams_past_the_limits(client, account, monkeypatch):
+    with_task_settings(monkeypatch, bulk_stream_max_items=2, bulk_max_line_bytes=256)
+    task = {'title': 'Task', 'description': 'Imported', 'start_time': '2026-01-01T09:00:00'}
+
+    assert import_tasks(client, account['headers'], [task] * 3).status_code == 413
+    assert import_tasks(client, account['headers'], [{**task, 'description': 'x' * 512}]).status_code == 413
+    # Nothing of a rejected stream was written
+    assert client.get('/api/v1/tasks/', headers=account['headers']).status_code == 404
+    assert import_tasks(client, account['headers'], [task] * 2).json()['succeeded'] == 2
+
+
+# Export
+
+def test_export_streams_every_task_in_id_order(client, account, monkeypatch):
+    with_task_settings(monkeypatch, export_batch_size=2)
+    task = {'description': 'Exported, "quoted"', 'start_time': '2026-01-01T09:00:00'}
+    created = import_tasks(client, account['headers'], [{**task, 'title': f"Task {index}"} for index in range(5)]).json()['items']
+    ids = [item['id'] for item in created]
+
+    response = client.get('/api/v1/tasks/export', headers=account['headers'])
+    assert response.status_code == 200
+    assert response.headers['content-type'] == 'application/x-ndjson'
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row['id'] for row in rows] == ids
+    assert list(rows[0]) == ['id', 'title', 'description', 'completed', 'start_time', 'stop_time', 'created_at', 'updated_at']
+    assert rows[0]['title'] == 'Task 0' and rows[0]['description'] == task['description']
+    assert rows[0]['start_time'] == '2026-01-01T09:00:00' and rows[0]['completed'] is False
+
+    response = client.get('/api/v1/tasks/export', headers=account['headers'], params={'format': 'csv'})
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/csv')
+    assert response.headers['content-disposition'] == 'attachment; filename="tasks.csv"'
+    header, *rows = list(csv.reader(io.StringIO(response.text)))
+    assert header == ['id', 'title', 'description', 'completed', 'start_time', 'stop_time', 'created_at', 'updated_at']
+    assert [int(row[0]) for row in rows] == ids
+    assert rows[4][1:5] == ['Task 4', task['description'], 'False', '2026-01-01T09:00:00']
+
+
+def test_export_of_an_account_without_tasks_is_empty(client, account):
+    assert client.get('/api/v1/tasks/export', headers=account['headers']).text == ''
+    assert client.get('/api/v1/tasks/export', headers=account['headers'], params={'format': 'csv'}).text.splitlines() == [
+        'id,title,description,completed,start_time,stop_time,created_at,updated_at'
+    ]
+
+
+def test_export_rejects_unsupported_formats(client, account):
+    assert client.get('/api/v1/tasks/export', headers=account['headers'], params={'format': 'xml'}).status_code == 422
+
+
+# Prometheus metrics
+
+def test_metrics_exposition(client, account):
+    assert client.get('/api/v1/tasks/', headers=account['headers']).status_code == 404
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/plain')
+
+    lines = response.text.splitlines()
+    assert '# TYPE http_requests_total counter' in lines
+    assert any(line.startswith('http_requests_total{') and 'route="/api/v1/tasks/"' in line and 'status="404"' in line for line in lines)
+    assert any(line.startswith('http_request_duration_seconds_bucket{') and 'le="+Inf"' in line for line in lines)
+    for gauge in ('password_hashing_completed', 'db_writer_batches', 'change_feed_published'):
+        assert f"# TYPE {gauge} gauge" in lines
+    # Every sample is a name, optional labels and a number
+    for line in lines:
+        if line and not line.startswith('#'):
+            float(line.rsplit(' ', 1)[1])
+
+
+def test_metrics_require_the_scrape_token_when_set(client, monkeypatch):
+    settings = get_config()
+    monkeypatch.setattr(config_helper, '_settings', dataclasses.replace(settings, metrics=dataclasses.replace(settings.metrics, scrape_token='scrape-secret')))
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'authorization': 'Bearer wrong'}).status_code == 401
+    assert client.get('/metrics', headers={'authorization': 'Bearer scrape-secret'}).status_code == 200
+
+
+# SQLite tuning
+
+sqlite_only = pytest.mark.skipif(not get_config().app.db_url.startswith('sqlite'), reason="SQLite pragmas and maintenance")
+
+
+@sqlite_only
+@pytest.mark.parametrize('get_engine', [get_async_engine, get_read_engine, get_write_engine])
+def test_sqlite_connections_get_the_configured_pragmas(client, get_engine):
+    async def read_pragmas():
+        async with get_engine().connect() as connection:
+            return [(await connection.execute(text(f"PRAGMA {pragma}"))).scalar() for pragma in ('journal_mode', 'synchronous', 'busy_timeout', 'temp_store')]
+
+    journal_mode, synchronous, busy_timeout, temp_store = client.portal.call(read_pragmas)
+    assert journal_mode == 'wal'
+    # NORMAL
+    assert synchronous == 1
+    assert busy_timeout == get_config().database.busy_timeout_ms
+    # MEMORY
+    assert temp_store == 2
+
+
+@sqlite_only
+def test_db_maintenance_checkpoints_the_wal(client, account, create_task):
+    create_task(account['headers'])
+    client.portal.call(run_db_maintenance)
+
+    async def read_wal():
+        async with get_async_engine().connect() as connection:
+            return (await connection.execute(text("PRAGMA wal_checkpoint(PASSIVE)"))).one()
+
+    busy, wal_pages, checkpointed_pages = client.portal.call(read_wal)
+    assert busy == 0 and checkpointed_pages == wal_pages
+
+
+# Schema migrations
+
+# Schema of the first release, before migrations were versioned
+BASELINE_SCHEMA = (
+    """CREATE TABLE accounts (
+        id INTEGER NOT NULL PRIMARY KEY, first_name VARCHAR NOT NULL, last_name VARCHAR NOT NULL,
+        username VARCHAR NOT NULL, email VARCHAR NOT NULL, hashed_password VARCHAR NOT NULL,
+        is_active BOOLEAN NOT NULL, avatar VARCHAR, role VARCHAR NOT NULL,
+        created_at DATETIME NOT NULL, updated_at DATETIME
+    )""",
+    "CREATE UNIQUE INDEX ix_accounts_email ON accounts (email)",
+    "CREATE UNIQUE INDEX ix_accounts_username ON accounts (username)",
+    """CREATE TABLE tasks (
+        id INTEGER NOT NULL PRIMARY KEY, title VARCHAR NOT NULL, description VARCHAR NOT NULL,
+        completed BOOLEAN NOT NULL, created_at DATETIME NOT NULL, updated_at DATETIME,
+        start_time DATETIME NOT NULL, stop_time DATETIME, owner_id INTEGER REFERENCES accounts (id)
+    )""",
+    "CREATE INDEX ix_tasks_id ON tasks (id)",
+    "CREATE INDEX ix_tasks_title ON tasks (title)",
+    "CREATE INDEX ix_tasks_description ON tasks (description)",
+    "CREATE INDEX ix_tasks_created_at ON tasks (created_at)",
+    "CREATE INDEX ix_tasks_start_time ON tasks (start_time)",
+    "INSERT INTO accounts VALUES (1, 'Ada', 'Lovelace', 'ada', 'ada@example.com', 'hash', 1, NULL, 'User', '2024-01-01 00:00:00', NULL)",
+    "INSERT INTO tasks VALUES (1, 'Existing report', 'Written before the upgrade', 0, '2024-01-01 00:00:00', NULL, '2024-01-02 09:00:00', NULL, 1)",
+)
+
+
+def test_migrations_upgrade_a_baseline_database(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'baseline.db'}")
+    try:
+        with engine.begin() as connection:
+            for statement in BASELINE_SCHEMA:
+                connection.execute(text(statement))
+
+        with engine.begin() as connection:
+            assert apply_migrations(connection) == [version for version, _, _ in MIGRATIONS]
+
+        with engine.connect() as connection:
+            schema = inspect(connection)
+            assert {'version'} <= {column['name'] for column in schema.get_columns('tasks')}
+            assert {'tasks_version'} <= {column['name'] for column in schema.get_columns('accounts')}
+            indexes = {index['name'] for index in schema.get_indexes('tasks')}
+            assert 'ix_tasks_owner_id_id' in indexes and 'ix_tasks_title' not in indexes
+
+            # Existing rows get the defaults and are indexed for search
+            assert connection.execute(text("SELECT version FROM tasks WHERE id = 1")).scalar() == 1
+            assert connection.execute(text("SELECT tasks_version FROM accounts WHERE id = 1")).scalar() == 0
+            assert connection.execute(text(f"SELECT rowid FROM {TASK_SEARCH_TABLE} WHERE {TASK_SEARCH_TABLE} MATCH 'report'")).scalars().all() == [1]
+
+        # Up to date, nothing to apply
+        with engine.begin() as connection:
+            assert apply_migrations(connection) == []
+
+        # Every migration is idempotent, as databases created before versioning replay all of them
+        with engine.begin() as connection:
+            connection.execute(text("DELETE FROM schema_version"))
+            assert apply_migrations(connection) == [version for version, _, _ in MIGRATIONS]
+            assert connection.execute(text("SELECT count(*) FROM tasks")).scalar() == 1
+    finally:
+        engine.dispose()
+
+
+def test_startup_metrics_for_admins(client, create_account):
+    admin = create_account(role='Admin')
+    response = client.get('/api/v1/admin/metrics/startup', headers=admin['headers'])
+    assert response.status_code == 200
+    metrics = response.json()
+    assert list(metrics['stages_ms']) == ['import', 'config', 'migrations']
+    assert metrics['ready_ms'] >= sum(metrics['stages_ms'].values())
+
+
+# Rate limiting
+
+@pytest.fixture
+def rate_limiter(monkeypatch):
+    # The test profile turns the limiter off, swap in one with no limits for the test to tighten
+    limiter = rate_limit.RateLimiter(backend=rate_limit.MemoryRateLimitBackend(), limits={})
+    monkeypatch.setattr(rate_limit, '_rate_limiter', limiter)
+    monkeypatch.setattr(rate_limit, '_rate_limiter_loaded', True)
+    return limiter
+
+
+def test_login_limited_per_email_before_hashing(client, account, rate_limiter):
+    rate_limiter.limits['login_account'] = rate_limit.parse_limit('2/minute')
+    credentials = {'email': account['email'].upper(), 'password': 'wrong-password'}
+    assert [client.post('/api/v1/accounts/login', json=credentials).status_code for _ in range(2)] == [400, 400]
+
+    hashed = get_password_hasher().metrics.snapshot()['completed']
+    response = client.post('/api/v1/accounts/login', json=credentials)
+    assert response.status_code == 429
+    assert int(response.headers['retry-after']) > 0
+    assert get_password_hasher().metrics.snapshot()['completed'] == hashed
+
+
+def test_requests_limited_per_account_and_route(client, account, create_task, rate_limiter):
+    task = create_task(account['headers'])
+    rate_limiter.limits['account'] = rate_limit.parse_limit('2/minute')
+    codes = [client.get(f"/api/v1/tasks/{task['id']}", headers=account['headers']).status_code for _ in range(3)]
+    assert codes == [200, 200, 429]
+    # Another route has its own bucket
+    assert client.get('/api/v1/tasks/', headers=account['headers']).status_code == 200
+
+
+# Configuration reload
+
+def test_config_reload_keeps_unchanged_settings(client, create_account):
+    admin = create_account(role='Admin')
+    settings = get_config()
+    response = client.post('/api/v1/admin/config/reload', headers=admin['headers'])
+    assert response.status_code == 200
+    assert get_config() == settings
+
+
+def test_config_reload_rejects_settings_that_need_a_restart(client, create_account, monkeypatch):
+    admin = create_account(role='Admin')
+    settings = get_config()
+    monkeypatch.setenv('TEST_DATABASE_URL', 'sqlite:///./elsewhere.db')
+    response = client.post('/api/v1/admin/config/reload', headers=admin['headers'])
+    assert response.status_code == 409
+    assert 'app.db_url' in response.json()['detail']
+    assert get_config() is settings
+
+
+# Signing keys
+
+def test_jwks_not_published_for_shared_secret_tokens(client):
+    assert client.get('/.well-known/jwks.json').status_code == 404
+
+
+def test_jwks_follows_the_keyring_of_the_snapshot(client, account, signing_key, monkeypatch):
+    assert client.get('/api/v1/accounts/logout', headers=account['headers']).status_code == 200
+    settings = get_config()
+    signing = SigningSettings(algorithm='ES256', keys=(signing_key('current', algorithm='ES256'),), jwks_max_age_seconds=600)
+    # Swap the snapshot as a reload of the signing section does
+    monkeypatch.setattr(config_helper, '_settings', dataclasses.replace(settings, signing=signing))
+
+    response = client.get('/.well-known/jwks.json')
+    assert response.status_code == 200
+    assert [key['kid'] for key in response.json()['keys']] == ['current']
+    assert response.headers['cache-control'] == 'public, max-age=600'
+    etag = response.headers['etag']
+    assert client.get('/.well-known/jwks.json', headers={'if-none-match': etag}).status_code == 304
+
+    tokens = client.post('/api/v1/accounts/login', json={'email': account['email'], 'password': account['password']}).json()
+    assert jwt.get_unverified_header(tokens['access_token'])['kid'] == 'current'
+    headers = {'authorization': f"Bearer {tokens['access_token']}"}
+    assert client.get('/api/v1/tasks/', headers=headers).status_code == 404
+
+    # Publishing the next key changes the key set, tokens of the current key keep verifying
+    rotated = dataclasses.replace(signing, keys=signing.keys + (signing_key('next', algorithm='ES256', active_from='2099-01-01'),))
+    monkeypatch.setattr(config_helper, '_settings', dataclasses.replace(settings, signing=rotated))
+    response = client.get('/.well-known/jwks.json', headers={'if-none-match': etag})
+    assert response.status_code == 200 and response.headers['etag'] != etag
+    assert [key['kid'] for key in response.json()['keys']] == ['current', 'next']
+    get_token_cache().clear()
+    assert client.get('/api/v1/tasks/', headers=headers).status_code == 404
+
+    # Shared secret tokens are no longer accepted once the keyring signs
+    assert client.get('/api/v1/tasks/', headers=account['headers']).status_code == 401
@@ -1 +1,332 @@
-# Will contain the unit test cases
\ No newline at end of file
+import asyncio
+import dataclasses
+import io
+import json
+import logging
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import orjson
+import pytest
+from fastapi import HTTPException
+from jose import jwt
+
+from app.core import keyring as keyring_module
+from app.core import rate_limit
+from app.core.change_feed import RESYNC_EVENT, TaskChangeFeed
+from app.core.hashing import PasswordHasher
+from app.core.configuration import Settings, SigningSettings
+from app.core.security import generate_jwt_token, verify_token
+from app.core.token_cache import TokenCache
+from app.schemas.task import Task
+from app.utils.config_helper import get_restart_required_settings
+from app.utils.logging_helper import BatchingLogWriter, InfoSamplingFilter, JsonLinesFormatter, NonBlockingQueueHandler
+from app.utils.pagination_helper import decode_cursor, encode_cursor, parse_datetime_value, parse_float_value
+from app.utils.profiling_helper import PROFILE_MODES, SamplingProfiler
+
+
+# Cursors
+
+def test_cursor_round_trip():
+    cursor = encode_cursor(7, sort='rank', sort_value=-1.5)
+    assert decode_cursor(cursor, parse_value=parse_float_value) == {'id': 7, 'sort': 'rank', 'value': -1.5}
+
+
+@pytest.mark.parametrize('value', [None, 'x', True, float('inf'), [1.0]])
+def test_float_cursor_value_rejected(value):
+    with pytest.raises(HTTPException) as err:
+        decode_cursor(encode_cursor(7, sort='rank', sort_value=value), parse_value=parse_float_value)
+    assert err.value.status_code == 400
+
+
+@pytest.mark.parametrize('value', [None, 5, 'yesterday'])
+def test_datetime_cursor_value_rejected(value):
+    with pytest.raises(HTTPException) as err:
+        decode_cursor(encode_cursor(7, sort='start_time', sort_value=value), parse_value=parse_datetime_value)
+    assert err.value.status_code == 400
+
+
+# Search
+
+def test_like_patterns_escape_wildcards():
+    assert Task.build_like_patterns('50%_off a\\b pre* *') == ['%50\\%\\_off%', '%a\\\\b%', '%pre%']
+
+
+# Token cache
+
+def test_token_cache_generations_are_bounded():
+    cache = TokenCache(max_entries=2)
+    for account_id in range(10):
+        cache.invalidate_account(account_id)
+    assert len(cache._account_generations) == 2
+
+
+def test_token_cache_rejects_a_lookup_that_raced_with_an_evicted_invalidation():
+    cache = TokenCache(max_entries=2)
+    account = SimpleNamespace(id=1)
+    generation = cache.generation(account.id)
+
+    # Invalidated while the lookup loaded the account, then pushed out by other accounts
+    for account_id in (1, 2, 3):
+        cache.invalidate_account(account_id)
+    cache.put('token', {}, account, generation)
+    assert cache.get('token') is None
+
+    cache.put('token', {}, account, cache.generation(account.id))
+    assert cache.get('token').account is account
+
+
+# Password hashing
+
+def blocking_job(release: threading.Event):
+    started_at = time.time()
+    release.wait(5)
+    return 'hashed', started_at, time.time()
+
+
+@pytest.mark.parametrize('max_queue', [0, 1])
+def test_hashing_pool_rejects_past_its_workers_and_queue(max_queue):
+    hasher = PasswordHasher(workers=1, max_queue=max_queue, retry_after_seconds=3)
+    release = threading.Event()
+
+    async def run():
+        jobs = [asyncio.create_task(hasher._submit(blocking_job, release)) for _ in range(hasher.capacity)]
+        await asyncio.sleep(0)
+        assert hasher.metrics.in_flight == hasher.capacity
+
+        with pytest.raises(HTTPException) as err:
+            await hasher._submit(blocking_job, release)
+        release.set()
+        return err.value, await asyncio.gather(*jobs)
+
+    try:
+        err, results = asyncio.run(run())
+    finally:
+        release.set()
+        hasher.shutdown()
+    assert err.status_code == 503 and err.headers['Retry-After'] == '3'
+    assert results == ['hashed'] * (1 + max_queue)
+
+    metrics = hasher.metrics.snapshot()
+    assert metrics['submitted'] == metrics['completed'] == 1 + max_queue
+    assert metrics['rejected'] == 1 and metrics['in_flight'] == 0
+
+
+def test_hashing_pool_hashes_and_verifies():
+    hasher = PasswordHasher(workers=1)
+    try:
+        hashed_password = asyncio.run(hasher.hash('12345678'))
+        assert asyncio.run(hasher.verify('12345678', hashed_password)) is True
+        assert asyncio.run(hasher.verify('wrong-password', hashed_password)) is False
+    finally:
+        hasher.shutdown()
+    assert hasher.metrics.snapshot()['completed'] == 3
+
+
+# Change feed
+
+def test_change_feed_overflow_turns_into_a_resync():
+    change_feed = TaskChangeFeed(buffer_size=2)
+    subscriber = change_feed.subscribe(1, current_seq=0)
+    for seq in range(1, 4):
+        change_feed.publish(1, seq=seq, prev_seq=seq - 1, changes=[{'op': 'created', 'id': seq, 'version': 1}])
+
+    events = subscriber.drain(change_feed.latest_seq(1))
+    assert [(event.seq, event.type) for event in events] == [(3, RESYNC_EVENT)]
+    assert change_feed.metrics.overflows == 1
+
+    # Back to events once the client caught up
+    change_feed.publish(1, seq=4, prev_seq=3)
+    assert [event.seq for event in subscriber.drain(change_feed.latest_seq(1))] == [4]
+
+
+def test_change_feed_replays_unbroken_history_only():
+    change_feed = TaskChangeFeed()
+    for seq in (1, 2):
+        change_feed.publish(1, seq=seq, prev_seq=seq - 1)
+    assert [event.seq for event in change_feed.replay(1, after=0, current_seq=2)] == [1, 2]
+
+    # Version 3 was written elsewhere
+    change_feed.publish(1, seq=4, prev_seq=3)
+    assert [(event.seq, event.type) for event in change_feed.replay(1, after=2, current_seq=4)] == [(4, RESYNC_EVENT)]
+    assert change_feed.replay(1, after=4, current_seq=4) == []
+
+
+def test_change_feed_caps_subscribers():
+    change_feed = TaskChangeFeed(max_subscribers=1)
+    subscriber = change_feed.subscribe(1, current_seq=0)
+    assert change_feed.subscribe(2, current_seq=0) is None
+    change_feed.unsubscribe(subscriber)
+    assert change_feed.subscribe(2, current_seq=0) is not None
+    assert change_feed.metrics.rejected_subscribers == 1
+
+
+# Logging
+
+def make_record(level: int, message: str) -> logging.LogRecord:
+    return logging.LogRecord('task_management_api', level, __file__, 1, message, None, None)
+
+
+def test_log_records_reach_the_writer_streams_as_json_lines():
+    log_queue = queue.Queue()
+    stream = io.StringIO()
+    writer = BatchingLogWriter(log_queue, streams=[stream], formatter=JsonLinesFormatter(), batch_size=2, flush_interval_seconds=0.01)
+    writer.start()
+    handler = NonBlockingQueueHandler(log_queue)
+    for index in range(3):
+        handler.handle(make_record(logging.WARNING, f"Record {index}"))
+    writer.stop()
+
+    entries = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [entry['message'] for entry in entries] == ['Record 0', 'Record 1', 'Record 2']
+    assert entries[0]['level'] == 'WARNING' and entries[0]['logger'] == 'task_management_api'
+
+
+def test_log_handler_drops_records_instead_of_blocking():
+    handler = NonBlockingQueueHandler(queue.Queue(maxsize=1))
+    for _ in range(3):
+        handler.handle(make_record(logging.ERROR, "Record"))
+    assert handler.dropped == 2
+
+
+def test_info_sampling_keeps_warnings():
+    sampling_filter = InfoSamplingFilter(rate=0.0)
+    assert not sampling_filter.filter(make_record(logging.INFO, "Sampled out"))
+    assert sampling_filter.filter(make_record(logging.WARNING, "Kept"))
+
+
+# Rate limiting
+
+def test_memory_backend_refills_and_reports_retry_after(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rate_limit.time, 'monotonic', lambda: now[0])
+    backend = rate_limit.MemoryRateLimitBackend()
+    limit = rate_limit.parse_limit('2/minute')
+
+    assert [backend.take('key', limit) for _ in range(2)] == [0.0, 0.0]
+    assert backend.take('key', limit) == pytest.approx(30.0)
+    now[0] += 30
+    assert backend.take('key', limit) == 0.0
+
+
+def test_memory_backend_evicts_least_recently_used():
+    backend = rate_limit.MemoryRateLimitBackend(max_keys=2)
+    limit = rate_limit.parse_limit('1/hour')
+    backend.take('a', limit)
+    backend.take('b', limit)
+    backend.take('a', limit)
+    backend.take('c', limit)
+    assert backend.snapshot() == {'keys': 2, 'evictions': 1}
+    # b was evicted and comes back with a full bucket, a is still empty
+    assert backend.take('a', limit) > 0
+    assert backend.take('b', limit) == 0.0
+
+
+@pytest.mark.parametrize('value', ['10', 'x/minute', '0/second', '10/fortnight'])
+def test_invalid_rate_limits_rejected(value):
+    with pytest.raises(ValueError):
+        rate_limit.parse_limit(value)
+
+
+def test_rate_limit_backend_requires_hit():
+    with pytest.raises(TypeError):
+        rate_limit.RateLimitBackend()
+
+
+# Profiling
+
+@pytest.mark.parametrize('mode', PROFILE_MODES)
+def test_profiler_samples_in_every_mode(mode):
+    profile = SamplingProfiler().sample(0.02, 0.005, mode)
+    assert profile.mode == mode and profile.samples > 0
+
+
+def test_profiler_rejects_unknown_mode():
+    with pytest.raises(ValueError):
+        SamplingProfiler().sample(0.02, 0.005, 'gpu')
+
+
+# Configuration reload
+
+def test_restart_required_settings():
+    settings = Settings()
+    reloaded = dataclasses.replace(
+        settings,
+        tasks=dataclasses.replace(settings.tasks, bulk_max_items=10),
+        profiling=dataclasses.replace(settings.profiling, enabled=True, loop_lag_threshold_ms=50),
+        rate_limit=dataclasses.replace(settings.rate_limit, account='10/minute'),
+        app=dataclasses.replace(settings.app, access_token_expiry_seconds=60, db_url='sqlite:///./other.db'),
+    )
+    assert get_restart_required_settings(settings, settings) == []
+    assert get_restart_required_settings(settings, reloaded) == ['app.db_url', 'profiling.loop_lag_threshold_ms', 'rate_limit.account']
+
+
+# Signing keys
+
+APP_SETTINGS = Settings().app
+CLAIMS = {'iss': APP_SETTINGS.token_iss, 'aud': APP_SETTINGS.token_aud, 'sub': APP_SETTINGS.token_sub, 'id': 1}
+
+
+def test_keyring_signs_with_the_latest_active_key(signing_key):
+    settings = SigningSettings(algorithm='RS256', keys=(
+        signing_key('2025', active_from='2025-01-01'),
+        signing_key('2026', active_from='2026-01-01T00:00:00+00:00'),
+        signing_key('2099', active_from='2099-01-01'),
+    ))
+    keyring = keyring_module.load_keyring(settings)
+    assert keyring.get_signing_key(datetime(2025, 6, 1, tzinfo=timezone.utc)).kid == '2025'
+    assert keyring.get_signing_key(datetime(2026, 6, 1, tzinfo=timezone.utc)).kid == '2026'
+    assert keyring.get_signing_key().kid == '2026'
+    # Upcoming keys are published ahead of their time
+    assert [key['kid'] for key in orjson.loads(keyring.jwks)['keys']] == ['2025', '2026', '2099']
+    with pytest.raises(ValueError):
+        keyring.get_signing_key(datetime(2024, 1, 1, tzinfo=timezone.utc))
+
+
+@pytest.mark.parametrize('algorithm', ['RS256', 'ES256'])
+def test_tokens_verify_with_the_key_of_their_kid(signing_key, algorithm):
+    config = Settings()
+    keyring = keyring_module.load_keyring(SigningSettings(algorithm=algorithm, keys=(
+        signing_key('retired', algorithm=algorithm, public_only=True),
+        signing_key('current', algorithm=algorithm),
+    )))
+    token = generate_jwt_token(payload=CLAIMS, secret=None, config=config, signing_key=keyring.get_signing_key())
+    assert jwt.get_unverified_header(token)['kid'] == 'current'
+    assert verify_token(token=token, secret=None, config=config, keyring=keyring)['id'] == 1
+
+
+def test_tokens_of_unknown_or_forged_kids_rejected(signing_key):
+    config = Settings()
+    keyring = keyring_module.load_keyring(SigningSettings(algorithm='RS256', keys=(signing_key('current'),)))
+    other = keyring_module.load_keyring(SigningSettings(algorithm='RS256', keys=(signing_key('other'),)))
+    forger = keyring_module.load_keyring(SigningSettings(algorithm='RS256', keys=(signing_key('current'),)))
+
+    unknown = generate_jwt_token(payload=CLAIMS, secret=None, config=config, signing_key=other.get_signing_key())
+    forged = generate_jwt_token(payload=CLAIMS, secret=None, config=config, signing_key=forger.get_signing_key())
+    shared_secret = generate_jwt_token(payload=CLAIMS, secret=config.app.access_token_secret or 'secret', config=config)
+    for token in (unknown, forged, shared_secret):
+        with pytest.raises(HTTPException) as err:
+            verify_token(token=token, secret=None, config=config, keyring=keyring)
+        assert err.value.status_code == 401
+
+
+@pytest.mark.parametrize('algorithm, kids', [('HS256', ['a']), ('EdDSA', ['a']), ('RS256', ['a', 'a'])])
+def test_invalid_signing_settings_rejected(signing_key, algorithm, kids):
+    with pytest.raises(ValueError):
+        keyring_module.load_keyring(SigningSettings(algorithm=algorithm, keys=tuple(signing_key(kid) for kid in kids)))
+
+
+def test_keyring_reloads_only_when_the_signing_settings_change(signing_key, monkeypatch):
+    monkeypatch.setattr(keyring_module, '_keyring', None)
+    monkeypatch.setattr(keyring_module, '_keyring_settings', None)
+    settings = SigningSettings(algorithm='RS256', keys=(signing_key('current'),))
+    keyring = keyring_module.get_keyring(settings)
+    # An equal section of a reloaded snapshot keeps the parsed keys
+    assert keyring_module.get_keyring(dataclasses.replace(settings)) is keyring
+
+    rotated = dataclasses.replace(settings, keys=settings.keys + (signing_key('next', active_from='2099-01-01'),))
+    assert set(keyring_module.get_keyring(rotated).keys) == {'current', 'next'}
+    assert keyring_module.get_keyring(SigningSettings()) is None